@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for TF2: The Text Adventure's hot paths:
+  * combat    - fights/sec through game.Combat's turn logic, output stubbed
+  * render    - cost of one location screen (clear_screen, print_line,
+                print_slow, flush) per text mode, with the number of write
+                syscalls it makes; typing delays are skipped
+  * traversal - map steps/sec through main()'s loop, answered by a PromptedInput
+  * startup   - milliseconds a fresh interpreter takes to import game, to
+                finish a first fight through simulate, and to get a first
+                result from a spawned worker; plus a cold content bundle build
+
+Every run is appended to a JSON-lines history file. --compare checks the new
+numbers against the median of the last few runs at the same --scale and
+exits with status 1 if any of them got worse by more than --threshold
+percent. Medians keep one noisy run from failing (or hiding) a change.
+
+Usage:
+    python bench.py
+    python bench.py --compare --threshold 10
+    python bench.py --only combat --no-save
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import game
+from game import Renderer, Combat, Enemy
+from engine import build_player
+from rolls import RollService
+
+HISTORY = 'bench_history.jsonl'
+ROLL_BLOCK = 4096
+
+# better: 'higher' or 'lower'
+Metric = namedtuple('Metric', ['name', 'unit', 'better'])
+
+METRICS = [Metric('combat.fights_per_sec', 'fights/s', 'higher'),
+           Metric('combat.turns_per_sec', 'turns/s', 'higher')]
+for mode in Renderer.MODES:
+    METRICS += [Metric(f"render.{mode}.us_per_screen", 'us', 'lower'),
+                Metric(f"render.{mode}.syscalls_per_screen", 'writes', 'lower')]
+METRICS += [Metric('traversal.steps_per_sec', 'steps/s', 'higher'),
+            Metric('traversal.runs_per_sec', 'runs/s', 'higher'),
+            Metric('startup.import_ms', 'ms', 'lower'),
+            Metric('startup.first_fight_ms', 'ms', 'lower'),
+            Metric('startup.worker_ms', 'ms', 'lower'),
+            Metric('startup.bundle_build_ms', 'ms', 'lower')]
+METRIC_INDEX = {metric.name: metric for metric in METRICS}
+
+SCREEN_TEXT = game.MAP_DUSTBOWL['side_route']['description']
+
+
+# ### Harness ###
+
+class NullOutput:
+    """A stream that throws everything away."""
+    def write(self, text):
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+class SyscallCounter:
+    """Unbuffered stream to os.devnull: every write() is exactly one write syscall, and is counted."""
+    def __init__(self):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return os.write(self.fd, text.encode())
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        os.close(self.fd)
+
+class PromptedInput:
+    """
+    Input source for game.set_input that answers by prompt: answers maps a
+    prompt fragment to the list of replies for it, used in turn; the last
+    reply then repeats. Unlike a line script it never falls out of step
+    when a fight runs longer or shorter than expected.
+    """
+    def __init__(self, answers):
+        self.answers = answers
+        self.turns = dict.fromkeys(answers, 0)
+
+    def read(self, prompt):
+        for fragment, replies in self.answers.items():
+            if fragment in prompt:
+                i = self.turns[fragment]
+                self.turns[fragment] = i + 1
+                return replies[min(i, len(replies) - 1)]
+        raise EOFError(f"No scripted answer for {prompt.strip()!r}")
+
+def timed(run, repeat):
+    """Best wall time of repeat calls to run(), and run()'s last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# ### Benchmarks ###
+
+def bench_combat(scale=1.0, repeat=5):
+    """Fights through the interactive Combat class, always attacking with the first weapon."""
+    fights = int(5000 * scale)
+    matchups = [('soldier', ['rocket_launcher', 'shotgun', 'shovel'], 'heavy_bot'),
+                ('sniper', ['sniper_rifle', 'jarate', 'kukri'], 'sentry_gun_boss'),
+                ('scout', ['scattergun', 'pistol', 'bat'], 'soldier_bot')]
+    previous = game.set_renderer(Renderer('instant', NullOutput()))
+    previous_input = game.set_input(PromptedInput({'action': ['1'], 'weapon': ['1']}))
+    try:
+        def run():
+            rng = RollService('bench-combat', block=ROLL_BLOCK)
+            turns = 0
+            for i in range(fights):
+                class_key, loadout, enemy_key = matchups[i % len(matchups)]
+                combat = Combat(build_player(class_key, loadout), Enemy(enemy_key), rng)
+                combat.start()
+                turns += combat.turn
+            return turns
+        seconds, turns = timed(run, repeat)
+    finally:
+        game.set_input(previous_input)
+        game.set_renderer(previous)
+    return {'combat.fights_per_sec': fights / seconds, 'combat.turns_per_sec': turns / seconds}
+
+def render_screen():
+    """What main() draws for one location with three options."""
+    game.clear_screen()
+    game.print_line("----------------------------------------")
+    game.print_slow(SCREEN_TEXT)
+    game.print_line("\nWhat do you do?")
+    for i in range(1, 4):
+        game.print_line(f"  {i}. Option number {i}.")
+    game.RENDERER.flush() # get_input flushes before prompting
+
+def bench_render(scale=1.0, repeat=5):
+    results = {}
+    for mode in Renderer.MODES:
+        screens = int((200 if mode == 'typewriter' else 20000) * scale) or 1
+        counter = SyscallCounter()
+        previous = game.set_renderer(Renderer(mode, counter, sleep=lambda seconds: None))
+        try:
+            def run():
+                counter.writes = 0
+                for _ in range(screens):
+                    render_screen()
+                return counter.writes
+            seconds, writes = timed(run, repeat)
+        finally:
+            game.set_renderer(previous)
+            counter.close()
+        results[f"render.{mode}.us_per_screen"] = seconds / screens * 1e6
+        results[f"render.{mode}.syscalls_per_screen"] = writes / screens
+    return results
+
+def bench_traversal(scale=1.0, repeat=5):
+    """Full runs of main(): Soldier, first weapons, side route, then always the first option."""
+    runs = int(1000 * scale) or 1
+    previous = game.set_renderer(Renderer('instant', NullOutput()))
+    previous_rolls = game.set_rolls(RollService('bench-traversal', block=ROLL_BLOCK))
+    previous_input = game.INPUT
+    try:
+        def run():
+            steps = 0
+            for _ in range(runs):
+                game.set_input(PromptedInput({'Enter a number': ['2', '1'], 'choice': ['2', '2', '1'],
+                                              'action': ['1'], 'weapon': ['1']}))
+                steps += game.main().steps
+            return steps
+        seconds, steps = timed(run, repeat)
+    finally:
+        game.set_input(previous_input)
+        game.set_rolls(previous_rolls)
+        game.set_renderer(previous)
+    return {'traversal.steps_per_sec': steps / seconds, 'traversal.runs_per_sec': runs / seconds}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STARTUP_TASK = ('soldier', ('rocket_launcher', 'shotgun', 'shovel'), 'heavy_bot', 0, 1, 'bench', 'greedy', 0, 100)
+
+# Prints the seconds from creating a spawn-context pool to its first result.
+# Run with -c, so the worker doesn't import the parent's main module as well.
+WORKER_CODE = f"""
+import multiprocessing, time, simulate
+start = time.perf_counter()
+with multiprocessing.get_context('spawn').Pool(1) as pool:
+    pool.apply(simulate.run_task, ({STARTUP_TASK!r},))
+print(time.perf_counter() - start)
+"""
+
+def fresh_interpreter(code):
+    """Wall time of a new interpreter running code, and what it printed."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=HERE, check=True).stdout
+    return time.perf_counter() - start, out
+
+def bench_startup(scale=1.0, repeat=5):
+    """Fresh processes, so every import and lazy table load counts; the interpreter's own start is taken off."""
+    samples = max(repeat, int(10 * scale))
+    fastest = lambda code: min(fresh_interpreter(code)[0] for _ in range(samples))
+    interpreter = fastest('pass')
+    worker = min(float(fresh_interpreter(WORKER_CODE)[1]) for _ in range(samples))
+    build, _ = timed(game.build_tables, repeat)
+    return {'startup.import_ms': (fastest('import game') - interpreter) * 1e3,
+            'startup.first_fight_ms': (fastest(f"import simulate; simulate.run_task({STARTUP_TASK!r})") - interpreter) * 1e3,
+            'startup.worker_ms': worker * 1e3,
+            'startup.bundle_build_ms': build * 1e3}
+
+BENCHMARKS = {'combat': bench_combat, 'render': bench_render, 'traversal': bench_traversal, 'startup': bench_startup}
+
+
+# ### History ###
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_history(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+def baseline(history, scale, window):
+    """Median of each metric over the last window runs made at scale. Returns (medians, runs used)."""
+    runs = [record for record in history if record.get('scale') == scale][-window:]
+    names = {name for record in runs for name in record['results']}
+    medians = {name: statistics.median(record['results'][name] for record in runs if name in record['results'])
+               for name in names}
+    return medians, runs
+
+def compare(baseline, results, threshold):
+    """Returns (report lines, names of metrics that regressed by more than threshold percent)."""
+    lines, regressions = [], []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old:
+            lines.append(f"  {name:<38} {value:>12.2f}  (new)")
+            continue
+        change = (value - old) / old * 100
+        worse = -change if METRIC_INDEX[name].better == 'higher' else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        lines.append(f"  {name:<38} {old:>12.2f} -> {value:>12.2f}  {change:+6.1f}%{flag}")
+    return lines, regressions
+
+
+# ### Main ###
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark combat, rendering, map traversal and startup.")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply the work done by each benchmark")
+    parser.add_argument('--repeat', type=int, default=5, help="rounds per benchmark; the fastest counts")
+    parser.add_argument('--history', default=HISTORY, help="JSON-lines file the results are appended to")
+    parser.add_argument('--no-save', action='store_true', help="don't append this run to the history")
+    parser.add_argument('--compare', action='store_true', help="compare with recent runs; exit 1 on a regression")
+    parser.add_argument('--window', type=int, default=5, help="how many recent runs --compare takes the median of")
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent a metric may get worse before it fails")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        sys.stderr.write(f"Running {name}...\n")
+        results.update(BENCHMARKS[name](args.scale, args.repeat))
+    for name, value in results.items():
+        print(f"{name:<38} {value:>12.2f} {METRIC_INDEX[name].unit}")
+
+    history = load_history(args.history)
+    regressions = []
+    if args.compare:
+        medians, runs = baseline(history, args.scale, args.window)
+        if runs:
+            commits = ", ".join(dict.fromkeys(record.get('commit') or '?' for record in runs))
+            print(f"\nCompared with the median of {len(runs)} run(s) ({commits}):")
+            lines, regressions = compare(medians, results, args.threshold)
+            print("\n".join(lines))
+        else:
+            print(f"\nNothing to compare with yet: {args.history} has no runs at --scale {args.scale:g}.")
+
+    if not args.no_save:
+        append_history(args.history, {'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                                      'commit': git_commit(), 'python': platform.python_version(),
+                                      'scale': args.scale, 'results': results})
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled content bundle for TF2: The Text Adventure.
+The tables game.py derives from content.py (enemy AI, ammo slots, compiled
+maps) are built and validated once, then written to a bundle file next to
+the .pyc files, one marshalled blob per table entry:
+
+    bundle = Bundle(game.build_tables)
+    ai = bundle.load('enemy_ai', 'heavy_bot')
+
+Opening the bundle only reads the file; each entry is decoded when it is
+first loaded, so a process pays for the maps and classes it uses and no
+more. marshal (the format of .pyc files) needs no import and is faster
+than pickle, but only takes plain data: entries are tuples, lists, dicts,
+strings, bytes and numbers, and game.py turns them back into its own types.
+
+Like a .pyc, the bundle is stamped with the size and modification time of
+the source files it was built from (SOURCES), and is rebuilt, and so
+revalidated, whenever one of them changes. A bundle that can't be written
+is simply rebuilt in memory next time.
+
+Run this file to rebuild the bundle and time it:
+    python bundle.py
+"""
+
+import marshal
+import os
+import sys
+import time
+
+VERSION = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCES = ('content.py', 'game.py', 'mapgraph.py') # Files the tables are built from
+PATH = os.path.join(HERE, '__pycache__', f"content.{sys.implementation.cache_tag}.bundle")
+
+
+class Bundle:
+    """
+    Derived tables, kept as marshalled blobs by (table, key). build() returns
+    {table: {key: value}} for every table, and raises if the content is
+    broken; it runs only when the bundle file is missing or stale.
+    """
+    def __init__(self, build, path=PATH, sources=SOURCES):
+        self.build = build
+        self.path = path
+        self.sources = [os.path.join(HERE, source) for source in sources]
+        self.blobs = None # Read on first load
+
+    def stamp(self):
+        """The bundle format, the Python version, and every source file's size and modification time."""
+        return (VERSION, sys.version) + tuple((stat.st_size, stat.st_mtime_ns) for stat in map(os.stat, self.sources))
+
+    def open(self):
+        """Reads the bundle file, or builds the tables and writes it if it is missing or stale."""
+        stamp = self.stamp()
+        try:
+            with open(self.path, 'rb') as f:
+                saved, blobs = marshal.load(f)
+            if saved == stamp:
+                self.blobs = blobs
+                return
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        self.blobs = {(table, key): marshal.dumps(value)
+                      for table, values in self.build().items() for key, value in values.items()}
+        self.write(stamp)
+
+    def write(self, stamp):
+        # Written whole and renamed into place, so workers starting together never read half a bundle
+        temp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp, 'wb') as f:
+                marshal.dump((stamp, self.blobs), f)
+            os.replace(temp, self.path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def load(self, table, key):
+        """A fresh copy of one table entry. Raises KeyError if the bundle doesn't have it."""
+        if self.blobs is None:
+            self.open()
+        return marshal.loads(self.blobs[table, key])
+
+    def size(self):
+        """Bytes of marshalled entries per table."""
+        if self.blobs is None:
+            self.open()
+        sizes = {}
+        for (table, _), blob in self.blobs.items():
+            sizes[table] = sizes.get(table, 0) + len(blob)
+        return sizes
+
+
+# ### Main ###
+
+def main():
+    import game
+    start = time.perf_counter()
+    tables = game.build_tables()
+    built = time.perf_counter() - start
+    if os.path.exists(PATH):
+        os.remove(PATH)
+    Bundle(game.build_tables).open()
+    print(f"Built and validated {sum(len(values) for values in tables.values())} entries in {built * 1e3:.2f} ms, "
+          f"wrote {PATH} ({os.path.getsize(PATH)} bytes)")
+
+    start = time.perf_counter()
+    bundle = Bundle(game.build_tables)
+    bundle.open()
+    opened = time.perf_counter() - start
+    print(f"Opened it in {opened * 1e3:.3f} ms")
+    for table, values in tables.items():
+        start = time.perf_counter()
+        for key in values:
+            bundle.load(table, key)
+        print(f"  {table:<10} {len(values):>3} entries, {bundle.size()[table]:>6} bytes, "
+              f"loaded in {(time.perf_counter() - start) * 1e3:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Content for TF2: The Text Adventure: classes, weapons, enemies and maps as
+plain data. Nothing here runs any game code, so it can grow without
+slowing down the rules around it.
+
+game.py re-exports every name here and builds the tables derived from it
+(weapon ids, enemy AI, compiled maps) lazily, through the precompiled
+bundle in bundle.py. Edits to this file are picked up on the next start:
+the bundle is rebuilt, and validated, whenever it changes.
+"""
+
+
+# ### Classes and Weapons ###
+
+# Weapons: 'damage' (min, max), 'accuracy' (0-100), 'desc' (flavor text)
+# 'utility': True marks non-damaging items for special combat handling
+# 'effects': what a utility does when used in combat, applied in order:
+#     'heal' HP, 'buff' for the next attack, 'dodge' the next enemy attack,
+#     'debuff_turns' of Jarate on the enemy. Utilities without effects can't be used in combat.
+# 'flee_bonus': added to the flee chance while the item is equipped
+# 'splash': share of a hit's damage that also hits every other enemy in a squad fight (explosives)
+# 'clip': marks a gun, which fires one shot of its slot's ammo per attack (see game.AMMO_SLOTS).
+#     The number is the shots it holds before a reload, or 0 for guns that feed straight
+#     from the reserve and never reload. Weapons without a clip never run out.
+WEAPONS = {
+    # --- Universal ---
+    'shotgun': {'name': 'Shotgun', 'damage': (40, 70), 'accuracy': 85, 'desc': 'Reliable crowd control.', 'clip': 6},
+    'pistol': {'name': 'Pistol', 'damage': (10, 20), 'accuracy': 90, 'desc': 'A trusty sidearm.', 'clip': 12},
+
+    # --- Scout ---
+    'scattergun': {'name': 'Scattergun', 'damage': (60, 100), 'accuracy': 85, 'desc': 'High-damage at close range.', 'clip': 6},
+    'force_a_nature': {'name': 'Force-A-Nature', 'damage': (70, 110), 'accuracy': 80, 'desc': 'Packs a punch, and a knockback.', 'clip': 2},
+    'bonk': {'name': 'Bonk! Atomic Punch', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Grants 100% dodge for one turn.', 'utility': True, 'effects': {'dodge': True}},
+    'bat': {'name': 'Bat', 'damage': (30, 40), 'accuracy': 95, 'desc': 'It\'s a bat.'},
+    'sandman': {'name': 'Sandman', 'damage': (25, 35), 'accuracy': 95, 'desc': 'Slower, but has a cool logo.'},
+
+    # --- Soldier ---
+    'rocket_launcher': {'name': 'Rocket Launcher', 'damage': (70, 110), 'accuracy': 80, 'desc': 'Deals Explosive damage.', 'splash': 0.5, 'clip': 4},
+    'direct_hit': {'name': 'Direct Hit', 'damage': (90, 125), 'accuracy': 70, 'desc': 'High-speed, high-damage rocket.', 'splash': 0.2, 'clip': 4},
+    'buff_banner': {'name': 'Buff Banner', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Next attack deals 2x damage.', 'utility': True, 'effects': {'buff': 'mini-crit'}},
+    'shovel': {'name': 'Shovel', 'damage': (55, 75), 'accuracy': 95, 'desc': 'For digging graves.'},
+    'equalizer': {'name': 'Equalizer', 'damage': (50, 70), 'accuracy': 95, 'desc': 'Deals more damage as you get hurt.'},
+
+    # --- Pyro ---
+    'flamethrower': {'name': 'Flamethrower', 'damage': (70, 100), 'accuracy': 90, 'desc': 'Deals Fire damage. Mphm!', 'clip': 0},
+    'backburner': {'name': 'Backburner', 'damage': (80, 110), 'accuracy': 90, 'desc': 'Guaranteed crits from behind.', 'clip': 0},
+    'flare_gun': {'name': 'Flare Gun', 'damage': (25, 35), 'accuracy': 85, 'desc': 'Lights \'em up from a distance.', 'clip': 1},
+    'fire_axe': {'name': 'Fire Axe', 'damage': (55, 75), 'accuracy': 95, 'desc': 'For chopping... things.'},
+    'axtinguisher': {'name': 'Axtinguisher', 'damage': (40, 50), 'accuracy': 95, 'desc': 'Crits burning targets.'},
+
+    # --- Demoman ---
+    'grenade_launcher': {'name': 'Grenade Launcher', 'damage': (80, 120), 'accuracy': 75, 'desc': 'Deals Explosive damage. Bouncy.', 'splash': 0.5, 'clip': 4},
+    'loch_n_load': {'name': 'Loch-n-Load', 'damage': (100, 130), 'accuracy': 70, 'desc': 'Fast-moving, direct-hit pills.', 'splash': 0.2, 'clip': 3},
+    'sticky_launcher': {'name': 'Stickybomb Launcher', 'damage': (70, 110), 'accuracy': 70, 'desc': 'Set traps and control areas.', 'splash': 0.6, 'clip': 8},
+    'chargin_targe': {'name': 'Chargin\' Targe', 'damage': (40, 50), 'accuracy': 90, 'desc': 'Grants passive resistances.'},
+    'bottle': {'name': 'Bottle', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Smash!' },
+    'eyelander': {'name': 'Eyelander', 'damage': (60, 80), 'accuracy': 95, 'desc': 'A haunted sword that demands heads.'},
+
+    # --- Heavy ---
+    'minigun': {'name': 'Minigun', 'damage': (100, 140), 'accuracy': 75, 'desc': 'Costs $400,000 to fire for 12 seconds.', 'clip': 0},
+    'natascha': {'name': 'Natascha', 'damage': (90, 130), 'accuracy': 80, 'desc': 'Slows enemies on hit.', 'clip': 0},
+    'sandvich': {'name': 'Sandvich', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 75 HP.', 'utility': True, 'effects': {'heal': 75}},
+    'fists': {'name': 'Fists', 'damage': (60, 80), 'accuracy': 95, 'desc': 'These are my weapons.'},
+    'kgb': {'name': 'K.G.B.', 'damage': (60, 80), 'accuracy': 95, 'desc': 'Killing Gloves of Boxing.'},
+
+    # --- Engineer ---
+    'frontier_justice': {'name': 'Frontier Justice', 'damage': (50, 80), 'accuracy': 85, 'desc': 'Crits based on Sentry kills.', 'clip': 3},
+    'wrench': {'name': 'Wrench', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Builds, repairs, and whacks.'},
+    'gunslinger': {'name': 'Gunslinger', 'damage': (40, 50), 'accuracy': 95, 'desc': 'Replaces Sentry with a Mini-Sentry.'},
+    'pda_build': {'name': 'Build PDA', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Builds Dispensers, Sentries, and more.', 'utility': True},
+    'pda_destroy': {'name': 'Destroy PDA', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Destroys your buildings.', 'utility': True},
+
+    # --- Medic ---
+    'syringe_gun': {'name': 'Syringe Gun', 'damage': (10, 20), 'accuracy': 85, 'desc': 'Fires a stream of needles.', 'clip': 10},
+    'blutsauger': {'name': 'Blutsauger', 'damage': (10, 20), 'accuracy': 85, 'desc': 'Heals you on-hit.', 'clip': 10},
+    'medigun': {'name': 'Medigun', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 50 HP in combat.', 'utility': True, 'effects': {'heal': 50}},
+    'kritzkrieg': {'name': 'Kritzkrieg', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 30 HP and grants 1.5x damage next turn.', 'utility': True, 'effects': {'heal': 30, 'buff': 'mini-crit'}},
+    'bonesaw': {'name': 'Bonesaw', 'damage': (55, 75), 'accuracy': 95, 'desc': 'The default melee.'},
+    'ubersaw': {'name': 'Ubersaw', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Grants Uber on-hit.'},
+
+    # --- Sniper ---
+    'sniper_rifle': {'name': 'Sniper Rifle', 'damage': (50, 150), 'accuracy': 70, 'desc': 'High-risk, high-reward. Aim for the head.', 'clip': 0},
+    'huntsman': {'name': 'Huntsman', 'damage': (40, 120), 'accuracy': 75, 'desc': 'A bow and arrow. Be a man.', 'clip': 0},
+    'smg': {'name': 'SMG', 'damage': (10, 25), 'accuracy': 85, 'desc': 'For close-quarters panic.', 'clip': 25},
+    'jarate': {'name': 'Jarate', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Enemy takes 1.5x damage next turn.', 'utility': True, 'effects': {'debuff_turns': 2}}, # Jarate lasts for this turn and next
+    'kukri': {'name': 'Kukri', 'damage': (55, 75), 'accuracy': 95, 'desc': 'A big knife.'},
+    'bushwacka': {'name': 'Bushwacka', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Crits when it would mini-crit.'},
+
+    # --- Spy ---
+    'revolver': {'name': 'Revolver', 'damage': (30, 50), 'accuracy': 90, 'desc': 'A very fancy sidearm.', 'clip': 6},
+    'ambassador': {'name': 'Ambassador', 'damage': (40, 60), 'accuracy': 80, 'desc': 'Rewards accuracy with headshots.', 'clip': 6},
+    'knife': {'name': 'Knife', 'damage': (35, 45), 'accuracy': 95, 'desc': 'For backstabbing. (Story-based)'},
+    'your_eternal_reward': {'name': 'Your Eternal Reward', 'damage': (35, 45), 'accuracy': 95, 'desc': 'Instantly disguise on a backstab.'},
+    'sapper': {'name': 'Sapper', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Disables and destroys enemy buildings. (Story-based)', 'utility': True},
+    'invis_watch': {'name': 'Invisibility Watch', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Grants a very high chance to flee combat.', 'utility': True, 'flee_bonus': 40},
+    'disguise_kit': {'name': 'Disguise Kit', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Blend in with the enemy. (Story-based)', 'utility': True},
+}
+
+# Defines the weapon *options* for each class slot
+WEAPON_CHOICES = {
+    'scout': {
+        'primary': ['scattergun', 'force_a_nature'],
+        'secondary': ['pistol', 'bonk'],
+        'melee': ['bat', 'sandman']
+    },
+    'soldier': {
+        'primary': ['rocket_launcher', 'direct_hit'],
+        'secondary': ['shotgun', 'buff_banner'],
+        'melee': ['shovel', 'equalizer']
+    },
+    'pyro': {
+        'primary': ['flamethrower', 'backburner'],
+        'secondary': ['shotgun', 'flare_gun'],
+        'melee': ['fire_axe', 'axtinguisher']
+    },
+    'demoman': {
+        'primary': ['grenade_launcher', 'loch_n_load'],
+        'secondary': ['sticky_launcher', 'chargin_targe'],
+        'melee': ['bottle', 'eyelander']
+    },
+    'heavy': {
+        'primary': ['minigun', 'natascha'],
+        'secondary': ['shotgun', 'sandvich'],
+        'melee': ['fists', 'kgb']
+    },
+    'engineer': {
+        'primary': ['shotgun', 'frontier_justice'],
+        'secondary': ['pistol'],
+        'melee': ['wrench', 'gunslinger'],
+        'pda': ['pda_build', 'pda_destroy'] # Purely cosmetic for loadout
+    },
+    'medic': {
+        'primary': ['syringe_gun', 'blutsauger'],
+        'secondary': ['medigun', 'kritzkrieg'],
+        'melee': ['bonesaw', 'ubersaw']
+    },
+    'sniper': {
+        'primary': ['sniper_rifle', 'huntsman'],
+        'secondary': ['smg', 'jarate'],
+        'melee': ['kukri', 'bushwacka']
+    },
+    'spy': {
+        'primary': ['revolver', 'ambassador'],
+        'melee': ['knife', 'your_eternal_reward'],
+        'pda': ['invis_watch', 'disguise_kit'] # Sapper is granted by default
+    },
+}
+
+# Slots are offered in this order by Player.equip_loadout
+LOADOUT_SLOTS = ['primary', 'secondary', 'melee', 'pda']
+
+# Classes define starting health, speed (for fleeing) and any 'items' always carried
+CLASSES = {
+    'scout': {'name': 'Scout', 'health': 125, 'speed': 133},
+    'soldier': {'name': 'Soldier', 'health': 200, 'speed': 80},
+    'pyro': {'name': 'Pyro', 'health': 175, 'speed': 100},
+    'demoman': {'name': 'Demoman', 'health': 175, 'speed': 93},
+    'heavy': {'name': 'Heavy', 'health': 300, 'speed': 77},
+    'engineer': {'name': 'Engineer', 'health': 125, 'speed': 100},
+    'medic': {'name': 'Medic', 'health': 150, 'speed': 107},
+    'sniper': {'name': 'Sniper', 'health': 125, 'speed': 100},
+    'spy': {'name': 'Spy', 'health': 125, 'speed': 107, 'items': ['sapper']}, # Sapper for story events
+}
+
+
+# ### Enemies ###
+
+# Enemies define their stats and attacks
+# Health values adjusted to compensate for higher player damage
+# 'speed' sets how often a bot acts in a squad fight (see game.TurnScheduler), on the same scale as CLASSES
+ENEMIES = {
+    'scout_bot': {'name': 'BLU Scout Bot', 'health': 100, 'damage': (10, 20), 'accuracy': 75, 'speed': 133, 'policy': 'skirmisher'},
+    'soldier_bot': {'name': 'BLU Soldier Bot', 'health': 180, 'damage': (20, 40), 'accuracy': 80, 'speed': 80, 'policy': 'hunter'},
+    'heavy_bot': {'name': 'BLU Heavy Bot', 'health': 300, 'damage': (30, 50), 'accuracy': 70, 'speed': 77, 'policy': 'tank'},
+    'sentry_gun_boss': {'name': 'BLU Sentry Nest', 'health': 400, 'damage': (25, 35), 'accuracy': 95, 'speed': 100, 'special': 'boss', 'policy': 'sentry'},
+    'sniper_bot': {'name': 'BLU Sniper Bot', 'health': 100, 'damage': (20, 60), 'accuracy': 65, 'speed': 100, 'policy': 'hunter'},
+}
+
+# What a bot can do on its turn. accuracy is added to the bot's own, damage
+# multiplies its damage range, heal is a share of max health (one heal per fight)
+# and retreat ends the fight with the bot leaving the way clear.
+ENEMY_MOVES = {
+    'attack': {'text': "{name} attacks you!"},
+    'focus': {'text': "{name} takes careful aim at you!", 'accuracy': 20},
+    'barrage': {'text': "{name} unleashes a rocket barrage!", 'accuracy': -20, 'damage': 1.5},
+    'heal': {'text': "{name} falls back and patches itself up!", 'heal': 0.3},
+    'retreat': {'text': "{name} is badly hurt and retreats!", 'retreat': True},
+}
+
+# Policies are rules tried in order; the first whose conditions all hold picks
+# the move, and 'attack' is the fallback. Conditions look at HP buckets
+# (0 = 25% or less ... 3 = over 75%) and status flags:
+#   own_hp / player_hp  - the rule applies at or below this bucket
+#   player_hp_min       - ... and with the player at or above this bucket
+#   soaked              - the bot is covered in Jarate
+#   buffed              - the player has a mini-crit ready
+# Heal rules only match while the bot still has its heal.
+ENEMY_POLICIES = {
+    'brawler': [],
+    'hunter': [('focus', {'player_hp': 0})], # Finish off a wounded player
+    'skirmisher': [('retreat', {'own_hp': 0, 'player_hp_min': 2}), ('focus', {'player_hp': 0})],
+    'tank': [('heal', {'own_hp': 0}), ('heal', {'own_hp': 1, 'soaked': True}), ('focus', {'player_hp': 0})],
+    'sentry': [('barrage', {'own_hp': 1})], # Boss phase below half health
+}
+
+
+# ### Maps ###
+
+MAP_DUSTBOWL = {
+    'start': {
+        'description': "You're at the RED spawn for Dustbowl, Stage 1. The first control point is just ahead, past a narrow hallway.",
+        'options': {
+            '1': ("Charge through the main hallway.", 'hallway'),
+            '2': ("Try the side route through the small building.", 'side_route'),
+        }
+    },
+    # --- Main Path ---
+    'hallway': {
+        'description': "You push into the main chokepoint. It's a meatgrinder! A BLU Soldier Bot spots you!",
+        'encounter': 'soldier_bot',
+        'on_win': 'hallway_clear',
+        'on_flee': 'start'
+    },
+    'hallway_clear': {
+        'description': "You clear the hallway. You can see the control point ahead. You spot a small health pack in the corner.",
+        'item': ('health', 25),
+        'options': {
+            '1': ("Push onto the control point.", 'point_a'),
+            '2': ("Fall back to spawn to regroup.", 'start') # Go back
+        }
+    },
+    
+    # --- Side Path ---
+    'side_route': {
+        'description': "You sneak into the side building. It's quiet... too quiet. You see a BLU Scout Bot zip past the exit.",
+        'options': {
+            '1': ("Ambush the Scout.", 'side_ambush'),
+            '2': ("Wait for him to leave.", 'side_wait'),
+            '3': ("Go back to the main hallway.", 'hallway')
+        }
+    },
+    'side_ambush': {
+        'description': "You jump out at the Scout Bot!",
+        'encounter': 'scout_bot',
+        'on_win': 'side_exit',
+        'on_flee': 'side_route'
+    },
+    'side_wait': {
+        'description': "You wait a moment. The coast seems clear. You emerge right next to the control point.",
+        'options': {
+            '1': ("Push onto the control point.", 'point_a')
+        }
+    },
+    'side_exit': {
+        'description': "You defeated the Scout. The path is clear and you emerge near the control point. You find an ammo pack.",
+        'item': ('ammo', 50),
+        'options': {
+            '1': ("Push onto the control point.", 'point_a')
+        }
+    },
+    
+    # --- The Point & Endings ---
+    'point_a': {
+        'description': "You're on the control point! But it's not undefended. A massive BLU Sentry Nest is firing at you, and a Heavy Bot is protecting it!",
+        'encounter': 'heavy_bot',
+        'on_win': 'point_a_sentry',
+        'on_flee': 'hallway' # Flee back to the choke
+    },
+    'point_a_sentry': {
+        'description': "The Heavy is down, but that Sentry is still active! It swivels and locks onto you!",
+        'encounter': 'sentry_gun_boss',
+        'on_win': 'ENDING_WIN',
+        'on_flee': 'hallway'
+    },
+    
+    # --- Game Endings ---
+    'GAME_OVER_LOSE': {
+        'ending': "You fought well, but the BLU team was too much. You collapse as the world fades to black...\n\n--- DEFEAT ---"
+    },
+    'ENDING_WIN': {
+        'ending': "You smash the Sentry Nest to pieces! The control point is yours! The Administrator is pleased.\n\n--- VICTORY ---"
+    },
+    'ENDING_WIN_SAPPER': {
+        'ending': "You deftly slap your Sapper onto the Sentry. It sputters, sparks, and dies in a pathetic heap. The point is yours!\n\n--- VICTORY (SPY) ---"
+    },
+    'ENDING_FLEE_FINAL': {
+        'description': "You decide this fight isn't for you. You run all the way back to spawn and lock the door.",
+        'ending': "You may have survived, but you failed the mission. Better luck next time, mercenary.\n\n--- COWARD'S ENDING ---"
+    }
+}
+
+
+# Options added on top of the map: location -> [(choice, text, target, classes)]
+# classes None means everyone; {class} in the text becomes the class name.
+EXTRA_OPTIONS = {
+    'start': [
+        ('3', "This is too much for me. I quit!", 'ENDING_FLEE_FINAL', None), # Add a "flee" option to the start
+        ('j', "({class}) Explosive jump over the side building.", 'side_exit', ['soldier', 'demoman']), # Shortcut!
+    ],
+    'point_a_sentry': [
+        ('s', "(Spy) Use your Sapper to disable the Sentry!", 'ENDING_WIN_SAPPER', ['spy']),
+    ],
+    'hallway': [
+        ('s', "(Spy) Use your Invis Watch to sneak past the Soldier.", 'hallway_clear', ['spy']), # Bypass fight
+    ],
+}
+
+# Every map's locations by name; game.MAPS compiles each one on first use
+MAP_DATA = {'dustbowl': MAP_DUSTBOWL}
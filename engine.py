@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Headless combat engine for TF2: The Text Adventure.
+Runs a Combat between a Player and an Enemy (or a squad of them, see
+HeadlessSquadCombat) with no stdin, print_slow or sleep. Actions come from a
+pluggable policy object, and every fight returns a FightResult instead of
+printing.
+"""
+
+import random
+from collections import namedtuple
+
+from game import (AMMO_SLOT_TABLES, NO_AMMO, WEAPONS, WEAPON_TABLE, Player, TurnScheduler, effect_table, encounter_enemies,
+                  enemy_move, melee_weapon, roll_attack, roll_enemy_attack, flee_chance, spend_ammo)
+
+# Policies return FLEE instead of a weapon to attempt an escape
+FLEE = 'flee'
+# A turn the player lost without acting (server input budget or timeout)
+HESITATE = 'hesitate'
+
+# outcome: 'won', 'dead', 'fled' or 'timeout' (max_turns reached)
+# enemy_hp: HP the enemy has left (summed over a squad)
+# shots: gun shots fired; reloads: turns spent reloading; dry: the player's guns left with no
+# shots at all, loaded or spare (the rest of the ammo is on the player: player.clips and player.ammo)
+FightResult = namedtuple('FightResult', ['outcome', 'turns', 'player_hp', 'enemy_hp', 'flee_attempts',
+                                         'shots', 'reloads', 'dry'])
+
+
+# ### Policies ###
+
+def expected_damage(weapon):
+    """Average damage per use of weapon, ignoring buffs and crits."""
+    return weapon['accuracy'] / 100 * (weapon['damage'][0] + weapon['damage'][1]) / 2
+
+def ready(fight):
+    """The fight's actions that can be used this turn: everything but guns with no shot loaded (reloading or dry)."""
+    player, slots = fight.player, fight.ammo_slots
+    return [weapon for weapon in fight.actions if slots[weapon['id']] == NO_AMMO
+            or (player.clips if WEAPON_TABLE.clip[weapon['id']] else player.ammo)[slots[weapon['id']]]]
+
+class GreedyPolicy:
+    """Always attacks with the weapon that has the best expected damage, among those ready to fire."""
+    def choose(self, fight):
+        return max(ready(fight) or fight.actions, key=expected_damage)
+
+class TacticalPolicy:
+    """
+    Greedy, but heals whenever the whole heal would count. Other utilities
+    cost a turn for less than a turn's damage, so it never uses them.
+    """
+    def uses(self, actions):
+        """
+        The actions this policy can ever pick: attacks from the best down to
+        the best that uses no ammo (each the fallback while the ones above
+        it reload or run dry), and any heals.
+        """
+        attacks = []
+        for weapon in sorted(actions, key=expected_damage, reverse=True):
+            attacks.append(weapon)
+            if 'clip' not in weapon:
+                break
+        return attacks + [weapon for weapon in actions if weapon.get('effects', {}).get('heal') and weapon not in attacks]
+
+    def choose(self, fight):
+        player = fight.player
+        missing = player.max_health - player.current_health
+        for weapon in fight.actions:
+            heal = weapon.get('effects', {}).get('heal')
+            if heal and missing >= heal:
+                return weapon
+        return max(ready(fight) or fight.actions, key=expected_damage)
+
+class CyclePolicy:
+    """Repeats a fixed sequence of weapon keys (or FLEE), one per turn."""
+    def __init__(self, actions):
+        self.actions = [a if a == FLEE else WEAPONS[a] for a in actions]
+
+    def choose(self, fight):
+        return self.actions[fight.turn % len(self.actions)] # fight.turn counts finished turns
+
+class RandomPolicy:
+    """Picks a random usable weapon each turn, fleeing with flee_rate percent chance."""
+    def __init__(self, rng=random, flee_rate=0):
+        self.rng = rng
+        self.flee_rate = flee_rate
+
+    def choose(self, fight):
+        if self.flee_rate and self.rng.randint(1, 100) <= self.flee_rate:
+            return FLEE
+        return self.rng.choice(fight.actions)
+
+class FleeWhenLowPolicy:
+    """Wraps another policy, fleeing whenever HP drops below threshold percent."""
+    def __init__(self, base, threshold=25):
+        self.base = base
+        self.threshold = threshold
+
+    def choose(self, fight):
+        player = fight.player
+        if player.current_health * 100 < player.max_health * self.threshold:
+            return FLEE
+        return self.base.choose(fight)
+
+
+# ### Headless Combat ###
+
+class HeadlessCombat:
+    """
+    Resolves a fight with the same rules as game.Combat, without any I/O.
+    If log is a list, one event tuple per roll is appended to it.
+    """
+    def __init__(self, player, enemy, policy, rng=random, max_turns=500, log=None, turn=0, flee_attempts=0):
+        self.player = player
+        self.enemy = enemy
+        self.enemies = [enemy]
+        self.policy = policy
+        self.rng = rng
+        self.max_turns = max_turns
+        self.log = log
+        self.turn = turn # Non-zero when resuming a saved fight
+        self.flee_attempts = flee_attempts
+        self.shots = 0
+        self.reloads = 0
+        self.actions = player.combat_actions
+        self.effects = effect_table(self, self.actions)
+        self.ammo_slots = AMMO_SLOT_TABLES[player.class_key]
+        self.melee = melee_weapon(player)
+
+        # Reset any lingering combat buffs (a resumed fight keeps its own)
+        if turn == 0:
+            self.player.combat_buff = None
+            self.player.is_dodging = False
+            self.enemy.debuff_turns = 0
+            self.enemy.heals_left = self.enemy.ai.heals
+            self.player.reload_all()
+
+    def run(self):
+        """Plays the fight to the end and returns a FightResult."""
+        outcome = None
+        while outcome is None:
+            if self.turn >= self.max_turns:
+                outcome = 'timeout'
+                break
+            outcome = self.step(self.policy.choose(self))
+        return self.result(outcome)
+
+    def result(self, outcome):
+        return FightResult(outcome, self.turn, self.player.current_health, self.enemy.current_health, self.flee_attempts,
+                           self.shots, self.reloads, self.dry_guns())
+
+    def dry_guns(self):
+        """How many of the player's guns have no shots left, loaded or spare."""
+        player, slots = self.player, self.ammo_slots
+        return sum(1 for i in player.weapon_ids
+                   if slots[i] != NO_AMMO and not player.clips[slots[i]] + player.ammo[slots[i]])
+
+    def step(self, action):
+        """
+        Resolves one full turn (player, then enemy) for action.
+        Returns 'won', 'dead' or 'fled' once the fight is over, otherwise None.
+        """
+        self.turn += 1
+
+        # 1. Player Turn
+        self.player.is_dodging = False # Reset buffs that last one turn
+        if action == FLEE:
+            if self.player_flee():
+                return 'fled'
+        elif action == HESITATE:
+            self.emit('hesitate')
+        else:
+            self.player_attack(action)
+
+        if self.enemy.current_health <= 0:
+            return 'won'
+
+        # 2. Enemy Turn
+        if self.enemy_turn() == 'retreated':
+            return 'won' # The way is clear
+        if self.player.current_health <= 0:
+            return 'dead'
+        return None
+
+    def emit(self, *event):
+        if self.log is not None:
+            self.log.append(event)
+
+    def player_attack(self, weapon):
+        """
+        Uses a utility item or rolls a standard attack with weapon. Returns
+        (the weapon that attacked, damage dealt): the melee weapon if a gun
+        was out of ammo, and (None, None) if nothing attacked.
+        """
+        player, enemy = self.player, self.enemy
+
+        # --- Handle Utility Items ---
+        if weapon.get('utility'):
+            for handler, value in self.effects[weapon['id']]:
+                handler(value)
+            self.emit('utility', weapon['name'], player.current_health)
+            return None, None
+
+        # --- Spend Ammo ---
+        slot = self.ammo_slots[weapon['id']]
+        if slot != NO_AMMO:
+            shot = spend_ammo(player.clips, player.ammo, slot, weapon['id'])
+            if shot == 'reload':
+                self.reloads += 1
+                self.emit('reload', weapon['name'])
+                return None, None
+            if shot == 'empty':
+                self.emit('empty', weapon['name'], self.melee and self.melee['name'])
+                if self.melee is None:
+                    return None, None
+                weapon = self.melee
+            else:
+                self.shots += 1
+
+        # --- Handle Standard Attack ---
+        dmg, mini_crit, jarated, crit = roll_attack(weapon, player.combat_buff, enemy.debuff_turns > 0, self.rng)
+        if dmg is not None:
+            enemy.current_health = max(0, enemy.current_health - dmg)
+        self.emit('attack', weapon['name'], dmg, mini_crit, jarated, crit)
+
+        # Use up buff, even on miss
+        player.combat_buff = None
+        return weapon, dmg
+
+    # --- Utility effects (see game.WEAPONS 'effects') ---
+
+    def effect_heal(self, amount):
+        self.player.current_health = min(self.player.max_health, self.player.current_health + amount)
+
+    def effect_buff(self, buff):
+        self.player.combat_buff = buff
+
+    def effect_dodge(self, _):
+        self.player.is_dodging = True
+
+    def effect_debuff_turns(self, turns):
+        self.enemy.debuff_turns = turns
+
+    def player_flee(self):
+        """Rolls an escape attempt. Returns True on success."""
+        self.flee_attempts += 1
+        escaped = self.rng.randint(1, 100) <= flee_chance(self.player)
+        self.emit('flee', escaped)
+        return escaped
+
+    def enemy_turn(self):
+        """Dodge check, the enemy's move, Jarate countdown, then the move itself. Returns 'retreated' if it left."""
+        enemy = self.enemy
+        if self.player.is_dodging:
+            self.player.is_dodging = False # Dodge is used up
+            self.emit('dodge')
+            return None
+
+        move = enemy_move(enemy, self.player)
+
+        # Decrement debuff counter
+        if enemy.debuff_turns > 0:
+            enemy.debuff_turns -= 1
+
+        if move.kind == 'retreat':
+            self.emit('enemy_retreat', move.name)
+            return 'retreated'
+        if move.kind == 'heal':
+            enemy.heals_left -= 1
+            enemy.current_health = min(enemy.max_health, enemy.current_health + move.heal)
+            self.emit('enemy_heal', move.name, move.heal, enemy.current_health)
+            return None
+        dmg = roll_enemy_attack(enemy, self.rng, move)
+        if dmg is not None:
+            self.player.current_health = max(0, self.player.current_health - dmg)
+        self.emit('enemy_attack', dmg, move.name)
+        return None
+
+
+class HeadlessSquadCombat(HeadlessCombat):
+    """
+    A headless fight against several enemies, in initiative order like
+    game.SquadCombat. One step is the player's action and then every enemy
+    action until the player's next turn. The player attacks (or soaks)
+    target (an index into enemies), else the policy's target(fight) if it
+    has one, else the weakest enemy still standing. Events about enemy i
+    follow an ('enemy', i).
+    """
+    def __init__(self, player, enemies, policy, rng=random, max_turns=500, log=None):
+        super().__init__(player, enemies[0], policy, rng, max_turns, log)
+        self.enemies = list(enemies)
+        for enemy in self.enemies:
+            enemy.debuff_turns = 0
+            enemy.heals_left = enemy.ai.heals
+        self.scheduler = TurnScheduler([player.speed] + [enemy.speed for enemy in self.enemies])
+        self.scheduler.next() # The player opens
+
+    def living(self):
+        """Indexes of the enemies still in the fight."""
+        active = self.scheduler.active
+        return [i for i, enemy in enumerate(self.enemies) if enemy.current_health > 0 and active[i + 1]]
+
+    def result(self, outcome):
+        return FightResult(outcome, self.turn, self.player.current_health,
+                           sum(enemy.current_health for enemy in self.enemies), self.flee_attempts,
+                           self.shots, self.reloads, self.dry_guns())
+
+    def step(self, action, target=None):
+        self.turn += 1
+        self.player.is_dodging = False
+
+        if target is None:
+            choose = getattr(self.policy, 'target', None)
+            target = choose(self) if choose else min(self.living(), key=lambda i: self.enemies[i].current_health)
+        self.enemy = self.enemies[target]
+        self.emit('enemy', target)
+        if action == FLEE:
+            if self.player_flee():
+                return 'fled'
+        elif action == HESITATE:
+            self.emit('hesitate')
+        else:
+            fired, dmg = self.player_attack(action)
+            if dmg and fired.get('splash'):
+                for i in self.living():
+                    if i != target:
+                        other = self.enemies[i]
+                        other.current_health = max(0, other.current_health - int(dmg * fired['splash']))
+                        self.emit('enemy', i)
+                        self.emit('splash', other.current_health)
+        for i, enemy in enumerate(self.enemies, 1):
+            if enemy.current_health <= 0:
+                self.scheduler.remove(i)
+        if not self.living():
+            return 'won'
+
+        while True:
+            slot = self.scheduler.next()
+            if slot == 0:
+                return None
+            self.enemy = self.enemies[slot - 1]
+            self.emit('enemy', slot - 1)
+            if self.enemy_turn() == 'retreated':
+                self.scheduler.remove(slot)
+                if not self.living():
+                    return 'won'
+            elif self.player.current_health <= 0:
+                return 'dead'
+
+
+def build_player(class_key, weapon_keys, name="Bot"):
+    """Creates a Player with a class and loadout, skipping every prompt."""
+    player = Player(name)
+    player.set_class(class_key)
+    for key in weapon_keys:
+        player.equip(key)
+    return player
+
+def encounter_combat(player, encounter, policy, rng=random, **kwargs):
+    """A HeadlessCombat for a map encounter: one enemy key, or a tuple of keys for a squad."""
+    enemies = encounter_enemies(encounter)
+    if len(enemies) == 1:
+        return HeadlessCombat(player, enemies[0], policy, rng, **kwargs)
+    return HeadlessSquadCombat(player, enemies, policy, rng, **kwargs)
+
+def fight(player, enemy, policy=None, rng=random, max_turns=500):
+    """Convenience wrapper: runs one headless fight and returns its FightResult."""
+    return HeadlessCombat(player, enemy, policy or GreedyPolicy(), rng, max_turns).run()
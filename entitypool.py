@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed fighter pool for TF2: The Text Adventure.
+Large simulations keep millions of fighters alive at once, but only a few
+numbers per fighter ever change during a fight. An EntityPool stores those
+numbers in flat arrays (a few bytes per fighter) and hands out PooledEntity
+views that share one template Player or Enemy for everything else, so a
+view works anywhere a Player or Enemy does:
+
+    pool = EntityPool(1_000_000)
+    template = build_player('heavy', ['minigun', 'sandvich', 'fists'])
+    fighters = [pool.spawn(template) for _ in range(1000)]
+    fight(fighters[0], Enemy('heavy_bot'))
+"""
+
+from array import array
+from types import FunctionType
+
+from game import AMMO_SLOTS
+
+BUFFS = (None, 'mini-crit') # combat_buff values by stored code
+BUFF_CODES = {buff: code for code, buff in enumerate(BUFFS)}
+SLOTS = len(AMMO_SLOTS) # Ammo and clip entries per fighter
+
+
+class EntityPool:
+    """Fixed-capacity struct-of-arrays storage for per-fight state."""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.max_health = array('H', bytes(2 * capacity))
+        self.current_health = array('H', bytes(2 * capacity))
+        self.combat_buff = bytearray(capacity) # Code into BUFFS
+        self.debuff_turns = bytearray(capacity)
+        self.is_dodging = bytearray(capacity)
+        self.heals_left = bytearray(capacity) # Enemy AI heal charges
+        self.ammo = array('H', bytes(2 * SLOTS * capacity)) # SLOTS entries per fighter, like Player.ammo
+        self.clips = array('H', bytes(2 * SLOTS * capacity))
+        self.free = list(range(capacity - 1, -1, -1)) # Lowest slot is handed out first
+
+    def __len__(self):
+        """Number of slots in use."""
+        return self.capacity - len(self.free)
+
+    def spawn(self, template):
+        """Takes a free slot, copies template's health and ammo into it and returns its view."""
+        if not self.free:
+            raise MemoryError(f"EntityPool is full ({self.capacity} slots)")
+        slot = self.free.pop()
+        self.max_health[slot] = template.max_health
+        self.current_health[slot] = template.current_health
+        self.combat_buff[slot] = self.debuff_turns[slot] = self.is_dodging[slot] = 0
+        self.heals_left[slot] = getattr(template, 'heals_left', 0)
+        start = slot * SLOTS
+        for name in ('ammo', 'clips'):
+            getattr(self, name)[start:start + SLOTS] = array('H', getattr(template, name, [0] * SLOTS))
+        return PooledEntity(self, slot, template)
+
+    def release(self, entity):
+        """Returns a view's slot to the pool. The view must not be used afterwards."""
+        self.free.append(entity.slot)
+
+
+def pooled_field(name, load=None, store=None):
+    """A property that reads and writes one of the pool's arrays at the view's slot."""
+    def get(self):
+        value = getattr(self.pool, name)[self.slot]
+        return load(value) if load else value
+    def set(self, value):
+        getattr(self.pool, name)[self.slot] = store(value) if store else value
+    return property(get, set)
+
+def pooled_slots(name):
+    """A property giving the view's SLOTS entries of one of the pool's ammo arrays, as a writable memoryview."""
+    def get(self):
+        start = self.slot * SLOTS
+        return memoryview(getattr(self.pool, name))[start:start + SLOTS]
+    def set(self, values):
+        start = self.slot * SLOTS
+        getattr(self.pool, name)[start:start + SLOTS] = array('H', values)
+    return property(get, set)
+
+
+class PooledEntity:
+    """
+    A fighter whose changing state lives in an EntityPool. Every other
+    attribute (name, weapons, damage, speed, ...) comes from its template.
+    The template's methods run on the view, so reload_all() fills the
+    view's clips rather than the template's.
+    """
+    __slots__ = ('pool', 'slot', 'template')
+
+    def __init__(self, pool, slot, template):
+        self.pool = pool
+        self.slot = slot
+        self.template = template
+
+    current_health = pooled_field('current_health', store=lambda hp: max(hp, 0))
+    max_health = pooled_field('max_health')
+    combat_buff = pooled_field('combat_buff', BUFFS.__getitem__, BUFF_CODES.__getitem__)
+    debuff_turns = pooled_field('debuff_turns')
+    is_dodging = pooled_field('is_dodging', bool, int)
+    heals_left = pooled_field('heals_left')
+    ammo = pooled_slots('ammo')
+    clips = pooled_slots('clips')
+
+    def __getattr__(self, name):
+        method = getattr(type(self.template), name, None)
+        if isinstance(method, FunctionType):
+            return method.__get__(self)
+        return getattr(self.template, name)
+
+    def is_alive(self):
+        return self.current_health > 0
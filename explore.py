@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Story-path explorer for TF2: The Text Adventure.
+Walks a compiled map the way main() plays it, for every class and loadout:
+endings stop the run, encounters are fights (their options are never
+shown), and every other location offers its options plus the class's
+extra ones (Spy sapper/invis, Soldier/Demoman jump).
+
+Fights are chance nodes weighted by win/lose/flee odds for the loadout, so
+flee loops (hallway -> start -> hallway ...) are settled exactly instead of
+being walked forever. The map is solved one strongly connected component
+at a time, sinks first, so every shared subtree is solved once and reused
+by every route that leads into it.
+
+Each fight is scored from full health; HP carried between fights is not
+modelled here (see propagate.py).
+
+Usage:
+    python explore.py                          # ending odds for every class and loadout
+    python explore.py --class spy --routes     # every route for one class
+    python explore.py --exact --flee-value 0.5 # odds from solver.py instead of Monte Carlo
+"""
+
+from collections import namedtuple
+
+from game import CLASSES, CLASS_OPTIONS, DUSTBOWL
+from engine import build_player, encounter_combat
+from mapgraph import LOSE_KEY, strong_components
+from rolls import RollService
+from simulate import all_loadouts, make_policy, task_seed
+
+# kind: 'ending', 'fight' or 'choice'
+# fight targets: (win, lose, flee) node indices; choice targets: ((choice, text, node index), ...)
+Step = namedtuple('Step', ['kind', 'enemy', 'targets'])
+
+# Ending probabilities of one class and loadout under one way of choosing.
+# stalled is the chance of looping forever; choices maps location key -> option picked.
+Exploration = namedtuple('Exploration', ['endings', 'stalled', 'choices'])
+
+SWEEP_LIMIT = 100000
+TOLERANCE = 1e-12
+
+
+# ### Story Graph ###
+
+def story_graph(game_map, class_key):
+    """One Step per node of game_map, as main() plays it for class_key."""
+    extras = CLASS_OPTIONS[class_key]
+    lose = game_map.index[LOSE_KEY]
+    steps = []
+    for node in game_map.nodes:
+        if node.ending:
+            steps.append(Step('ending', None, ()))
+        elif node.encounter:
+            targets = (game_map.index[node.on_win], lose, game_map.index[node.on_flee])
+            steps.append(Step('fight', node.encounter, targets))
+        else:
+            options = dict(node.options)
+            options.update(extras.get(node.key, {}))
+            steps.append(Step('choice', None, tuple((choice, text, game_map.index[target])
+                                                    for choice, (text, target) in options.items())))
+    return steps
+
+def step_edges(steps):
+    return [step.targets if step.kind == 'fight' else tuple(t[2] for t in step.targets) for step in steps]
+
+
+# ### Fight Odds ###
+
+class MonteCarloOdds:
+    """(win, lose, flee) per fight (an enemy key or a squad) from engine runs, memoized. Timeouts count as losses."""
+    def __init__(self, fights=2000, seed=0, policy='greedy', flee_below=0):
+        self.fights = fights
+        self.seed = seed
+        self.policy = policy
+        self.flee_below = flee_below
+        self.cache = {}
+
+    def __call__(self, class_key, loadout, enemy_key):
+        key = (class_key, tuple(loadout), enemy_key)
+        if key not in self.cache:
+            rng = RollService(task_seed(self.seed, class_key, loadout, enemy_key, 'explore'), block=4096)
+            policy = make_policy(self.policy, rng, self.flee_below)
+            counts = {'won': 0, 'dead': 0, 'fled': 0, 'timeout': 0}
+            for _ in range(self.fights):
+                result = encounter_combat(build_player(class_key, loadout), enemy_key, policy, rng).run()
+                counts[result.outcome] += 1
+            self.cache[key] = (counts['won'] / self.fights, (counts['dead'] + counts['timeout']) / self.fights,
+                               counts['fled'] / self.fights)
+        return self.cache[key]
+
+class ExactOdds:
+    """(win, lose, flee) per fight from solver.py's optimal play (needs NumPy), memoized. One-on-one fights only."""
+    def __init__(self, flee_value=0.0):
+        import solver # Only this mode needs NumPy
+        self.solver = solver
+        self.flee_value = flee_value
+        self.cache = {}
+
+    def __call__(self, class_key, loadout, enemy_key):
+        key = (class_key, tuple(loadout), enemy_key)
+        if key not in self.cache:
+            if not isinstance(enemy_key, str):
+                raise ValueError(f"exact odds cover one-on-one fights only, not the squad {enemy_key}")
+            player = build_player(class_key, loadout)
+            self.cache[key] = tuple(self.solver.solve(player, enemy_key, self.flee_value).outcome())
+        return self.cache[key]
+
+
+# ### Exploration ###
+
+def explore(game_map, class_key, loadout, odds, choose='best', win_endings=None):
+    """
+    Ending distribution for one class and loadout. choose='best' picks the
+    option with the highest chance of a win ending at every location;
+    choose='random' picks uniformly, like a player who doesn't know the map.
+    """
+    steps = story_graph(game_map, class_key)
+    endings = game_map.endings
+    column = {node: j for j, node in enumerate(endings)}
+    win_endings = win_endings or [key for key in (game_map.nodes[n].key for n in endings) if 'WIN' in key]
+    win_columns = [column[game_map.index[key]] for key in win_endings]
+    lose_column = column[game_map.index[LOSE_KEY]]
+    size = len(endings)
+    fight_odds = {step.enemy: odds(class_key, loadout, step.enemy) for step in steps if step.kind == 'fight'}
+
+    values = [[0.0] * size for _ in steps]
+    picked = {}
+    for node in endings:
+        values[node][column[node]] = 1.0
+
+    def update(node):
+        """Recomputes one node's ending distribution from its successors. Returns the largest change."""
+        step = steps[node]
+        if step.kind == 'ending':
+            return 0.0
+        if step.kind == 'fight':
+            weighted = list(zip(fight_odds[step.enemy], step.targets))
+            new = [sum(p * values[t][j] for p, t in weighted) for j in range(size)]
+        elif choose == 'random':
+            share = 1 / len(step.targets)
+            new = [share * sum(values[t[2]][j] for t in step.targets) for j in range(size)]
+        else:
+            # Highest chance of winning, then lowest chance of losing
+            best = max(step.targets, key=lambda t: (sum(values[t[2]][j] for j in win_columns), -values[t[2]][lose_column]))
+            if len(step.targets) > 1:
+                picked[node] = best[0]
+            new = list(values[best[2]])
+        change = max(abs(a - b) for a, b in zip(new, values[node]))
+        values[node] = new
+        return change
+
+    # Sinks first: a component only depends on itself and components already solved
+    edges = step_edges(steps)
+    component, count = strong_components(edges)
+    members = [[] for _ in range(count)]
+    for node, c in enumerate(component):
+        members[c].append(node)
+    for group in members:
+        if len(group) == 1 and group[0] not in edges[group[0]]:
+            update(group[0]) # No cycle through this node: one pass is exact
+            continue
+        for _ in range(SWEEP_LIMIT):
+            if max(update(node) for node in group) < TOLERANCE:
+                break
+
+    start = values[game_map.start]
+    distribution = {game_map.nodes[node].key: start[column[node]] for node in endings}
+    choices = {game_map.nodes[node].key: choice for node, choice in picked.items()}
+    return Exploration(distribution, max(0.0, 1 - sum(start)), choices)
+
+def routes(game_map, class_key, loadout=None, odds=None, limit=1000):
+    """
+    Yields (steps, probability, end) for every route from the start that
+    doesn't revisit a location. steps is a list of (location key, label),
+    where label is the option picked or the fight result. end is an ending
+    key, or 'loop:<key>' where the route would come back around. probability
+    multiplies the fight results along the route (options count as certain).
+    """
+    graph = story_graph(game_map, class_key)
+    keys = [node.key for node in game_map.nodes]
+    stack = [(game_map.start, [], 1.0, frozenset())]
+    found = 0
+    while stack and found < limit:
+        node, path, probability, seen = stack.pop()
+        step = graph[node]
+        if step.kind == 'ending':
+            found += 1
+            yield path, probability, keys[node]
+            continue
+        if node in seen:
+            found += 1
+            yield path, probability, f"loop:{keys[node]}"
+            continue
+        seen = seen | {node}
+        if step.kind == 'fight':
+            fight_odds = odds(class_key, loadout, step.enemy) if odds else (1.0, 1.0, 1.0)
+            branches = [(label, target, p) for label, target, p in zip(('won', 'dead', 'fled'), step.targets, fight_odds) if p > 0]
+        else:
+            branches = [(choice, target, 1.0) for choice, _, target in step.targets]
+        for label, target, p in reversed(branches):
+            stack.append((target, path + [(keys[node], label)], probability * p, seen))
+
+
+# ### Reporting ###
+
+def format_table(rows, ending_keys):
+    lines = [f"{'Class':<9} {'Loadout':<48} " + " ".join(f"{key[:17]:>17}" for key in ending_keys) + f" {'Stall':>6}  Choices"]
+    for class_key, loadout, result in rows:
+        lines.append(f"{class_key:<9} {'/'.join(loadout):<48} "
+                     + " ".join(f"{result.endings[key] * 100:>16.1f}%" for key in ending_keys)
+                     + f" {result.stalled * 100:>5.1f}%  "
+                     + " ".join(f"{key}:{choice}" for key, choice in sorted(result.choices.items())))
+    return "\n".join(lines)
+
+def main(argv=None):
+    import argparse # Only the command line needs it; the optimizer (and so game) imports this module
+    parser = argparse.ArgumentParser(description="Ending odds for every route through the map.")
+    parser.add_argument('--class', dest='class_key', choices=list(CLASSES), help="only this class")
+    parser.add_argument('--loadout', nargs='+', help="only this loadout (weapon keys)")
+    parser.add_argument('--choose', choices=['best', 'random'], default='best', help="how options are picked")
+    parser.add_argument('--routes', action='store_true', help="list every route instead of the odds table")
+    parser.add_argument('--limit', type=int, default=200, help="most routes to list")
+    parser.add_argument('--fights', type=int, default=2000, help="Monte Carlo fights per matchup")
+    parser.add_argument('--seed', default='0')
+    parser.add_argument('--flee-below', type=int, default=0, help="flee fights below this HP percent")
+    parser.add_argument('--exact', action='store_true', help="exact fight odds from solver.py (needs numpy)")
+    parser.add_argument('--flee-value', type=float, default=0.0, help="with --exact: how much an escape is worth vs a win")
+    args = parser.parse_args(argv)
+
+    odds = ExactOdds(args.flee_value) if args.exact else MonteCarloOdds(args.fights, args.seed, flee_below=args.flee_below)
+    class_keys = [args.class_key] if args.class_key else list(CLASSES)
+
+    if args.routes:
+        for class_key in class_keys:
+            loadout = args.loadout or all_loadouts(class_key)[0]
+            print(f"\n{class_key} ({'/'.join(loadout)}):")
+            for steps, probability, end in routes(DUSTBOWL, class_key, loadout, odds, args.limit):
+                trail = " > ".join(f"{key}[{label}]" for key, label in steps)
+                print(f"  {probability * 100:6.2f}%  {trail} > {end}")
+        return
+
+    rows = []
+    for class_key in class_keys:
+        for loadout in ([args.loadout] if args.loadout else all_loadouts(class_key)):
+            rows.append((class_key, loadout, explore(DUSTBOWL, class_key, loadout, odds, args.choose)))
+    ending_keys = [DUSTBOWL.nodes[node].key for node in DUSTBOWL.endings]
+    print(format_table(rows, ending_keys))
+    unreached = [key for key in ending_keys if all(result.endings[key] == 0 for _, _, result in rows)]
+    if unreached:
+        print(f"\nNever reached by any class: {', '.join(unreached)}")
+
+if __name__ == "__main__":
+    main()
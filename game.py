@@ -4,23 +4,195 @@ TF2: The Text Adventure
 A text-based RPG in Python based on Team Fortress 2.
 """
 
+import heapq
 import random
+from array import array
+from collections import namedtuple
 import time
 import sys
 
+from bundle import Bundle
+from content import (WEAPONS, WEAPON_CHOICES, LOADOUT_SLOTS, CLASSES, ENEMIES, ENEMY_MOVES, ENEMY_POLICIES,
+                     MAP_DUSTBOWL, MAP_DATA, EXTRA_OPTIONS)
+from mapgraph import CompiledMap, MapError, compile_map, MapOverlay
+from metrics import CountingRolls, Exporter, Metrics, export_paths
+from rolls import RollService, ReplayRolls
+
+# ### Output ###
+
+class Renderer:
+    """
+    Buffers everything printed during a frame and writes it out in one go.
+    Modes:
+      'instant'    - no typing effect at all.
+      'typewriter' - print_slow types one character at a time (the classic look).
+      'budget'     - print_slow types in chunks, one write per frame tick, and
+                     never spends more than `budget` seconds on a single message.
+    The frame is flushed before every prompt and before any typing effect.
+    """
+    MODES = ('instant', 'typewriter', 'budget')
+
+    def __init__(self, mode='typewriter', stream=None, tick=1 / 30, budget=1.0, sleep=time.sleep):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown text mode '{mode}'. Choose from: {', '.join(self.MODES)}")
+        self.mode = mode
+        self.stream = stream # None means whatever sys.stdout is at write time
+        self.tick = tick
+        self.budget = budget
+        self.sleep = sleep
+        self.buffer = []
+
+    def out(self):
+        return self.stream or sys.stdout
+
+    def line(self, text=""):
+        """Queues a line of text for the current frame."""
+        self.buffer.append(f"{text}\n")
+
+    def say(self, text, speed=0.03):
+        """Shows a line with the typing effect for the current mode."""
+        if self.mode == 'instant' or speed <= 0 or not text:
+            self.line(text)
+            return
+
+        self.flush()
+        out = self.out()
+        chunk, delay = self.plan(text, speed)
+        for start in range(0, len(text), chunk):
+            out.write(text[start:start + chunk])
+            out.flush()
+            if METRICS is None:
+                self.sleep(delay)
+            else:
+                METRICS.timed_sleep(self.sleep, delay)
+        out.write("\n") # Newline after message
+
+    def plan(self, text, speed):
+        """Returns (characters per write, delay after each write) for the typing effect."""
+        if self.mode == 'typewriter':
+            return 1, speed
+        ticks = max(1, int(min(len(text) * speed, self.budget) / self.tick))
+        return -(-len(text) // ticks), self.tick # Ceiling division
+
+    def clear(self):
+        """Clears the screen. Logs and pipes just get a blank line instead of 50."""
+        self.buffer.append("\n" * 50 if self.out().isatty() else "\n")
+
+    def flush(self):
+        """Writes the current frame with a single write call."""
+        out = self.out()
+        if self.buffer:
+            out.write(''.join(self.buffer))
+            self.buffer.clear()
+        out.flush()
+
+RENDERER = Renderer()
+
+def set_renderer(renderer):
+    """Routes all game output through renderer. Returns the previous one."""
+    global RENDERER
+    previous, RENDERER = RENDERER, renderer
+    previous.flush()
+    return previous
+
+
+# ### Dice ###
+
+ROLLS = RollService() # Every roll of the interactive game comes from here
+
+def set_rolls(rolls):
+    """Makes rolls (a RollService or ReplayRolls) the game's source of dice. Returns the previous one."""
+    global ROLLS
+    previous, ROLLS = ROLLS, rolls
+    return previous
+
+
+# ### Instrumentation ###
+
+METRICS = None # A metrics.Metrics while instrumentation is on; every hook checks for None first
+
+def set_metrics(metrics):
+    """Turns instrumentation on with a metrics.Metrics, or off with None. Returns the previous one."""
+    global METRICS
+    previous, METRICS = METRICS, metrics
+    return previous
+
+
+# ### Loadout Hints ###
+
+ADVISOR = None # An optimizer.HintAdvisor (or LoadoutOptimizer) while loadout hints are on
+
+def set_advisor(advisor):
+    """Turns "recommended" loadout hints on with an optimizer.HintAdvisor or LoadoutOptimizer, or off with None. Returns the previous one."""
+    global ADVISOR
+    previous, ADVISOR = ADVISOR, advisor
+    return previous
+
+
+# ### Input ###
+
+class ConsoleInput:
+    """Reads answers from the keyboard. With log=[] every answer is also kept, to save as a script."""
+    def __init__(self, log=None):
+        self.log = log
+
+    def read(self, prompt):
+        answer = input(prompt)
+        if self.log is not None:
+            self.log.append(answer)
+        return answer
+
+class ScriptedInput:
+    """
+    Answers prompts from a list of lines, in order, and raises EOFError when
+    they run out. Each prompt and answer is echoed to the game's output so a
+    scripted run reads like a played one.
+    """
+    def __init__(self, lines, echo=True):
+        self.lines = list(lines)
+        self.pos = 0
+        self.echo = echo
+
+    @classmethod
+    def load(cls, path, echo=True):
+        with open(path) as f:
+            return cls(parse_script(f), echo)
+
+    def read(self, prompt):
+        if self.pos >= len(self.lines):
+            raise EOFError("The script ran out of answers")
+        answer = self.lines[self.pos]
+        self.pos += 1
+        if self.echo:
+            RENDERER.out().write(f"{prompt}{answer}\n")
+        return answer
+
+def parse_script(lines):
+    """Answers from a script file: one per line, skipping blank lines and # comments."""
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith('#')]
+
+INPUT = ConsoleInput() # Where get_input reads the player's answers
+
+def set_input(source):
+    """Makes source (anything with read(prompt)) the game's input. Returns the previous one."""
+    global INPUT
+    previous, INPUT = INPUT, source
+    return previous
+
+
 # ### Helper Functions ###
 
 def print_slow(text, speed=0.03):
     """Prints text one character at a time for a dramatic effect."""
-    for char in text:
-        sys.stdout.write(char)
-        sys.stdout.flush()
-        time.sleep(speed)
-    print() # Newline after message
+    RENDERER.say(text, speed)
+
+def print_line(text=""):
+    """Prints a line instantly, as part of the current frame."""
+    RENDERER.line(text)
 
 def clear_screen():
-    """Prints 50 newlines to simulate clearing the screen."""
-    print("\n" * 50)
+    """Clears the screen between locations."""
+    RENDERER.clear()
 
 def get_input(prompt):
     """
@@ -28,168 +200,203 @@ def get_input(prompt):
     Handles 'quit', 'stats', and 'inventory' as global commands.
     """
     while True:
-        choice = input(f"\n{prompt}\n> ").strip().lower()
+        RENDERER.flush() # Finish the frame before waiting on the player
+        if METRICS is not None:
+            METRICS.count('prompts')
+            asked = time.perf_counter()
+        choice = INPUT.read(f"\n{prompt}\n> ").strip().lower()
+        if METRICS is not None:
+            METRICS.time('input_wait', time.perf_counter() - asked)
         if choice == 'quit':
             print_slow("See you on the battlefield, mercenary.")
+            RENDERER.flush()
             sys.exit()
         return choice
 
 # ### Data Definitions (Classes, Weapons, Enemies) ###
+# The content itself (WEAPONS, CLASSES, ENEMIES, maps...) is plain data in
+# content.py; what's here is derived from it. Tables that are only needed
+# per class, enemy or map are LazyTables, loaded from the bundle on first use.
 
-# Weapons: 'damage' (min, max), 'accuracy' (0-100), 'desc' (flavor text)
-# 'utility': True marks non-damaging items for special combat handling
-WEAPONS = {
-    # --- Universal ---
-    'shotgun': {'name': 'Shotgun', 'damage': (40, 70), 'accuracy': 85, 'desc': 'Reliable crowd control.'},
-    'pistol': {'name': 'Pistol', 'damage': (10, 20), 'accuracy': 90, 'desc': 'A trusty sidearm.'},
-
-    # --- Scout ---
-    'scattergun': {'name': 'Scattergun', 'damage': (60, 100), 'accuracy': 85, 'desc': 'High-damage at close range.'},
-    'force_a_nature': {'name': 'Force-A-Nature', 'damage': (70, 110), 'accuracy': 80, 'desc': 'Packs a punch, and a knockback.'},
-    'bonk': {'name': 'Bonk! Atomic Punch', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Grants 100% dodge for one turn.', 'utility': True},
-    'bat': {'name': 'Bat', 'damage': (30, 40), 'accuracy': 95, 'desc': 'It\'s a bat.'},
-    'sandman': {'name': 'Sandman', 'damage': (25, 35), 'accuracy': 95, 'desc': 'Slower, but has a cool logo.'},
-
-    # --- Soldier ---
-    'rocket_launcher': {'name': 'Rocket Launcher', 'damage': (70, 110), 'accuracy': 80, 'desc': 'Deals Explosive damage.'},
-    'direct_hit': {'name': 'Direct Hit', 'damage': (90, 125), 'accuracy': 70, 'desc': 'High-speed, high-damage rocket.'},
-    'buff_banner': {'name': 'Buff Banner', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Next attack deals 2x damage.', 'utility': True},
-    'shovel': {'name': 'Shovel', 'damage': (55, 75), 'accuracy': 95, 'desc': 'For digging graves.'},
-    'equalizer': {'name': 'Equalizer', 'damage': (50, 70), 'accuracy': 95, 'desc': 'Deals more damage as you get hurt.'},
-
-    # --- Pyro ---
-    'flamethrower': {'name': 'Flamethrower', 'damage': (70, 100), 'accuracy': 90, 'desc': 'Deals Fire damage. Mphm!'},
-    'backburner': {'name': 'Backburner', 'damage': (80, 110), 'accuracy': 90, 'desc': 'Guaranteed crits from behind.'},
-    'flare_gun': {'name': 'Flare Gun', 'damage': (25, 35), 'accuracy': 85, 'desc': 'Lights \'em up from a distance.'},
-    'fire_axe': {'name': 'Fire Axe', 'damage': (55, 75), 'accuracy': 95, 'desc': 'For chopping... things.'},
-    'axtinguisher': {'name': 'Axtinguisher', 'damage': (40, 50), 'accuracy': 95, 'desc': 'Crits burning targets.'},
-
-    # --- Demoman ---
-    'grenade_launcher': {'name': 'Grenade Launcher', 'damage': (80, 120), 'accuracy': 75, 'desc': 'Deals Explosive damage. Bouncy.'},
-    'loch_n_load': {'name': 'Loch-n-Load', 'damage': (100, 130), 'accuracy': 70, 'desc': 'Fast-moving, direct-hit pills.'},
-    'sticky_launcher': {'name': 'Stickybomb Launcher', 'damage': (70, 110), 'accuracy': 70, 'desc': 'Set traps and control areas.'},
-    'chargin_targe': {'name': 'Chargin\' Targe', 'damage': (40, 50), 'accuracy': 90, 'desc': 'Grants passive resistances.'},
-    'bottle': {'name': 'Bottle', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Smash!' },
-    'eyelander': {'name': 'Eyelander', 'damage': (60, 80), 'accuracy': 95, 'desc': 'A haunted sword that demands heads.'},
-
-    # --- Heavy ---
-    'minigun': {'name': 'Minigun', 'damage': (100, 140), 'accuracy': 75, 'desc': 'Costs $400,000 to fire for 12 seconds.'},
-    'natascha': {'name': 'Natascha', 'damage': (90, 130), 'accuracy': 80, 'desc': 'Slows enemies on hit.'},
-    'sandvich': {'name': 'Sandvich', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 75 HP.', 'utility': True},
-    'fists': {'name': 'Fists', 'damage': (60, 80), 'accuracy': 95, 'desc': 'These are my weapons.'},
-    'kgb': {'name': 'K.G.B.', 'damage': (60, 80), 'accuracy': 95, 'desc': 'Killing Gloves of Boxing.'},
-
-    # --- Engineer ---
-    'frontier_justice': {'name': 'Frontier Justice', 'damage': (50, 80), 'accuracy': 85, 'desc': 'Crits based on Sentry kills.'},
-    'wrench': {'name': 'Wrench', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Builds, repairs, and whacks.'},
-    'gunslinger': {'name': 'Gunslinger', 'damage': (40, 50), 'accuracy': 95, 'desc': 'Replaces Sentry with a Mini-Sentry.'},
-    'pda_build': {'name': 'Build PDA', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Builds Dispensers, Sentries, and more.', 'utility': True},
-    'pda_destroy': {'name': 'Destroy PDA', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Destroys your buildings.', 'utility': True},
-
-    # --- Medic ---
-    'syringe_gun': {'name': 'Syringe Gun', 'damage': (10, 20), 'accuracy': 85, 'desc': 'Fires a stream of needles.'},
-    'blutsauger': {'name': 'Blutsauger', 'damage': (10, 20), 'accuracy': 85, 'desc': 'Heals you on-hit.'},
-    'medigun': {'name': 'Medigun', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 50 HP in combat.', 'utility': True},
-    'kritzkrieg': {'name': 'Kritzkrieg', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Heals 30 HP and grants 1.5x damage next turn.', 'utility': True},
-    'bonesaw': {'name': 'Bonesaw', 'damage': (55, 75), 'accuracy': 95, 'desc': 'The default melee.'},
-    'ubersaw': {'name': 'Ubersaw', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Grants Uber on-hit.'},
-
-    # --- Sniper ---
-    'sniper_rifle': {'name': 'Sniper Rifle', 'damage': (50, 150), 'accuracy': 70, 'desc': 'High-risk, high-reward. Aim for the head.'},
-    'huntsman': {'name': 'Huntsman', 'damage': (40, 120), 'accuracy': 75, 'desc': 'A bow and arrow. Be a man.'},
-    'smg': {'name': 'SMG', 'damage': (10, 25), 'accuracy': 85, 'desc': 'For close-quarters panic.'},
-    'jarate': {'name': 'Jarate', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Enemy takes 1.5x damage next turn.', 'utility': True},
-    'kukri': {'name': 'Kukri', 'damage': (55, 75), 'accuracy': 95, 'desc': 'A big knife.'},
-    'bushwacka': {'name': 'Bushwacka', 'damage': (55, 75), 'accuracy': 95, 'desc': 'Crits when it would mini-crit.'},
-
-    # --- Spy ---
-    'revolver': {'name': 'Revolver', 'damage': (30, 50), 'accuracy': 90, 'desc': 'A very fancy sidearm.'},
-    'ambassador': {'name': 'Ambassador', 'damage': (40, 60), 'accuracy': 80, 'desc': 'Rewards accuracy with headshots.'},
-    'knife': {'name': 'Knife', 'damage': (35, 45), 'accuracy': 95, 'desc': 'For backstabbing. (Story-based)'},
-    'your_eternal_reward': {'name': 'Your Eternal Reward', 'damage': (35, 45), 'accuracy': 95, 'desc': 'Instantly disguise on a backstab.'},
-    'sapper': {'name': 'Sapper', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Disables and destroys enemy buildings. (Story-based)', 'utility': True},
-    'invis_watch': {'name': 'Invisibility Watch', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Grants a very high chance to flee combat.', 'utility': True},
-    'disguise_kit': {'name': 'Disguise Kit', 'damage': (0, 0), 'accuracy': 100, 'desc': 'Utility: Blend in with the enemy. (Story-based)', 'utility': True},
-}
-
-# Defines the weapon *options* for each class slot
-WEAPON_CHOICES = {
-    'scout': {
-        'primary': ['scattergun', 'force_a_nature'],
-        'secondary': ['pistol', 'bonk'],
-        'melee': ['bat', 'sandman']
-    },
-    'soldier': {
-        'primary': ['rocket_launcher', 'direct_hit'],
-        'secondary': ['shotgun', 'buff_banner'],
-        'melee': ['shovel', 'equalizer']
-    },
-    'pyro': {
-        'primary': ['flamethrower', 'backburner'],
-        'secondary': ['shotgun', 'flare_gun'],
-        'melee': ['fire_axe', 'axtinguisher']
-    },
-    'demoman': {
-        'primary': ['grenade_launcher', 'loch_n_load'],
-        'secondary': ['sticky_launcher', 'chargin_targe'],
-        'melee': ['bottle', 'eyelander']
-    },
-    'heavy': {
-        'primary': ['minigun', 'natascha'],
-        'secondary': ['shotgun', 'sandvich'],
-        'melee': ['fists', 'kgb']
-    },
-    'engineer': {
-        'primary': ['shotgun', 'frontier_justice'],
-        'secondary': ['pistol'],
-        'melee': ['wrench', 'gunslinger'],
-        'pda': ['pda_build', 'pda_destroy'] # Purely cosmetic for loadout
-    },
-    'medic': {
-        'primary': ['syringe_gun', 'blutsauger'],
-        'secondary': ['medigun', 'kritzkrieg'],
-        'melee': ['bonesaw', 'ubersaw']
-    },
-    'sniper': {
-        'primary': ['sniper_rifle', 'huntsman'],
-        'secondary': ['smg', 'jarate'],
-        'melee': ['kukri', 'bushwacka']
-    },
-    'spy': {
-        'primary': ['revolver', 'ambassador'],
-        'melee': ['knife', 'your_eternal_reward'],
-        'pda': ['invis_watch', 'disguise_kit'] # Sapper is granted by default
-    },
-}
-
-# Classes define starting health, speed (for fleeing)
-CLASSES = {
-    'scout': {'name': 'Scout', 'health': 125, 'speed': 133},
-    'soldier': {'name': 'Soldier', 'health': 200, 'speed': 80},
-    'pyro': {'name': 'Pyro', 'health': 175, 'speed': 100},
-    'demoman': {'name': 'Demoman', 'health': 175, 'speed': 93},
-    'heavy': {'name': 'Heavy', 'health': 300, 'speed': 77},
-    'engineer': {'name': 'Engineer', 'health': 125, 'speed': 100},
-    'medic': {'name': 'Medic', 'health': 150, 'speed': 107},
-    'sniper': {'name': 'Sniper', 'health': 125, 'speed': 100},
-    'spy': {'name': 'Spy', 'health': 125, 'speed': 107},
-}
-
-# Enemies define their stats and attacks
-# Health values adjusted to compensate for higher player damage
-ENEMIES = {
-    'scout_bot': {'name': 'BLU Scout Bot', 'health': 100, 'damage': (10, 20), 'accuracy': 75},
-    'soldier_bot': {'name': 'BLU Soldier Bot', 'health': 180, 'damage': (20, 40), 'accuracy': 80},
-    'heavy_bot': {'name': 'BLU Heavy Bot', 'health': 300, 'damage': (30, 50), 'accuracy': 70},
-    'sentry_gun_boss': {'name': 'BLU Sentry Nest', 'health': 400, 'damage': (25, 35), 'accuracy': 95, 'special': 'boss'},
-    'sniper_bot': {'name': 'BLU Sniper Bot', 'health': 100, 'damage': (20, 60), 'accuracy': 65},
-}
+class ContentError(ValueError):
+    """Content that cannot be played. problems lists every fault found."""
+    def __init__(self, problems):
+        super().__init__(f"{len(problems)} problem(s) in content:\n  " + "\n  ".join(problems))
+        self.problems = problems
+
+class LazyTable(dict):
+    """
+    A dict of one bundle table (see build_tables), filled in as keys are
+    looked up. Only entries used so far are held, so list the keys from
+    the content (CLASSES, ENEMIES, MAP_DATA) rather than from the table.
+    decode turns a bundle entry back into the table's own type; keys the
+    bundle doesn't have are built with build(key).
+    """
+    def __init__(self, table, build, decode=None):
+        super().__init__()
+        self.table = table
+        self.build = build
+        self.decode = decode
+
+    def __missing__(self, key):
+        try:
+            value = BUNDLE.load(self.table, key)
+            if self.decode:
+                value = self.decode(value)
+        except KeyError:
+            value = self.build(key) # Raises KeyError for unknown keys, like a dict
+        self[key] = value
+        return value
+
+def frozen(data):
+    """A hashable copy of a stats dict (weapon, class or enemy entry)."""
+    if isinstance(data, dict):
+        return tuple(sorted((key, frozen(value)) for key, value in data.items()))
+    if isinstance(data, list):
+        return tuple(frozen(value) for value in data)
+    return data
+
+# Small integer id per weapon, used to key per-fight lookup tables
+WEAPON_KEYS = list(WEAPONS)
+WEAPON_LIST = list(WEAPONS.values()) # Weapon dicts by id
+for weapon_id, weapon_key in enumerate(WEAPON_KEYS):
+    WEAPONS[weapon_key]['id'] = weapon_id
+
+# Struct-of-arrays copy of the numbers in WEAPONS, one array per field, indexed by weapon id
+WeaponTable = namedtuple('WeaponTable', ['min_damage', 'max_damage', 'accuracy', 'utility', 'combat',
+                                         'heal', 'buff', 'dodge', 'debuff_turns', 'flee_bonus', 'clip'])
+
+def build_weapon_table(weapons):
+    effects = [w.get('effects', {}) for w in weapons]
+    return WeaponTable(
+        min_damage=array('H', [w['damage'][0] for w in weapons]),
+        max_damage=array('H', [w['damage'][1] for w in weapons]),
+        accuracy=array('B', [w['accuracy'] for w in weapons]),
+        utility=array('B', [bool(w.get('utility')) for w in weapons]),
+        combat=array('B', [not w.get('utility') or 'effects' in w for w in weapons]),
+        heal=array('H', [e.get('heal', 0) for e in effects]),
+        buff=array('B', ['buff' in e for e in effects]), # The only buff is a mini-crit
+        dodge=array('B', [bool(e.get('dodge')) for e in effects]),
+        debuff_turns=array('B', [e.get('debuff_turns', 0) for e in effects]),
+        flee_bonus=array('B', [w.get('flee_bonus', 0) for w in weapons]),
+        clip=array('B', [w.get('clip', 0) for w in weapons]),
+    )
+
+WEAPON_TABLE = build_weapon_table(WEAPON_LIST)
+
+# Ammo is kept per slot, in arrays indexed like AMMO_SLOTS: a gun's clip and
+# the spare shots (the reserve) behind it. The Sapper's charge is story-only.
+AMMO_SLOTS = ('primary', 'secondary', 'sapper')
+AMMO_RESERVE = (20, 36, 1) # Spare shots at spawn, and the most a slot can carry
+NO_AMMO = 255 # Slot index of weapons that use no ammo
+
+def ammo_slot_table(class_key):
+    """bytes indexed by weapon id: the AMMO_SLOTS index each of the class's guns draws from, else NO_AMMO."""
+    table = bytearray([NO_AMMO]) * len(WEAPON_LIST)
+    for slot, keys in WEAPON_CHOICES[class_key].items():
+        for key in keys:
+            if 'clip' in WEAPONS[key] and slot in AMMO_SLOTS:
+                table[WEAPONS[key]['id']] = AMMO_SLOTS.index(slot)
+    return bytes(table)
+
+AMMO_SLOT_TABLES = LazyTable('ammo_slots', ammo_slot_table)
+
+
+# ### Enemy AI ###
+
+HP_BUCKETS = 4
+STATUS_FLAGS = 3 # soaked, buffed, can heal
+AI_STATES = HP_BUCKETS * HP_BUCKETS << STATUS_FLAGS
+
+# kind: 'attack', 'heal' or 'retreat'; damage is (min, max) and heal an amount of HP
+EnemyMove = namedtuple('EnemyMove', ['name', 'kind', 'accuracy', 'damage', 'heal'])
+# table[state] is an index into moves (see ai_state); heals is the heal charges per fight;
+# stats is the enemy's ai_stats it was compiled from
+EnemyAI = namedtuple('EnemyAI', ['policy', 'moves', 'table', 'heals', 'stats'])
+
+def hp_bucket(hp, max_hp):
+    """0 for 25% health or less, up to HP_BUCKETS - 1 for over 75%."""
+    return min(HP_BUCKETS - 1, max(0, (hp * HP_BUCKETS - 1) // max_hp))
+
+def ai_state(own_bucket, player_bucket, soaked, buffed, can_heal):
+    return (own_bucket * HP_BUCKETS + player_bucket) << STATUS_FLAGS | soaked | buffed << 1 | can_heal << 2
+
+def compile_enemy_ai(enemy):
+    """Turns an ENEMIES entry's policy rules into a lookup table over every AI state."""
+    rules = ENEMY_POLICIES[enemy.get('policy', 'brawler')]
+    names = list(dict.fromkeys(['attack'] + [name for name, _ in rules]))
+    moves = []
+    for name in names:
+        move = ENEMY_MOVES[name]
+        scale = move.get('damage', 1)
+        kind = 'retreat' if move.get('retreat') else 'heal' if move.get('heal') else 'attack'
+        moves.append(EnemyMove(name, kind, min(100, enemy['accuracy'] + move.get('accuracy', 0)),
+                               (int(enemy['damage'][0] * scale), int(enemy['damage'][1] * scale)),
+                               int(enemy['health'] * move.get('heal', 0))))
+
+    def matches(name, conditions, own, player, soaked, buffed, can_heal):
+        return ((ENEMY_MOVES[name].get('heal') is None or can_heal)
+                and own <= conditions.get('own_hp', HP_BUCKETS)
+                and player <= conditions.get('player_hp', HP_BUCKETS)
+                and player >= conditions.get('player_hp_min', 0)
+                and conditions.get('soaked', soaked) == soaked
+                and conditions.get('buffed', buffed) == buffed)
+
+    table = bytearray(AI_STATES)
+    for own in range(HP_BUCKETS):
+        for player in range(HP_BUCKETS):
+            for status in range(1 << STATUS_FLAGS):
+                flags = (bool(status & 1), bool(status & 2), bool(status & 4))
+                for name, conditions in rules:
+                    if matches(name, conditions, own, player, *flags):
+                        table[ai_state(own, player, *flags)] = names.index(name)
+                        break
+    heals = 1 if any(move.kind == 'heal' for move in moves) else 0
+    return EnemyAI(enemy.get('policy', 'brawler'), tuple(moves), bytes(table), heals, ai_stats(enemy))
+
+def ai_stats(enemy):
+    """The fields of an ENEMIES entry that its compiled AI depends on."""
+    return enemy.get('policy', 'brawler'), enemy['accuracy'], tuple(enemy['damage']), enemy['health']
+
+def encode_enemy_ai(ai):
+    """An EnemyAI as plain tuples, for the bundle."""
+    return ai.policy, tuple(tuple(move) for move in ai.moves), ai.table, ai.heals, ai.stats
+
+def decode_enemy_ai(row):
+    policy, moves, table, heals, stats = row
+    return EnemyAI(policy, tuple(EnemyMove._make(move) for move in moves), table, heals, stats)
+
+# Look enemies up through enemy_ai(), which notices stats tuned at runtime
+ENEMY_AI = LazyTable('enemy_ai', lambda key: compile_enemy_ai(ENEMIES[key]), decode_enemy_ai)
+
+def enemy_ai(key):
+    """
+    The compiled AI for an enemy key, shared by every Enemy of that kind.
+    Recompiled first if the enemy's stats in ENEMIES were changed since
+    (tuning at runtime, as the optimizer and propagate.py allow).
+    """
+    enemy = ENEMIES[key]
+    ai = ENEMY_AI[key]
+    if ai.stats != ai_stats(enemy):
+        ai = ENEMY_AI[key] = compile_enemy_ai(enemy)
+    return ai
+
+def enemy_move(enemy, player):
+    """The bot's move for this turn: one index into its compiled table. Both sides must be alive."""
+    ai = enemy.ai
+    # hp_bucket and ai_state inlined: this runs every enemy turn, and 0 < HP <= max needs no clamping
+    own = (enemy.current_health * HP_BUCKETS - 1) // enemy.max_health
+    theirs = (player.current_health * HP_BUCKETS - 1) // player.max_health
+    return ai.moves[ai.table[(own * HP_BUCKETS + theirs) << STATUS_FLAGS | (enemy.debuff_turns > 0)
+                             | (player.combat_buff is not None) << 1 | (enemy.heals_left > 0) << 2]]
 
 
 # ### Core Game Classes ###
 
 class Entity:
     """Base class for both Player and Enemy."""
+    __slots__ = ('name', 'max_health', 'current_health')
+
     def __init__(self, name, health):
         self.name = name
         self.max_health = health
@@ -200,7 +407,7 @@ class Entity:
         self.current_health -= amount
         if self.current_health < 0:
             self.current_health = 0
-        print(f"  {self.name} takes {amount} damage! ({self.current_health}/{self.max_health} HP remaining)")
+        print_line(f"  {self.name} takes {amount} damage! ({self.current_health}/{self.max_health} HP remaining)")
         if self.current_health == 0:
             print_slow(f"  {self.name} has been defeated!")
             return 'dead'
@@ -211,7 +418,7 @@ class Entity:
         self.current_health += amount
         if self.current_health > self.max_health:
             self.current_health = self.max_health
-        print(f"  {self.name} heals for {amount} HP! ({self.current_health}/{self.max_health} HP remaining)")
+        print_line(f"  {self.name} heals for {amount} HP! ({self.current_health}/{self.max_health} HP remaining)")
 
     def is_alive(self):
         """Checks if the entity's health is above 0."""
@@ -219,35 +426,56 @@ class Entity:
 
 class Player(Entity):
     """Stores all player-specific data and actions."""
+    __slots__ = ('player_class', 'class_key', 'speed', 'weapon_ids', 'ammo', 'clips', 'sentry_built',
+                 'has_invis_watch', 'flee_bonus', 'combat_buff', 'is_dodging')
+
     def __init__(self, name):
         super().__init__(name, 100) # Initial health, will be overwritten
         self.player_class = None
         self.class_key = None # e.g., 'scout'
         self.speed = 100
-        self.inventory = [] # Will hold weapon dictionaries
-        self.ammo = {'primary': 20, 'secondary': 36, 'sapper': 1}
+        self.weapon_ids = b'' # Inventory as one byte per weapon id (see WEAPON_LIST)
+        self.ammo = array('H', AMMO_RESERVE) # Spare shots per slot (see AMMO_SLOTS)
+        self.clips = array('H', bytes(2 * len(AMMO_SLOTS))) # Shots loaded per slot
         self.sentry_built = False # For Engi special
         # Special property flags set by loadout
         self.has_invis_watch = False
+        self.flee_bonus = 0
         self.combat_buff = None # For Buff Banner, Kritz, Jarate
         self.is_dodging = False # For Bonk
 
+    @property
+    def inventory(self):
+        """The player's weapon dictionaries, in the order they were equipped."""
+        return [WEAPON_LIST[i] for i in self.weapon_ids]
+
+    @property
+    def combat_actions(self):
+        """The inventory items usable in a fight."""
+        return [WEAPON_LIST[i] for i in self.weapon_ids if WEAPON_TABLE.combat[i]]
+
     def choose_class(self):
         """Displays class options and sets up the player."""
         print_slow("The Administrator needs you. Choose your class:")
         class_list = list(CLASSES.keys())
         for i, class_name in enumerate(class_list):
             cls = CLASSES[class_name]
-            print(f"  {i+1}. {cls['name']} (HP: {cls['health']}, Speed: {cls['speed']})")
+            print_line(f"  {i+1}. {cls['name']} (HP: {cls['health']}, Speed: {cls['speed']})")
 
         choice = 0
         while choice not in range(1, len(class_list) + 1):
             try:
                 choice = int(get_input(f"Enter a number (1-{len(class_list)}):"))
             except ValueError:
-                print("That's not a valid number.")
+                print_line("That's not a valid number.")
+            if METRICS is not None and choice not in range(1, len(class_list) + 1):
+                METRICS.count('reprompts', where='choose_class')
 
-        self.class_key = class_list[choice - 1]
+        self.set_class(class_list[choice - 1])
+
+    def set_class(self, class_key):
+        """Sets up the player's stats for class_key without prompting."""
+        self.class_key = class_key
         self.player_class = CLASSES[self.class_key]
         
         # Set stats from class data
@@ -256,9 +484,9 @@ class Player(Entity):
         self.current_health = self.max_health
         self.speed = self.player_class['speed']
         
-        # Spy always gets a Sapper for story events
-        if self.class_key == 'spy':
-            self.inventory.append(WEAPONS['sapper'])
+        # Items the class always carries (the Spy's Sapper)
+        for weapon_key in self.player_class.get('items', []):
+            self.equip(weapon_key)
 
 
     def equip_loadout(self):
@@ -267,9 +495,10 @@ class Player(Entity):
         
         # Get weapon choices for the player's class
         choices = WEAPON_CHOICES[self.class_key]
+        chosen = [] # Keys picked so far, for the advisor
         
         # Loop through Primary, Secondary, Melee, and PDA slots
-        for slot in ['primary', 'secondary', 'melee', 'pda']:
+        for slot in LOADOUT_SLOTS:
             weapon_keys = choices.get(slot, [])
             
             # Skip if class has no weapons for this slot
@@ -282,13 +511,16 @@ class Player(Entity):
             if len(weapon_keys) == 1:
                 weapon_data = WEAPONS[weapon_keys[0]]
                 print_slow(f"  You equip your {weapon_data['name']}. ({weapon_data['desc']})")
-                self.inventory.append(weapon_data)
+                self.equip(weapon_keys[0])
+                chosen.append(weapon_keys[0])
                 continue
                 
             # Present options
+            recommended = ADVISOR.recommend(self.class_key, chosen) if ADVISOR is not None else None
             for i, key in enumerate(weapon_keys):
                 weapon_data = WEAPONS[key]
-                print(f"  {i+1}. {weapon_data['name']} - ({weapon_data['desc']})")
+                hint = " [recommended]" if key == recommended else ""
+                print_line(f"  {i+1}. {weapon_data['name']} - ({weapon_data['desc']}){hint}")
 
             # Get user choice
             choice = 0
@@ -296,40 +528,76 @@ class Player(Entity):
                 try:
                     choice = int(get_input(f"Enter a number (1-{len(weapon_keys)}):"))
                 except ValueError:
-                    print("That's not a valid number.")
+                    print_line("That's not a valid number.")
+                if METRICS is not None and choice not in range(1, len(weapon_keys) + 1):
+                    METRICS.count('reprompts', where='equip_loadout')
                     
             chosen_key = weapon_keys[choice - 1]
-            chosen_weapon = WEAPONS[chosen_key]
-            self.inventory.append(chosen_weapon)
-            print(f"  {chosen_weapon['name']} equipped.")
-            
-            # Set special flags based on loadout
-            if chosen_key == 'invis_watch':
-                self.has_invis_watch = True
+            self.equip(chosen_key)
+            chosen.append(chosen_key)
+            print_line(f"  {WEAPONS[chosen_key]['name']} equipped.")
         
         print_slow("\nLoadout confirmed. Get to the front!")
 
+    def equip(self, weapon_key):
+        """Adds a weapon to the inventory and sets any loadout flags it grants."""
+        weapon_id = WEAPONS[weapon_key]['id']
+        self.weapon_ids += bytes((weapon_id,))
+        slot = AMMO_SLOT_TABLES[self.class_key][weapon_id]
+        if slot != NO_AMMO:
+            self.clips[slot] = WEAPON_TABLE.clip[weapon_id] # Guns come loaded
+        
+        # Set special flags based on loadout
+        if WEAPON_TABLE.flee_bonus[weapon_id]:
+            self.flee_bonus += WEAPON_TABLE.flee_bonus[weapon_id]
+            self.has_invis_watch = True
+
 
     def show_stats(self):
         """Displays the player's current status."""
-        print("\n--- YOUR STATS ---")
-        print(f"  Class: {self.player_class['name']}")
-        print(f"  Health: {self.current_health} / {self.max_health}")
-        print(f"  Speed Rating: {self.speed}")
-        print("------------------\n")
+        print_line("\n--- YOUR STATS ---")
+        print_line(f"  Class: {self.player_class['name']}")
+        print_line(f"  Health: {self.current_health} / {self.max_health}")
+        print_line(f"  Speed Rating: {self.speed}")
+        if self.ammo_status():
+            print_line(f"  Ammo: {self.ammo_status()}")
+        print_line("------------------\n")
+
+    def ammo_status(self):
+        """Each gun's shots as 'loaded/spare' (just spare for guns without a clip), or "" with no guns."""
+        slots = AMMO_SLOT_TABLES[self.class_key]
+        status = []
+        for i in self.weapon_ids:
+            slot = slots[i]
+            if slot != NO_AMMO:
+                shots = f"{self.clips[slot]}/{self.ammo[slot]}" if WEAPON_TABLE.clip[i] else f"{self.ammo[slot]}"
+                status.append(f"{WEAPON_LIST[i]['name']} {shots}")
+        return ", ".join(status)
+
+    def reload_all(self):
+        """Fills every gun's clip from its reserve. Between fights, reloading takes no turn."""
+        slots = AMMO_SLOT_TABLES[self.class_key]
+        for i in self.weapon_ids:
+            if slots[i] != NO_AMMO and WEAPON_TABLE.clip[i]:
+                load_clip(self.clips, self.ammo, slots[i], WEAPON_TABLE.clip[i])
+
+    def restock(self, percent):
+        """Adds percent of a full reserve to every slot's spare ammo, up to a full reserve."""
+        for slot, full in enumerate(AMMO_RESERVE):
+            self.ammo[slot] = min(full, self.ammo[slot] + full * percent // 100)
 
     def show_inventory(self):
         """Displays the player's weapons and their stats."""
-        print("\n--- YOUR INVENTORY ---")
+        print_line("\n--- YOUR INVENTORY ---")
         if not self.inventory:
-            print("  You have no weapons!")
+            print_line("  You have no weapons!")
             return
             
         for i, weapon in enumerate(self.inventory):
-            print(f"  {i+1}. {weapon['name']}")
-            print(f"     - Damage: {weapon['damage'][0]}-{weapon['damage'][1]} | Accuracy: {weapon['accuracy']}%")
-            print(f"     - Desc: {weapon['desc']}")
-        print("----------------------\n")
+            print_line(f"  {i+1}. {weapon['name']}")
+            print_line(f"     - Damage: {weapon['damage'][0]}-{weapon['damage'][1]} | Accuracy: {weapon['accuracy']}%")
+            print_line(f"     - Desc: {weapon['desc']}")
+        print_line("----------------------\n")
         
     def find_item(self, item_type, amount):
         """Logic for picking up items found on the map."""
@@ -338,25 +606,40 @@ class Player(Entity):
             self.heal(amount)
         elif item_type == 'ammo':
             print_slow(f"You found an ammo crate! Resupplied.")
-            # Simplified: just reset ammo counts
-            self.ammo['primary'] = 20
-            self.ammo['secondary'] = 36
+            self.restock(amount)
 
 
 class Enemy(Entity):
     """Stores enemy-specific data and attack logic."""
+    __slots__ = ('key', 'damage', 'accuracy', 'speed', 'is_boss', 'is_confused', 'debuff_turns', 'ai', 'heals_left')
+
     def __init__(self, key):
-        self.enemy_data = ENEMIES[key]
-        super().__init__(self.enemy_data['name'], self.enemy_data['health'])
-        self.damage = self.enemy_data['damage']
-        self.accuracy = self.enemy_data['accuracy']
-        self.is_boss = 'special' in self.enemy_data
+        self.key = key
+        enemy_data = ENEMIES[key]
+        super().__init__(enemy_data['name'], enemy_data['health'])
+        self.damage = enemy_data['damage'] # Shared tuple, not a copy
+        self.accuracy = enemy_data['accuracy']
+        self.speed = enemy_data['speed']
+        self.is_boss = 'special' in enemy_data
         self.is_confused = False # For Pyro airblast
         self.debuff_turns = 0 # For Jarate
-
-    def attack(self, target):
-        """Enemy's turn to attack the player."""
-        print_slow(f"{self.name} attacks you!")
+        self.ai = enemy_ai(key) # Compiled once per enemy type (and stats), shared
+        self.heals_left = self.ai.heals
+
+    @property
+    def enemy_data(self):
+        return ENEMIES[self.key]
+
+    def attack(self, target, rng=None, move=None):
+        """Enemy's turn: attacks, heals or retreats, as its policy decides (or as move says)."""
+        move = move or enemy_move(self, target)
+        print_slow(ENEMY_MOVES[move.name]['text'].format(name=self.name))
+        if move.kind == 'retreat':
+            return 'retreated'
+        if move.kind == 'heal':
+            self.heals_left -= 1
+            self.heal(move.heal)
+            return 'alive'
         
         # Check for status effects
         if self.is_confused:
@@ -365,9 +648,8 @@ class Enemy(Entity):
             return 'alive'
 
         # Roll to hit
-        roll = random.randint(1, 100)
-        if roll <= self.accuracy:
-            dmg = random.randint(self.damage[0], self.damage[1])
+        dmg = roll_enemy_attack(self, rng or ROLLS, move)
+        if dmg is not None:
             print_slow(f"{self.name} hits you for {dmg} damage!")
             return target.take_damage(dmg)
         else:
@@ -375,295 +657,610 @@ class Enemy(Entity):
             return 'alive'
 
 
+# ### Combat Rules ###
+# Shared by the interactive Combat loop and the headless engine (engine.py),
+# so both consume random rolls in exactly the same order.
+
+CRIT_CHANCE = 10 # Percent chance for any hit to crit
+
+def combat_items(inventory):
+    """Filters out non-combat items unless they are usable utilities."""
+    return [w for w in inventory if WEAPON_TABLE.combat[w['id']]]
+
+def effect_table(owner, items):
+    """
+    Resolves the 'effects' of every utility in items into owner's handler
+    methods (effect_heal, effect_buff, ...), once per fight.
+    Returns {weapon id: ((handler, value), ...)}.
+    """
+    return {w['id']: tuple((getattr(owner, f"effect_{effect}"), value) for effect, value in w['effects'].items())
+            for w in items if w.get('utility')}
+
+def roll_attack(weapon, combat_buff, debuffed, rng=random):
+    """
+    Rolls a standard attack with weapon.
+    Returns (damage, mini_crit, jarate, crit). damage is None on a miss.
+    """
+    if rng.randint(1, 100) > weapon['accuracy']:
+        return None, False, False, False
+
+    dmg = rng.randint(weapon['damage'][0], weapon['damage'][1])
+    mini_crit = combat_buff == 'mini-crit'
+    if mini_crit:
+        dmg = int(dmg * 1.5)
+    if debuffed:
+        dmg = int(dmg * 1.5)
+
+    crit = rng.randint(1, 100) <= CRIT_CHANCE
+    if crit:
+        dmg *= 2 # Crits override mini-crits
+    return dmg, mini_crit, debuffed, crit
+
+def roll_enemy_attack(enemy, rng=random, move=None):
+    """Rolls an enemy attack (with move's accuracy and damage, if given). Returns the damage dealt, or None on a miss."""
+    accuracy, damage = (move.accuracy, move.damage) if move else (enemy.accuracy, enemy.damage)
+    if rng.randint(1, 100) <= accuracy:
+        return rng.randint(damage[0], damage[1])
+    return None
+
+def load_clip(clips, reserve, slot, size):
+    """Moves spare shots into a slot's clip, up to size. Returns how many were loaded."""
+    load = min(size - clips[slot], reserve[slot])
+    clips[slot] += load
+    reserve[slot] -= load
+    return load
+
+def spend_ammo(clips, reserve, slot, weapon_id):
+    """
+    Takes one shot for an attack with a gun (slot from AMMO_SLOT_TABLES) out
+    of the ammo arrays. Returns 'fire', 'reload' (the clip was empty, and
+    reloading it takes the turn) or 'empty' (no shots left at all).
+    """
+    size = WEAPON_TABLE.clip[weapon_id]
+    if not size: # Fed straight from the reserve
+        if reserve[slot]:
+            reserve[slot] -= 1
+            return 'fire'
+        return 'empty'
+    if clips[slot]:
+        clips[slot] -= 1
+        return 'fire'
+    return 'reload' if load_clip(clips, reserve, slot, size) else 'empty'
+
+def melee_weapon(player):
+    """The player's melee weapon, used when a gun runs dry, or None."""
+    melee = WEAPON_CHOICES[player.class_key].get('melee', ())
+    return next((weapon for weapon in player.inventory if WEAPON_KEYS[weapon['id']] in melee), None)
+
+def targeted(weapon):
+    """Whether weapon lands on an enemy: every attack, and utilities with an enemy effect (Jarate)."""
+    return not WEAPON_TABLE.utility[weapon['id']] or WEAPON_TABLE.debuff_turns[weapon['id']] > 0
+
+def flee_chance(player):
+    """Chance (out of 100) to escape. Based on player speed and items."""
+    chance = 50 + (player.speed - 100) # Base 50%, adjusted by speed
+    return chance + player.flee_bonus # Huge bonus for invis watch
+
+def weapon_menu(items):
+    """
+    The weapon prompt for a fight, built once: (menu lines, {answer: weapon},
+    prompt text). Re-prompts reuse it instead of rebuilding the list.
+    """
+    lines = tuple(f"  {i+1}. {weapon['name']} (Dmg: {weapon['damage'][0]}-{weapon['damage'][1]}, Acc: {weapon['accuracy']}%)"
+                  for i, weapon in enumerate(items))
+    choices = {str(i + 1): weapon for i, weapon in enumerate(items)}
+    return lines, choices, f"Enter weapon number (1-{len(items)}):"
+
+
+# ### Turn Order ###
+
+INITIATIVE = 10000 # Time between actions is INITIATIVE // speed
+
+class TurnScheduler:
+    """
+    Initiative queue for a fight with any number of combatants, as a heap
+    of (next action time, slot). Slot i acts every INITIATIVE // speeds[i]
+    time units, so faster fighters act more often; ties go to the lower
+    slot, so slot 0 (the player) always opens. Removed slots are dropped
+    when they come up, keeping every action O(log n).
+    """
+    def __init__(self, speeds):
+        self.delays = [INITIATIVE // max(speed, 1) for speed in speeds]
+        self.heap = [(0, slot) for slot in range(len(speeds))] # Sorted, so already a heap
+        self.active = bytearray([1]) * len(speeds)
+
+    def next(self):
+        """The slot that acts now; it is queued again for its next action."""
+        heap = self.heap
+        while True:
+            at, slot = heap[0]
+            if self.active[slot]:
+                heapq.heapreplace(heap, (at + self.delays[slot], slot))
+                return slot
+            heapq.heappop(heap)
+
+    def remove(self, slot):
+        """Takes a combatant out of the fight (defeated or gone)."""
+        self.active[slot] = 0
+
+
 # ### Combat System ###
 
+INPUT_BUDGET = 20 # Answers a player may give in one combat turn before the turn is lost
+TURN_TIMEOUT = None # Seconds one combat turn may take before it is lost (None: no limit)
+
 class Combat:
     """Handles the turn-based combat loop."""
-    def __init__(self, player, enemy):
+    def __init__(self, player, enemy, rng=None, turn=0, on_turn=None,
+                 input_budget=INPUT_BUDGET, turn_timeout=TURN_TIMEOUT):
         self.player = player
-        self.enemy = enemy
-        self.turn = 0
+        self.enemy = enemy # The enemy being attacked or acting right now
+        self.enemies = [enemy]
+        self.rng = rng or ROLLS
+        self.turn = turn # Non-zero when resuming a saved fight
+        self.on_turn = on_turn # Called with this Combat before every turn (autosave)
+        self.input_budget = input_budget
+        self.turn_timeout = turn_timeout
         self.sentry_turns = 0 # For Engi special
+        self.effects = effect_table(self, player.combat_actions)
+        self.weapon_lines, self.weapon_choices, self.weapon_prompt = weapon_menu(player.combat_actions)
+        self.ammo_slots = AMMO_SLOT_TABLES[player.class_key]
+        self.melee = melee_weapon(player) # Fallback for a gun out of ammo
+        if METRICS is not None:
+            self.rng = CountingRolls(self.rng)
 
     def start(self):
         """Main loop for the combat encounter."""
         print_slow(f"\n--- BATTLE START ---")
         print_slow(f"A wild {self.enemy.name} appears!")
         
-        # Reset any lingering combat buffs
-        self.player.combat_buff = None
-        self.player.is_dodging = False
-        self.enemy.debuff_turns = 0
+        first_turn = self.turn
+        # Reset any lingering combat buffs (a resumed fight keeps its own)
+        if self.turn == 0:
+            self.player.combat_buff = None
+            self.player.is_dodging = False
+            self.enemy.debuff_turns = 0
+            self.player.reload_all()
 
         while self.player.is_alive() and self.enemy.is_alive():
+            if self.on_turn:
+                self.on_turn(self)
             self.turn += 1
-            print(f"\n--- Turn {self.turn} ---")
-            print(f"Your HP: {self.player.current_health}/{self.player.max_health}")
-            print(f"Enemy HP: {self.enemy.current_health}/{self.enemy.max_health}")
+            print_line(f"\n--- Turn {self.turn} ---")
+            print_line(f"Your HP: {self.player.current_health}/{self.player.max_health}")
+            self.show_ammo()
+            print_line(f"Enemy HP: {self.enemy.current_health}/{self.enemy.max_health}")
 
             # 1. Player Turn
             if self.player_turn() == 'fled':
-                return 'fled'
+                return self.finished('fled', first_turn)
             
             if not self.enemy.is_alive():
                 break # Player won
 
             # 2. Enemy Turn
             if self.enemy.is_alive():
-                if self.enemy_turn() == 'dead':
+                outcome = self.enemy_turn()
+                if outcome == 'dead':
                     break # Enemy won
+                if outcome == 'retreated':
+                    print_slow(f"The {self.enemy.name} is gone. The way is clear!")
+                    return self.finished('won', first_turn)
 
         # 3. End of Combat
         if not self.player.is_alive():
             print_slow("You have been defeated.")
-            return 'dead'
+            return self.finished('dead', first_turn)
         elif not self.enemy.is_alive():
             print_slow(f"You have defeated the {self.enemy.name}!")
-            return 'won'
+            return self.finished('won', first_turn)
+
+    def finished(self, result, first_turn):
+        """Records the fight when instrumentation is on. Returns result."""
+        if METRICS is not None:
+            METRICS.count('fights', outcome=result)
+            METRICS.observe('combat_turns', self.turn - first_turn)
+            if isinstance(self.rng, CountingRolls):
+                METRICS.observe('combat_rolls', self.rng.rolls)
+        return result
 
     def player_turn(self):
-        """Handles all logic for the player's action."""
+        """
+        Handles all logic for the player's action. Stats and bad input
+        re-prompt within this loop, so retries never grow the stack. Once the
+        turn's input budget or time limit is used up, the turn is lost.
+        """
         
         # Reset buffs that last one turn
         self.player.is_dodging = False 
 
-        print("\nWhat will you do?")
-        print("  1. Attack")
-        print("  2. Check Stats / Inventory")
-        print("  3. Flee")
-
-        choice = get_input("Choose an action (1-3):")
-        
-        if choice == '1': # Attack
-            self.player_attack()
-        elif choice == '2': # Stats
-            self.player.show_stats()
-            self.player.show_inventory()
-            return self.player_turn() # Re-do turn
-        elif choice == '3': # Flee
-            return self.player_flee()
-        else:
-            print("That's not a valid command.")
-            return self.player_turn() # Re-do turn
-
-    def player_attack(self):
-        """Player chooses a weapon and attacks OR uses a utility."""
-        print("Choose your weapon:")
-        
-        # Filter out non-combat items unless they are utility
-        combat_items = [w for w in self.player.inventory if not w.get('utility') or w['name'] in ['Bonk! Atomic Punch', 'Buff Banner', 'Sandvich', 'Medigun', 'Kritzkrieg', 'Jarate']]
-        
-        for i, weapon in enumerate(combat_items):
-            print(f"  {i+1}. {weapon['name']} (Dmg: {weapon['damage'][0]}-{weapon['damage'][1]}, Acc: {weapon['accuracy']}%)")
-        
-        try:
-            choice = int(get_input(f"Enter weapon number (1-{len(combat_items)}):"))
-            if not 1 <= choice <= len(combat_items):
-                raise ValueError
-        except ValueError:
-            print("Invalid weapon choice.")
-            return self.player_attack() # Re-prompt
-            
-        weapon = combat_items[choice - 1]
-        
+        deadline = time.monotonic() + self.turn_timeout if self.turn_timeout else None
+        choosing_weapon = False
+        weapon = None # Set once a weapon is picked and a target is still needed
+        for _ in range(self.input_budget):
+            if weapon is not None:
+                targets = self.living()
+                print_line("Choose your target:")
+                for i, enemy in enumerate(targets):
+                    print_line(f"  {i+1}. {enemy.name} ({enemy.current_health}/{enemy.max_health} HP)")
+                choice = get_input(f"Enter target number (1-{len(targets)}):")
+                if choice.isdigit() and 1 <= int(choice) <= len(targets):
+                    self.enemy = targets[int(choice) - 1]
+                    return self.player_attack(weapon)
+                print_line("Invalid target.")
+                if METRICS is not None:
+                    METRICS.count('reprompts', where='target')
+            elif not choosing_weapon:
+                print_line("\nWhat will you do?")
+                print_line("  1. Attack")
+                print_line("  2. Check Stats / Inventory")
+                print_line("  3. Flee")
+
+                choice = get_input("Choose an action (1-3):")
+
+                if choice == '1': # Attack
+                    choosing_weapon = True
+                elif choice == '2': # Stats
+                    self.player.show_stats()
+                    self.player.show_inventory()
+                    if METRICS is not None:
+                        METRICS.count('reprompts', where='player_turn')
+                elif choice == '3': # Flee
+                    return self.player_flee()
+                else:
+                    print_line("That's not a valid command.")
+                    if METRICS is not None:
+                        METRICS.count('reprompts', where='player_turn')
+            else:
+                # Only items usable in combat (filtered when equipped)
+                print_line("Choose your weapon:")
+                for line in self.weapon_lines:
+                    print_line(line)
+
+                weapon = self.weapon_choices.get(get_input(self.weapon_prompt))
+                if weapon is not None and (len(self.living()) < 2 or not targeted(weapon)):
+                    return self.player_attack(weapon)
+                if weapon is None:
+                    print_line("Invalid weapon choice.")
+                    if METRICS is not None:
+                        METRICS.count('reprompts', where='player_attack')
+
+            if deadline is not None and time.monotonic() > deadline:
+                break
+
+        print_slow("You hesitate and lose your turn!")
+        if METRICS is not None:
+            METRICS.count('hesitations')
+        return 'hesitated'
+
+    def player_attack(self, weapon):
+        """Player attacks OR uses a utility with the weapon chosen in player_turn."""
         # --- Handle Utility Items ---
         if weapon.get('utility'):
             print_slow(f"You use your {weapon['name']}!")
-            if weapon['name'] == 'Sandvich':
-                self.player.heal(75)
-            elif weapon['name'] == 'Bonk! Atomic Punch':
-                print_slow("You're invincible!")
-                self.player.is_dodging = True
-            elif weapon['name'] == 'Medigun':
-                self.player.heal(50)
-            elif weapon['name'] == 'Kritzkrieg':
-                self.player.heal(30)
-                print_slow("Your next attack will be a mini-crit!")
-                self.player.combat_buff = 'mini-crit'
-            elif weapon['name'] == 'Buff Banner':
-                print_slow("Your next attack will be a mini-crit!")
-                self.player.combat_buff = 'mini-crit'
-            elif weapon['name'] == 'Jarate':
-                print_slow(f"The {self.enemy.name} is soaked! They will take extra damage.")
-                self.enemy.debuff_turns = 2 # Lasts for this turn and next
+            for handler, value in self.effects[weapon['id']]:
+                handler(value)
             return 'used_utility' # Ends turn
+
+        # --- Spend Ammo ---
+        slot = self.ammo_slots[weapon['id']]
+        if slot != NO_AMMO:
+            shot = spend_ammo(self.player.clips, self.player.ammo, slot, weapon['id'])
+            if shot == 'reload':
+                print_slow(f"Your {weapon['name']} is empty. You reload it!")
+                return 'reloaded' # Ends turn
+            if shot == 'empty':
+                if self.melee is None:
+                    print_slow(f"Your {weapon['name']} is out of ammo!")
+                    return 'out_of_ammo'
+                print_slow(f"Your {weapon['name']} is out of ammo! You switch to your {self.melee['name']}.")
+                weapon = self.melee
             
         # --- Handle Standard Attack ---
         print_slow(f"You attack with your {weapon['name']}!")
         
-        # Roll to hit
-        roll = random.randint(1, 100)
-        if roll <= weapon['accuracy']:
-            # Calculate damage
-            dmg = random.randint(weapon['damage'][0], weapon['damage'][1])
-            
+        # Roll to hit, damage and crit in one go
+        dmg, mini_crit, jarated, crit = roll_attack(weapon, self.player.combat_buff, self.enemy.debuff_turns > 0, self.rng)
+        if dmg is not None:
             # Check for buffs/debuffs
-            if self.player.combat_buff == 'mini-crit':
+            if mini_crit:
                 print_slow("Mini-Crit!")
-                dmg = int(dmg * 1.5)
-                self.player.combat_buff = None # Use up buff
-                
-            if self.enemy.debuff_turns > 0:
+            if jarated:
                 print_slow("Jarate damage!")
-                dmg = int(dmg * 1.5)
-            
-            # Critical hit chance (10%)
-            if random.randint(1, 100) <= 10:
+            if crit:
                 print_slow("CRITICAL HIT!")
-                dmg *= 2 # Crits override mini-crits
                 
             self.enemy.take_damage(dmg)
+            if weapon.get('splash') and len(self.enemies) > 1:
+                self.splash(dmg * weapon['splash'])
         else:
             print_slow("Your attack missed!")
             
-        # Clear buff even on miss
+        # Use up buff, even on miss
         if self.player.combat_buff:
             self.player.combat_buff = None
 
 
+    def show_ammo(self):
+        status = self.player.ammo_status()
+        if status:
+            print_line(f"Ammo: {status}")
+
+    def living(self):
+        """Enemies still in the fight."""
+        return [self.enemy] if self.enemy.is_alive() else []
+
+    def splash(self, damage):
+        """Area damage: every other enemy still in the fight takes damage."""
+        for other in self.living():
+            if other is not self.enemy:
+                print_slow(f"The blast catches the {other.name}!")
+                other.take_damage(int(damage))
+
     def player_flee(self):
         """Player attempts to flee. Chance based on player speed and items."""
         print_slow("You try to run away...")
         
-        flee_chance = 50 + (self.player.speed - 100) # Base 50%, adjusted by speed
-        
         if self.player.has_invis_watch:
-            flee_chance += 40 # Huge bonus for invis watch
             print_slow("You use your Invisibility Watch to cloak...")
             
-        if random.randint(1, 100) <= flee_chance:
+        if self.rng.randint(1, 100) <= flee_chance(self.player):
             print_slow("You successfully escaped!")
             return 'fled'
         else:
             print_slow("You couldn't get away!")
             return 'failed_flee'
 
+    # --- Utility effects (see WEAPONS 'effects') ---
+
+    def effect_heal(self, amount):
+        self.player.heal(amount)
+
+    def effect_buff(self, buff):
+        print_slow("Your next attack will be a mini-crit!")
+        self.player.combat_buff = buff
+
+    def effect_dodge(self, _):
+        print_slow("You're invincible!")
+        self.player.is_dodging = True
+
+    def effect_debuff_turns(self, turns):
+        print_slow(f"The {self.enemy.name} is soaked! They will take extra damage.")
+        self.enemy.debuff_turns = turns
+
     def enemy_turn(self):
         """Handles all logic for the enemy's action."""
         if self.player.is_dodging:
             print_slow(f"The {self.enemy.name} attacks, but you dodge it with Bonk!")
             self.player.is_dodging = False # Dodge is used up
             return 'alive'
+
+        move = enemy_move(self.enemy, self.player) # Decided before the Jarate countdown
         
         # Decrement debuff counter
         if self.enemy.debuff_turns > 0:
             self.enemy.debuff_turns -= 1
             
-        return self.enemy.attack(self.player)
+        return self.enemy.attack(self.player, self.rng, move)
+
+
+class SquadCombat(Combat):
+    """
+    A fight against several enemies at once. Everyone acts in initiative
+    order (see TurnScheduler), the player picks a target for each attack
+    (or Jarate) and explosives splash the rest of the squad.
+    """
+    def __init__(self, player, enemies, rng=None, on_turn=None, **limits):
+        super().__init__(player, enemies[0], rng, on_turn=on_turn, **limits)
+        self.enemies = list(enemies)
+        self.scheduler = TurnScheduler([player.speed] + [enemy.speed for enemy in self.enemies])
+
+    def living(self):
+        return [enemy for slot, enemy in enumerate(self.enemies, 1)
+                if enemy.is_alive() and self.scheduler.active[slot]]
+
+    def start(self):
+        """Main loop: one action per scheduler slot until one side is gone."""
+        print_slow(f"\n--- BATTLE START ---")
+        print_slow(f"A squad appears: {', '.join(enemy.name for enemy in self.enemies)}!")
+        first_turn = self.turn
+        self.player.combat_buff = None
+        self.player.is_dodging = False
+        for enemy in self.enemies:
+            enemy.debuff_turns = 0
+        self.player.reload_all()
+
+        while True:
+            slot = self.scheduler.next()
+            if slot == 0:
+                if self.on_turn:
+                    self.on_turn(self)
+                self.turn += 1
+                print_line(f"\n--- Turn {self.turn} ---")
+                print_line(f"Your HP: {self.player.current_health}/{self.player.max_health}")
+                self.show_ammo()
+                for enemy in self.living():
+                    print_line(f"{enemy.name} HP: {enemy.current_health}/{enemy.max_health}")
+                self.enemy = self.living()[0]
+                if self.player_turn() == 'fled':
+                    return self.finished('fled', first_turn)
+                for i, enemy in enumerate(self.enemies, 1):
+                    if not enemy.is_alive():
+                        self.scheduler.remove(i)
+            else:
+                self.enemy = self.enemies[slot - 1]
+                outcome = self.enemy_turn()
+                if outcome == 'dead':
+                    print_slow("You have been defeated.")
+                    return self.finished('dead', first_turn)
+                if outcome == 'retreated':
+                    print_slow(f"The {self.enemy.name} is gone!")
+                    self.scheduler.remove(slot)
+            if not self.living():
+                print_slow("You have defeated the whole squad!")
+                return self.finished('won', first_turn)
+
+
+def encounter_enemies(encounter):
+    """Fresh Enemies for a map encounter: one enemy key, or a tuple of them for a squad."""
+    return [Enemy(encounter)] if isinstance(encounter, str) else [Enemy(key) for key in encounter]
 
 
 # ### Story & Map Data ###
 
-MAP_DUSTBOWL = {
-    'start': {
-        'description': "You're at the RED spawn for Dustbowl, Stage 1. The first control point is just ahead, past a narrow hallway.",
-        'options': {
-            '1': ("Charge through the main hallway.", 'hallway'),
-            '2': ("Try the side route through the small building.", 'side_route'),
-        }
-    },
-    # --- Main Path ---
-    'hallway': {
-        'description': "You push into the main chokepoint. It's a meatgrinder! A BLU Soldier Bot spots you!",
-        'encounter': 'soldier_bot',
-        'on_win': 'hallway_clear',
-        'on_flee': 'start'
-    },
-    'hallway_clear': {
-        'description': "You clear the hallway. You can see the control point ahead. You spot a small health pack in the corner.",
-        'item': ('health', 25),
-        'options': {
-            '1': ("Push onto the control point.", 'point_a'),
-            '2': ("Fall back to spawn to regroup.", 'start') # Go back
-        }
-    },
-    
-    # --- Side Path ---
-    'side_route': {
-        'description': "You sneak into the side building. It's quiet... too quiet. You see a BLU Scout Bot zip past the exit.",
-        'options': {
-            '1': ("Ambush the Scout.", 'side_ambush'),
-            '2': ("Wait for him to leave.", 'side_wait'),
-            '3': ("Go back to the main hallway.", 'hallway')
-        }
-    },
-    'side_ambush': {
-        'description': "You jump out at the Scout Bot!",
-        'encounter': 'scout_bot',
-        'on_win': 'side_exit',
-        'on_flee': 'side_route'
-    },
-    'side_wait': {
-        'description': "You wait a moment. The coast seems clear. You emerge right next to the control point.",
-        'options': {
-            '1': ("Push onto the control point.", 'point_a')
-        }
-    },
-    'side_exit': {
-        'description': "You defeated the Scout. The path is clear and you emerge near the control point. You find an ammo pack.",
-        'item': ('ammo', 50),
-        'options': {
-            '1': ("Push onto the control point.", 'point_a')
-        }
-    },
-    
-    # --- The Point & Endings ---
-    'point_a': {
-        'description': "You're on the control point! But it's not undefended. A massive BLU Sentry Nest is firing at you, and a Heavy Bot is protecting it!",
-        'encounter': 'heavy_bot',
-        'on_win': 'point_a_sentry',
-        'on_flee': 'hallway' # Flee back to the choke
-    },
-    'point_a_sentry': {
-        'description': "The Heavy is down, but that Sentry is still active! It swivels and locks onto you!",
-        'encounter': 'sentry_gun_boss',
-        'on_win': 'ENDING_WIN',
-        'on_flee': 'hallway'
-    },
-    
-    # --- Game Endings ---
-    'GAME_OVER_LOSE': {
-        'ending': "You fought well, but the BLU team was too much. You collapse as the world fades to black...\n\n--- DEFEAT ---"
-    },
-    'ENDING_WIN': {
-        'ending': "You smash the Sentry Nest to pieces! The control point is yours! The Administrator is pleased.\n\n--- VICTORY ---"
-    },
-    'ENDING_WIN_SAPPER': {
-        'ending': "You deftly slap your Sapper onto the Sentry. It sputters, sparks, and dies in a pathetic heap. The point is yours!\n\n--- VICTORY (SPY) ---"
-    },
-    'ENDING_FLEE_FINAL': {
-        'description': "You decide this fight isn't for you. You run all the way back to spawn and lock the door.",
-        'ending': "You may have survived, but you failed the mission. Better luck next time, mercenary.\n\n--- COWARD'S ENDING ---"
+def class_options(class_key):
+    """EXTRA_OPTIONS for one class: location_key -> {choice: (text, target)}."""
+    name = CLASSES[class_key]['name']
+    return {location_key: {choice: (text.replace('{class}', name), target)
+                           for choice, text, target, classes in extras if classes is None or class_key in classes}
+            for location_key, extras in EXTRA_OPTIONS.items()}
+
+# EXTRA_OPTIONS resolved per class: class_key -> location_key -> {choice: (text, target)}
+CLASS_OPTIONS = LazyTable('options', class_options)
+
+# Targets of the extra options, so the compiler can check them
+DUSTBOWL_EXTRA_LINKS = {key: [extra[2] for extra in extras] for key, extras in EXTRA_OPTIONS.items()}
+
+def compile_named_map(name):
+    return compile_map(MAP_DATA[name], enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS)
+
+# Every map of MAP_DATA, compiled and validated once; sessions keep their own changes in a MapOverlay
+MAPS = LazyTable('map', compile_named_map, CompiledMap.from_data)
+
+def __getattr__(name):
+    # game.DUSTBOWL (and from game import DUSTBOWL) compiles the map only when asked for
+    if name == 'DUSTBOWL':
+        return MAPS['dustbowl']
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def location_options(location, player):
+    """A copy of a location's options, with any the player's class adds there."""
+    current_options = dict(location.options)
+    current_options.update(CLASS_OPTIONS[player.class_key].get(location.key, {}))
+    return current_options
+
+
+# ### Content Bundle ###
+
+EFFECTS = ('heal', 'buff', 'dodge', 'debuff_turns')
+POLICY_CONDITIONS = ('own_hp', 'player_hp', 'player_hp_min', 'soaked', 'buffed')
+
+def validate_content():
+    """Every fault in content.py that the map compiler doesn't catch, as a list of problems."""
+    problems = []
+    for key, weapon in WEAPONS.items():
+        low, high = weapon['damage']
+        if not 0 <= low <= high:
+            problems.append(f"weapon {key}: damage range {low}-{high}")
+        if not 0 <= weapon['accuracy'] <= 100:
+            problems.append(f"weapon {key}: accuracy {weapon['accuracy']}")
+        if not 0 <= weapon.get('clip', 0) < 256: # Kept in a byte array
+            problems.append(f"weapon {key}: clip {weapon['clip']}")
+        problems += [f"weapon {key}: unknown effect '{effect}'" for effect in weapon.get('effects', {})
+                     if effect not in EFFECTS]
+    for class_key, cls in CLASSES.items():
+        if class_key not in WEAPON_CHOICES:
+            problems.append(f"class {class_key}: no weapon choices")
+        problems += [f"class {class_key}: unknown item '{item}'" for item in cls.get('items', ()) if item not in WEAPONS]
+    for class_key, slots in WEAPON_CHOICES.items():
+        if class_key not in CLASSES:
+            problems.append(f"weapon choices: unknown class '{class_key}'")
+        for slot, keys in slots.items():
+            if slot not in LOADOUT_SLOTS:
+                problems.append(f"{class_key}: unknown slot '{slot}'")
+            problems += [f"{class_key} {slot}: unknown weapon '{key}'" for key in keys if key not in WEAPONS]
+    for key, enemy in ENEMIES.items():
+        if enemy.get('policy', 'brawler') not in ENEMY_POLICIES:
+            problems.append(f"enemy {key}: unknown policy '{enemy['policy']}'")
+    for policy, rules in ENEMY_POLICIES.items():
+        for name, conditions in rules:
+            if name not in ENEMY_MOVES:
+                problems.append(f"policy {policy}: unknown move '{name}'")
+            problems += [f"policy {policy}: unknown condition '{condition}'" for condition in conditions
+                         if condition not in POLICY_CONDITIONS]
+    for location_key, extras in EXTRA_OPTIONS.items():
+        for choice, _, _, classes in extras:
+            problems += [f"extra option {location_key} '{choice}': unknown class '{class_key}'"
+                         for class_key in classes or () if class_key not in CLASSES]
+    return problems
+
+def build_tables():
+    """
+    Validates the content and builds every LazyTable's entries, for the
+    bundle: {table: {key: value}}. Raises ContentError listing every fault,
+    map faults included.
+    """
+    problems = validate_content()
+    if problems: # Compiling broken content would only fail on the first fault
+        raise ContentError(problems)
+    maps = {}
+    for name in MAP_DATA:
+        try:
+            maps[name] = compile_named_map(name).to_data()
+        except MapError as e:
+            problems += [f"map {name}: {problem}" for problem in e.problems]
+    if problems:
+        raise ContentError(problems)
+    return {
+        'ammo_slots': {class_key: ammo_slot_table(class_key) for class_key in WEAPON_CHOICES},
+        'enemy_ai': {key: encode_enemy_ai(compile_enemy_ai(enemy)) for key, enemy in ENEMIES.items()},
+        'options': {class_key: class_options(class_key) for class_key in CLASSES},
+        'map': maps,
     }
-}
+
+# Opened on the first LazyTable lookup: importing game alone doesn't touch the bundle file
+BUNDLE = Bundle(build_tables)
 
 
 # ### Main Game Logic ###
 
-def main():
-    """Main function to run the game."""
+# ending: the ending's location key, or None if the run was interrupted
+RunResult = namedtuple('RunResult', ['ending', 'steps', 'turns', 'player_hp'])
+
+def main(save_path=None, load_path=None, game_map=None):
+    """
+    Main function to run the game. With save_path the run is saved at every
+    location and every combat turn; load_path resumes a saved run. game_map
+    is a CompiledMap to play instead of Dustbowl (see mapgen.py).
+    Returns a RunResult: the ending reached, locations visited, combat turns
+    played and the player's HP at the end.
+    """
     global player # Make player global for get_input to access
+    started = time.perf_counter()
+    if save_path or load_path:
+        import snapshot # Imports game, so it can't be imported at the top
     
     clear_screen()
     print_slow("========================================")
     print_slow("   Welcome to TF2: The Text Adventure   ", 0.02)
     print_slow("========================================", 0.02)
 
+    ending, steps, turns = None, 0, 0
+    dwell = None # (location key, time it was entered), only while instrumentation is on
     try:
-        player = Player("New Merc")
-        player.choose_class()
-        player.equip_loadout() # New step: Choose weapons
-        player.show_stats()
-        player.show_inventory()
-        print_slow("\n(Type 'stats' or 'inventory' at most prompts to check your status.)")
-
-        # Simple map choice for now, just loads Dustbowl
-        print_slow("\nLoading map: pl_dustbowl (Stage 1)...")
-        current_map = MAP_DUSTBOWL
-        current_location_key = 'start'
-        
-        # Add a "flee" option to the start
-        current_map['start']['options']['3'] = ("This is too much for me. I quit!", 'ENDING_FLEE_FINAL')
+        saved_fight = None
+        if load_path:
+            saved = snapshot.load(load_path)
+            player, current_location_key, overlay = saved.player, saved.location_key, saved.overlay
+            if saved.enemy:
+                saved_fight = (saved.enemy, saved.turn)
+            print_slow(f"\nWelcome back, {player.name}. Resuming your run...")
+        else:
+            player = Player("New Merc")
+            player.choose_class()
+            player.equip_loadout() # New step: Choose weapons
+            player.show_stats()
+            player.show_inventory()
+            print_slow("\n(Type 'stats' or 'inventory' at most prompts to check your status.)")
+
+            if game_map is None:
+                print_slow("\nLoading map: pl_dustbowl (Stage 1)...")
+            else:
+                print_slow(f"\nLoading map: custom map ({len(game_map)} locations)...")
+            overlay = MapOverlay() # Items picked up and places visited in this run
+            current_location_key = 'start'
+        current_map = game_map or MAPS['dustbowl']
 
         game_over = False
 
@@ -677,81 +1274,84 @@ def main():
             try:
                 location = current_map[current_location_key]
             except KeyError:
-                print(f"Error: Map key '{current_location_key}' not found. Defaulting to 'start'.")
+                print_line(f"Error: Map key '{current_location_key}' not found. Defaulting to 'start'.")
                 current_location_key = 'start'
                 location = current_map[current_location_key]
+            overlay.visit(location)
+            steps += 1
+            if METRICS is not None:
+                now = time.perf_counter()
+                if dwell:
+                    METRICS.time('location_dwell', now - dwell[1], location=dwell[0])
+                dwell = (location.key, now)
+            if save_path and not saved_fight:
+                snapshot.save(save_path, player, current_location_key, overlay)
 
             clear_screen()
-            print("----------------------------------------")
+            print_line("----------------------------------------")
 
             # --- *** FIX IS HERE *** ---
             # CHECK FOR AN ENDING *BEFORE* PRINTING DESCRIPTION
-            if 'ending' in location:
+            if location.ending:
                 # If the ending node ALSO has a description (like the flee ending), print it.
-                if 'description' in location:
-                    print_slow(location['description'])
+                if location.description:
+                    print_slow(location.description)
                 
                 # Print the actual ending text
-                print_slow(location['ending'])
+                print_slow(location.ending)
+                ending = location.key
                 game_over = True
                 continue # Skip the rest of the loop, game is over
             # --- *** END OF FIX *** ---
 
             # If it's not an ending, print the description
-            print_slow(location['description'])
+            print_slow(location.description)
 
             # Check for an item
-            if 'item' in location:
-                player.find_item(location['item'][0], location['item'][1])
-                # Remove item after pickup
-                del location['item']
+            if overlay.has_item(location):
+                player.find_item(location.item[0], location.item[1])
+                # Remove item after pickup (for this run only)
+                overlay.take_item(location)
 
             # Check for an encounter
-            if 'encounter' in location:
-                enemy = Enemy(location['encounter'])
-                combat = Combat(player, enemy)
+            if location.encounter:
+                enemies, turn = ([saved_fight[0]], saved_fight[1]) if saved_fight else (encounter_enemies(location.encounter), 0)
+                saved_fight = None
+                autosave = None
+                if save_path and len(enemies) == 1: # Squad fights restart from the location instead
+                    autosave = lambda c: snapshot.save(save_path, player, location.key, overlay, c.enemy, c.turn)
+                if len(enemies) == 1:
+                    combat = Combat(player, enemies[0], turn=turn, on_turn=autosave)
+                else:
+                    combat = SquadCombat(player, enemies)
                 result = combat.start()
+                turns += combat.turn - turn
                 
                 if result == 'won':
-                    current_location_key = location['on_win']
+                    current_location_key = location.on_win
                 elif result == 'dead':
                     current_location_key = 'GAME_OVER_LOSE'
                 elif result == 'fled':
-                    current_location_key = location['on_flee']
+                    current_location_key = location.on_flee
                 
                 continue # Move to the next loop iteration
 
             # Handle player choices
-            if 'options' in location:
-                # Create a temporary copy of options for this instance
-                current_options = location['options'].copy()
-                class_name = player.player_class['name']
-                
-                # --- Add Class-Specific Options ---
-                
-                # Spy Sapper option
-                if current_location_key == 'point_a_sentry' and class_name == 'Spy':
-                    current_options['s'] = ("(Spy) Use your Sapper to disable the Sentry!", 'ENDING_WIN_SAPPER')
-                
-                # Spy Invis option
-                if current_location_key == 'hallway' and class_name == 'Spy':
-                    current_options['s'] = ("(Spy) Use your Invis Watch to sneak past the Soldier.", 'hallway_clear') # Bypass fight
+            if location.options:
+                current_options = location_options(location, player)
                 
-                # Soldier/Demo Jump option
-                if current_location_key == 'start' and (class_name == 'Soldier' or class_name == 'Demoman'):
-                    current_options['j'] = (f"({class_name}) Explosive jump over the side building.", 'side_exit') # Shortcut!
-                
-                # --- End Class-Specific Options ---
-                
-                print("\nWhat do you do?")
+                print_line("\nWhat do you do?")
                 valid_choices = current_options.keys()
                 for key, value in current_options.items():
-                    print(f"  {key}. {value[0]}")
+                    print_line(f"  {key}. {value[0]}")
                 
                 # Get validated input
                 while True:
                     player_choice = get_input("Enter your choice:")
                     
+                    if METRICS is not None and player_choice not in valid_choices:
+                        METRICS.count('reprompts', where='main')
+
                     if player_choice == 'stats':
                         player.show_stats()
                         continue # Re-show prompt
@@ -763,13 +1363,78 @@ def main():
                         current_location_key = current_options[player_choice][1]
                         break # Valid choice, exit input loop
                     else:
-                        print("That's not a valid command.")
+                        print_line("That's not a valid command.")
                         
     except (KeyboardInterrupt, EOFError):
         print_slow("\nGame interrupted. Exiting.")
-        sys.exit()
+    RENDERER.flush()
+    if METRICS is not None:
+        now = time.perf_counter()
+        if dwell:
+            METRICS.time('location_dwell', now - dwell[1], location=dwell[0])
+        METRICS.time('session', now - started)
+        METRICS.count('runs', ending=ending or 'interrupted')
+    return RunResult(ending, steps, turns, player.current_health if player else 0)
+
+def cli(argv=None):
+    """The command line: sets up output, input, dice and hints from argv, then plays main()."""
+    import argparse # Only the command line needs it, and it's a large share of import time
+    parser = argparse.ArgumentParser(description="TF2: The Text Adventure")
+    parser.add_argument('--text', choices=Renderer.MODES, default='typewriter',
+                        help="instant, typewriter (default) or budget (typed in chunks, capped per message)")
+    parser.add_argument('--seed', default=None, help="seed for every roll, to play the same dice again")
+    parser.add_argument('--record', metavar='FILE', help="save every roll to FILE when the game ends")
+    parser.add_argument('--replay', metavar='FILE', help="roll the dice saved with --record")
+    parser.add_argument('--save', metavar='FILE', help="save the run to FILE as you play")
+    parser.add_argument('--load', metavar='FILE', help="resume the run saved in FILE")
+    parser.add_argument('--script', metavar='FILE', help="answer the prompts from FILE (one answer per line)")
+    parser.add_argument('--write-script', metavar='FILE', help="save your answers to FILE when the game ends")
+    parser.add_argument('--metrics', metavar='FILE', help="record timings and counters to FILE (JSON lines) and a .prom file")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="seconds between --metrics snapshots")
+    parser.add_argument('--campaign', type=int, metavar='STAGES', help="play a generated campaign of STAGES stages")
+    parser.add_argument('--map-seed', default='0', help="seed for --campaign")
+    parser.add_argument('--map', metavar='FILE', help="play a map file written by mapfile.py, read as you go")
+    parser.add_argument('--no-hints', action='store_true', help="don't mark the recommended weapons at the loadout prompt")
+    args = parser.parse_args(argv)
+    set_renderer(Renderer(args.text))
+    if args.script:
+        set_input(ScriptedInput.load(args.script))
+    elif args.write_script:
+        set_input(ConsoleInput(log=[]))
+    if args.replay:
+        set_rolls(ReplayRolls.load(args.replay))
+    else:
+        set_rolls(RollService(args.seed, record=bool(args.record)))
+    exporter = None
+    if args.metrics:
+        set_metrics(Metrics())
+        exporter = Exporter(METRICS, *export_paths(args.metrics), args.metrics_interval).start()
+    if not args.no_hints:
+        from optimizer import HintAdvisor # Imports game, so it can't be imported at the top
+        set_advisor(HintAdvisor())
+    campaign = None
+    if args.map:
+        from mapfile import MapFile
+        campaign = MapFile(args.map)
+    elif args.campaign:
+        import mapgen # Imports game, so it can't be imported at the top
+        campaign = mapgen.compile_campaign(args.campaign, args.map_seed)
+    try:
+        main(args.save, args.load, campaign)
+    finally:
+        if exporter:
+            exporter.stop()
+        if args.record and not args.replay:
+            ROLLS.save(args.record)
+        if args.write_script and not args.script:
+            with open(args.write_script, 'w') as f:
+                f.write(f"# seed: {ROLLS.seed}\n") # playthrough.py rolls the same dice again
+                f.writelines(f"{answer}\n" for answer in INPUT.log)
 
 # Global player variable needed for the helper function
 player = None
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Run as a script, this file is __main__ rather than game, and the tools cli() imports
+    # (optimizer, mapgen, snapshot) import game: play on that module, not a second copy
+    import game
+    game.cli()
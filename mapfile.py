@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk maps for TF2: The Text Adventure.
+A map file holds every location of a map as its own record, plus an offset
+table and a hash index from location key to record, so a MapFile can be
+opened through mmap in constant time and read one location at a time:
+
+    write_map('campaign.tfmap', mapgen.generate(125000, seed=7))
+    game_map = MapFile('campaign.tfmap', cache_size=4096)
+    game.main(game_map=game_map)
+
+Nodes come back as mapgraph.MapNode, like a CompiledMap's, and are kept in
+a bounded LRU cache (cache_size decoded nodes); everything else stays in
+the page cache. MapFile has what main() needs from a map (lookup by key,
+len) but none of CompiledMap's whole-map analysis.
+
+Layout (little-endian):
+    header   magic, version, node count, start node, index slots,
+             offset table position, index position
+    records  one compact JSON array per node, in map order
+    offsets  node count + 1 record offsets (uint64)
+    index    slots key hashes (uint64), then slots node numbers + 1 (uint32; 0 = empty)
+
+Run this file to build a map file and time it:
+    python mapfile.py campaign.tfmap --stages 125000    # 1M locations
+    python mapfile.py dustbowl.tfmap --dustbowl --play 100
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from array import array
+from functools import lru_cache
+
+from mapgraph import LOSE_KEY, MapError, MapNode, encounter_problems
+
+MAGIC = b'TFMP'
+VERSION = 1
+HEADER = struct.Struct('<4sBIIIQQ')
+CACHE_SIZE = 4096 # Decoded nodes kept per MapFile
+
+
+def key_hash(key):
+    """Stable 64-bit hash of a location key (Python's hash() changes between runs)."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+def encode_location(key, location):
+    """One location as a record: a JSON array in MapNode's field order, without the index."""
+    options = [[choice, text, target] for choice, (text, target) in location.get('options', {}).items()]
+    return json.dumps([key, location.get('description'), options, location.get('encounter'),
+                       location.get('on_win'), location.get('on_flee'), location.get('item'),
+                       location.get('ending')], separators=(',', ':')).encode()
+
+def decode_location(index, record):
+    key, description, options, encounter, on_win, on_flee, item, ending = json.loads(record)
+    if isinstance(encounter, list):
+        encounter = tuple(encounter) # A squad
+    return MapNode(index, key, description, tuple((choice, (text, target)) for choice, text, target in options),
+                   encounter, on_win, on_flee, tuple(item) if item else None, ending)
+
+
+# ### Writing ###
+
+def write_map(path, locations, start='start', enemies=None, extra_links=None):
+    """
+    Writes (key, location) pairs (a map dict's items(), or mapgen.generate)
+    to path as they arrive. Only fixed-size numbers per location are kept
+    in memory. Raises MapError, leaving path untouched, if any target,
+    encounter or dead end is broken, like mapgraph.compile_map.
+    Returns the number of locations written.
+    """
+    hashes = array('Q')
+    offsets = array('Q')
+    targets = array('Q') # Hashes of every key a location points to...
+    sources = array('I') # ...and the location pointing to it
+    problems = []
+    temp = f"{path}.tmp"
+    try:
+        with open(temp, 'wb') as f:
+            f.write(bytes(HEADER.size)) # Filled in at the end
+            for node, (key, location) in enumerate(locations):
+                offsets.append(f.tell())
+                hashes.append(key_hash(key))
+                f.write(encode_location(key, location))
+                encounter = location.get('encounter')
+                links = [target for _, target in location.get('options', {}).values()]
+                links += (extra_links or {}).get(key, ())
+                if encounter:
+                    problems += encounter_problems(key, encounter, enemies)
+                    for field in ('on_win', 'on_flee'):
+                        if field in location:
+                            links.append(location[field])
+                        else:
+                            problems.append(f"{key}: encounter has no {field}")
+                    links.append(LOSE_KEY)
+                elif not location.get('options') and not location.get('ending'):
+                    problems.append(f"{key}: dead end (no options, encounter or ending)")
+                for target in links:
+                    targets.append(key_hash(target))
+                    sources.append(node)
+            count = len(offsets)
+            offsets.append(f.tell())
+
+            # Open addressing with linear probing, at most half full
+            slots = 1
+            while slots < 2 * count:
+                slots *= 2
+            slot_hashes = array('Q', bytes(8 * slots))
+            slot_nodes = array('I', bytes(4 * slots))
+            for node, h in enumerate(hashes):
+                i = h & (slots - 1)
+                while slot_nodes[i]:
+                    if slot_hashes[i] == h:
+                        problems.append(f"location {node}: duplicate key (or a 64-bit hash clash)")
+                        break
+                    i = (i + 1) & (slots - 1)
+                slot_hashes[i] = h
+                slot_nodes[i] = node + 1
+
+            def find(h):
+                i = h & (slots - 1)
+                while slot_nodes[i]:
+                    if slot_hashes[i] == h:
+                        return slot_nodes[i] - 1
+                    i = (i + 1) & (slots - 1)
+                return None
+
+            start_node = find(key_hash(start)) if count else None
+            if start_node is None:
+                problems.append(f"start location '{start}' is missing")
+            missing = [(sources[j], h) for j, h in enumerate(targets) if find(h) is None]
+
+            offsets_at = f.tell()
+            offsets.tofile(f)
+            index_at = f.tell()
+            slot_hashes.tofile(f)
+            slot_nodes.tofile(f)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, count, start_node or 0, slots, offsets_at, index_at))
+
+        if missing:
+            # Only now are the records read back, to name what is broken
+            with open(temp, 'rb') as f:
+                data = f.read()
+            named = {}
+            for node, h in missing:
+                location = decode_location(node, data[offsets[node]:offsets[node + 1]])
+                links = [target for _, (_, target) in location.options] + [location.on_win, location.on_flee, LOSE_KEY]
+                links += (extra_links or {}).get(location.key, ())
+                for target in links:
+                    if target is not None and key_hash(target) == h:
+                        named[location.key, target] = f"{location.key}: points to unknown location '{target}'"
+            problems += named.values()
+        if problems:
+            raise MapError(problems)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return count
+
+
+# ### Reading ###
+
+class MapFile:
+    """
+    A map file opened through mmap. Locations are decoded on first use and
+    kept in an LRU cache of cache_size nodes; stats() reports its hits and misses.
+    """
+    def __init__(self, path, cache_size=CACHE_SIZE):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.map, 'madvise'): # Lookups jump around; don't read ahead (Python 3.8+, not Windows)
+            self.map.madvise(mmap.MADV_RANDOM)
+        magic, version, self.count, self.start, self.slots, offsets_at, index_at = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} map file")
+        view = memoryview(self.map)
+        self.offsets = view[offsets_at:offsets_at + 8 * (self.count + 1)].cast('Q')
+        self.slot_hashes = view[index_at:index_at + 8 * self.slots].cast('Q')
+        self.slot_nodes = view[index_at + 8 * self.slots:index_at + 12 * self.slots].cast('I')
+        view.release()
+        self.lookup = lru_cache(maxsize=cache_size)(self.read)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, key):
+        """The node for a location key. Raises KeyError like a CompiledMap."""
+        return self.lookup(key)
+
+    def read(self, key):
+        """Finds and decodes one node, bypassing the cache."""
+        h = key_hash(key)
+        mask = self.slots - 1
+        i = h & mask
+        while True:
+            node = self.slot_nodes[i]
+            if not node:
+                raise KeyError(key)
+            if self.slot_hashes[i] == h:
+                found = self.node(node - 1)
+                if found.key == key:
+                    return found
+            i = (i + 1) & mask
+
+    def node(self, index):
+        """The node at an index (uncached)."""
+        return decode_location(index, self.map[self.offsets[index]:self.offsets[index + 1]])
+
+    def clear(self):
+        """Empties the node cache and resets its stats."""
+        self.lookup.cache_clear()
+
+    def stats(self):
+        """Node cache hits, misses, nodes held and capacity."""
+        info = self.lookup.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'capacity': info.maxsize}
+
+    def close(self):
+        self.lookup.cache_clear()
+        for view in (self.offsets, self.slot_hashes, self.slot_nodes):
+            view.release()
+        self.map.close()
+
+
+# ### Main ###
+
+def max_rss_mb():
+    """Peak resident memory of this process, on Unix; else None."""
+    try:
+        import resource # Unix only
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def anon_rss_mb():
+    """Resident memory not backed by a file (so not the mapped map file), on Linux; else None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and time an on-disk map file.")
+    parser.add_argument('path')
+    parser.add_argument('--stages', type=int, default=0, help="first write a generated campaign of this many stages")
+    parser.add_argument('--seed', default='0', help="campaign seed for --stages")
+    parser.add_argument('--dustbowl', action='store_true', help="first write the built-in Dustbowl map")
+    parser.add_argument('--cache', type=int, default=CACHE_SIZE, help="decoded nodes to keep in memory")
+    parser.add_argument('--lookups', type=int, default=100000, help="random lookups to time")
+    parser.add_argument('--play', type=int, default=0, metavar='N', help="time N random playthroughs of main() on the file")
+    args = parser.parse_args(argv)
+
+    if args.stages or args.dustbowl:
+        from game import ENEMIES, MAP_DUSTBOWL, DUSTBOWL_EXTRA_LINKS
+        start = time.perf_counter()
+        if args.dustbowl:
+            locations = MAP_DUSTBOWL.items()
+        else:
+            import mapgen
+            locations = mapgen.generate(args.stages, args.seed)
+        count = write_map(args.path, locations, enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS)
+        peak = max_rss_mb()
+        print(f"Wrote {count} locations ({os.path.getsize(args.path) / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s"
+              + (f", peak memory {peak:.0f} MB" if peak is not None else ""))
+
+    rss = anon_rss_mb()
+    start = time.perf_counter()
+    game_map = MapFile(args.path, args.cache)
+    print(f"Opened {len(game_map)} locations in {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+    import random
+    rng = random.Random(0)
+    keys = [game_map.node(rng.randrange(len(game_map))).key for _ in range(min(args.lookups, 10000))]
+    start = time.perf_counter()
+    for i in range(args.lookups):
+        game_map[keys[i % len(keys)]]
+    seconds = time.perf_counter() - start
+    stats = game_map.stats()
+    print(f"{args.lookups} lookups of {len(keys)} keys: {seconds / args.lookups * 1e6:.2f} us each, "
+          f"{stats['hits']} hits, {stats['misses']} misses, {stats['size']}/{stats['capacity']} cached")
+    if rss is not None:
+        print(f"Private memory grew {anon_rss_mb() - rss:.1f} MB while reading (mapped file pages not counted)")
+
+    if args.play:
+        from mapgen import play_runs
+        game_map.clear()
+        steps, seconds = play_runs(game_map, args.play, args.seed)
+        stats = game_map.stats()
+        print(f"{args.play} playthroughs, {steps} steps in {seconds:.2f}s ({steps / seconds:.0f} steps/s), "
+              f"cache {stats['hits']} hits / {stats['misses']} misses")
+    game_map.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Procedural campaign generator for TF2: The Text Adventure.
+Builds Dustbowl-style maps of any length from a seed: a chain of stages,
+each a copy of Stage 1's layout (hallway fight or side route, then the
+control point), ending with a Sentry Nest boss. Locations use the same
+schema as MAP_DUSTBOWL and come out as a lazy stream of (key, location)
+pairs, one stage at a time, so a campaign of millions of locations never
+has to sit in memory unless it is compiled:
+
+    game_map = compile_map(dict(generate(5000, seed=7)), enemies=ENEMIES,
+                           extra_links=DUSTBOWL_EXTRA_LINKS)
+
+Stage 1 keeps Dustbowl's location keys, so the class options in
+game.EXTRA_OPTIONS (Spy sapper and invis, Soldier/Demoman jump, quitting at
+the start) work on every campaign.
+
+Difficulty is the chance that a typical merc loses a fight. Every enemy in
+ENEMIES is rated that way by engine fights (every class, first loadout,
+greedy play), and each encounter picks enemies near a target that ramps
+from the first stage to the last. With squads > 0, that share of control
+points is held by a squad: the guard plus an easier bot, fought together.
+
+Usage:
+    python mapgen.py --stages 25000 --seed 7            # generate, compile and report
+    python mapgen.py --stages 25000 --out campaign.jsonl  # stream to disk, one location per line
+    python mapgen.py --stages 500 --play 200             # time random playthroughs of main()
+    python mapgen.py --stages 100 --squads 0.3           # squads on about 30% of control points
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+from game import CLASSES, ENEMIES, DUSTBOWL_EXTRA_LINKS, Enemy
+from engine import GreedyPolicy, HeadlessCombat, build_player
+from mapgraph import LOSE_KEY, compile_map
+from rolls import RollService
+
+DIFFICULTY = (0.05, 0.5) # Targets for the first and last stage
+SPREAD = 0.1 # How far from the target an enemy pick usually lands
+RATING_FIGHTS = 200 # Engine fights per class and enemy when rating ENEMIES
+
+# Where each stage's fights sit relative to the stage's target: the side
+# route is a bit easier than the hallway, and the point is guarded hardest
+SLOT_OFFSETS = {'side_ambush': -0.1, 'hallway': 0.0, 'point_a': 0.1}
+SUPPORT_OFFSET = -0.2 # The second bot of a squad, relative to the stage's target
+
+HALLWAYS = ["a narrow hallway", "a collapsed tunnel", "the main chokepoint", "a long corridor", "a rail yard"]
+BUILDINGS = ["the small building", "a storage shed", "the upper balcony", "a flooded basement", "the mine office"]
+CLEAR_TEXTS = ["The way ahead is clear.", "Smoke drifts over the wreckage.", "You catch your breath.",
+               "Somewhere, a BLU announcer sounds worried."]
+
+
+# ### Calibration ###
+
+_RATINGS = {}
+
+def enemy_ratings(fights=RATING_FIGHTS, seed='mapgen'):
+    """
+    Difficulty of every enemy in ENEMIES: the share of engine fights it wins
+    against each class's first loadout, played greedily. Memoized.
+    """
+    from simulate import all_loadouts # simulate imports multiprocessing; only needed here
+    key = (fights, seed)
+    if key not in _RATINGS:
+        rng = RollService(seed, block=4096)
+        ratings = {}
+        for enemy_key in ENEMIES:
+            losses = 0
+            for class_key in CLASSES:
+                loadout = all_loadouts(class_key)[0]
+                for _ in range(fights):
+                    result = HeadlessCombat(build_player(class_key, loadout), Enemy(enemy_key), GreedyPolicy(), rng).run()
+                    losses += result.outcome != 'won'
+            ratings[enemy_key] = losses / (fights * len(CLASSES))
+        _RATINGS[key] = ratings
+    return _RATINGS[key]
+
+def pick_enemy(rng, ratings, target):
+    """An enemy key drawn with weights falling off with its rating's distance from target."""
+    keys = list(ratings)
+    weights = [max(math.exp(-((ratings[k] - target) / SPREAD) ** 2), 1e-12) for k in keys]
+    return rng.choices(keys, weights)[0]
+
+def encounter_rating(ratings, encounter):
+    """Rating of an encounter; a squad counts like its bots fought one after another."""
+    if isinstance(encounter, str):
+        return ratings[encounter]
+    survive = 1.0
+    for key in encounter:
+        survive *= 1 - ratings[key]
+    return 1 - survive
+
+def boss_key(ratings):
+    """The final boss: the hardest 'special' enemy, or the hardest of all if there are none."""
+    bosses = [key for key in ratings if 'special' in ENEMIES[key]] or list(ratings)
+    return max(bosses, key=ratings.get)
+
+
+# ### Generation ###
+
+def stage_key(key, stage):
+    """Stage 1 keeps Dustbowl's keys; later stages add their number."""
+    return key if stage == 0 else f"{key}_{stage}"
+
+def generate(stages, seed=0, difficulty=DIFFICULTY, ratings=None, squads=0.0):
+    """
+    Yields (key, location) for a campaign of stages stages, in map order:
+    the start first, then each stage, the boss and the endings. squads is
+    the chance a control point is held by two bots. The same seed,
+    difficulty, ratings and squads always give the same campaign.
+    """
+    rng = random.Random(f"mapgen:{seed}")
+    ratings = ratings or enemy_ratings()
+    first, last = difficulty
+    for stage in range(stages):
+        target = first + (last - first) * (stage / (stages - 1) if stages > 1 else 0)
+        yield from generate_stage(rng, ratings, stage, stages, target, squads)
+
+    boss = boss_key(ratings)
+    yield 'point_a_sentry', {
+        'description': f"The last point is within reach, but a {ENEMIES[boss]['name']} guards it! It locks onto you!",
+        'encounter': boss,
+        'on_win': 'ENDING_WIN',
+        'on_flee': stage_key('hallway', stages - 1),
+    }
+    yield LOSE_KEY, {'ending': "You fought well, but the BLU team was too much. You collapse as the world fades to black...\n\n--- DEFEAT ---"}
+    yield 'ENDING_WIN', {'ending': f"The final point is yours after {stages} stage(s)! The Administrator is pleased.\n\n--- VICTORY ---"}
+    yield 'ENDING_WIN_SAPPER', {'ending': "You slap your Sapper onto the last Sentry. It sputters and dies. The campaign is won!\n\n--- VICTORY (SPY) ---"}
+    yield 'ENDING_FLEE_FINAL', {
+        'description': "You decide this campaign isn't for you. You run all the way back to spawn and lock the door.",
+        'ending': "You may have survived, but you failed the mission. Better luck next time, mercenary.\n\n--- COWARD'S ENDING ---",
+    }
+
+def generate_stage(rng, ratings, stage, stages, target, squads=0.0):
+    """The eight locations of one stage, laid out like Dustbowl Stage 1."""
+    k = lambda key: stage_key(key, stage)
+    foes = {slot: pick_enemy(rng, ratings, min(1.0, max(0.0, target + offset))) for slot, offset in SLOT_OFFSETS.items()}
+    name = lambda slot: ENEMIES[foes[slot]]['name']
+    hallway, building = rng.choice(HALLWAYS), rng.choice(BUILDINGS)
+    next_key = stage_key('start', stage + 1) if stage + 1 < stages else 'point_a_sentry'
+    back = {'3': ("Fall back to the last point you took.", stage_key('side_wait', stage - 1))} if stage else {}
+    guard = f"A {name('point_a')} is defending it!"
+    if squads and rng.random() < squads: # Drawn only with squads on, so squad-free seeds stay the same
+        support = pick_enemy(rng, ratings, min(1.0, max(0.0, target + SUPPORT_OFFSET)))
+        guard = f"A {name('point_a')} and a {ENEMIES[support]['name']} are defending it!"
+        foes['point_a'] = [foes['point_a'], support]
+
+    yield k('start'), {
+        'description': f"Stage {stage + 1} of {stages}. The next control point is past {hallway}.",
+        'options': {'1': (f"Charge through {hallway}.", k('hallway')),
+                    '2': (f"Try the side route through {building}.", k('side_route')), **back},
+    }
+    yield k('hallway'), {
+        'description': f"You push into {hallway}. A {name('hallway')} spots you!",
+        'encounter': foes['hallway'], 'on_win': k('hallway_clear'), 'on_flee': k('start'),
+    }
+    clear = {'description': f"You clear {hallway}. {rng.choice(CLEAR_TEXTS)}",
+             'options': {'1': ("Push onto the control point.", k('point_a')),
+                         '2': ("Fall back to regroup.", k('start'))}}
+    if rng.random() < 0.5 + target: # Harder stages leave more health lying around
+        clear['item'] = ('health', rng.choice((25, 25, 50)))
+    yield k('hallway_clear'), clear
+    yield k('side_route'), {
+        'description': f"You sneak into {building}. A {name('side_ambush')} is close by.",
+        'options': {'1': ("Ambush it.", k('side_ambush')),
+                    '2': ("Wait for it to leave.", k('side_wait')),
+                    '3': (f"Go back to {hallway}.", k('hallway'))},
+    }
+    yield k('side_ambush'), {
+        'description': f"You jump out at the {name('side_ambush')}!",
+        'encounter': foes['side_ambush'], 'on_win': k('side_exit'), 'on_flee': k('side_route'),
+    }
+    yield k('side_wait'), {
+        'description': "You wait a moment. The coast seems clear. You emerge next to the control point.",
+        'options': {'1': ("Push onto the control point.", k('point_a'))},
+    }
+    exit_location = {'description': "The path is clear and you emerge near the control point.",
+                     'options': {'1': ("Push onto the control point.", k('point_a'))}}
+    if rng.random() < 0.5:
+        exit_location['item'] = ('ammo', 50)
+    yield k('side_exit'), exit_location
+    yield k('point_a'), {
+        'description': f"You're on the control point! {guard}",
+        'encounter': foes['point_a'], 'on_win': next_key, 'on_flee': k('hallway'),
+    }
+
+def compile_campaign(stages, seed=0, difficulty=DIFFICULTY, ratings=None, squads=0.0):
+    """A generated campaign, compiled and validated like DUSTBOWL."""
+    return compile_map(dict(generate(stages, seed, difficulty, ratings, squads)), enemies=ENEMIES,
+                       extra_links=DUSTBOWL_EXTRA_LINKS)
+
+
+# ### Streams ###
+
+def write_jsonl(path, locations):
+    """Writes (key, location) pairs as they arrive, one JSON object per line. Returns the count."""
+    count = 0
+    with open(path, 'w') as f:
+        for key, location in locations:
+            f.write(json.dumps({'key': key, **location}) + "\n")
+            count += 1
+    return count
+
+def read_jsonl(path):
+    """Yields (key, location) pairs back from write_jsonl's file."""
+    with open(path) as f:
+        for line in f:
+            location = json.loads(line)
+            yield location.pop('key'), location
+
+
+# ### Main ###
+
+def difficulty_report(locations, ratings, buckets=4):
+    """Mean enemy rating per stretch of the campaign, from a (key, location) stream."""
+    sums, counts, order = [0.0] * buckets, [0] * buckets, []
+    for key, location in locations:
+        if location.get('encounter') and key != 'point_a_sentry':
+            order.append(encounter_rating(ratings, location['encounter']))
+    for i, rating in enumerate(order):
+        b = i * buckets // len(order)
+        sums[b] += rating
+        counts[b] += 1
+    return [sums[b] / counts[b] if counts[b] else 0.0 for b in range(buckets)]
+
+def play_runs(game_map, runs, seed):
+    """Plays runs random-input games of main() on game_map. Returns (steps, seconds)."""
+    import game
+    from game import Renderer, ScriptedInput, parse_script
+    from playthrough import random_script
+
+    devnull = open(os.devnull, 'w')
+    previous = game.set_renderer(Renderer('instant', devnull))
+    previous_rolls = game.set_rolls(RollService(f"{seed}:play", block=4096))
+    previous_input = game.INPUT
+    steps = 0
+    start = time.perf_counter()
+    try:
+        for i in range(runs):
+            game.set_input(ScriptedInput(parse_script(random_script(f"{seed}:{i}", 2000)), echo=False))
+            try:
+                steps += game.main(game_map=game_map).steps
+            except SystemExit: # 'quit' at a prompt
+                pass
+    finally:
+        game.set_input(previous_input)
+        game.set_rolls(previous_rolls)
+        game.set_renderer(previous)
+        devnull.close()
+    return steps, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a Dustbowl-style campaign.")
+    parser.add_argument('--stages', type=int, default=100, help="stages in the campaign (8 locations each)")
+    parser.add_argument('--seed', default='0')
+    parser.add_argument('--difficulty', type=float, nargs=2, default=DIFFICULTY, metavar=('FIRST', 'LAST'),
+                        help="chance a typical merc loses a fight, at the first and last stage")
+    parser.add_argument('--squads', type=float, default=0.0, metavar='SHARE', help="share of control points held by a squad")
+    parser.add_argument('--out', metavar='FILE', help="stream the campaign to FILE as JSON lines instead of compiling it")
+    parser.add_argument('--play', type=int, default=0, metavar='N', help="time N random playthroughs of main()")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    ratings = enemy_ratings()
+    print(f"Enemy ratings ({time.perf_counter() - start:.2f}s): "
+          + ", ".join(f"{key} {rating:.2f}" for key, rating in sorted(ratings.items(), key=lambda kv: kv[1])))
+
+    start = time.perf_counter()
+    if args.out:
+        count = write_jsonl(args.out, generate(args.stages, args.seed, tuple(args.difficulty), ratings, args.squads))
+        print(f"Wrote {count} locations to {args.out} in {time.perf_counter() - start:.2f}s")
+        means = difficulty_report(read_jsonl(args.out), ratings)
+    else:
+        game_map = compile_campaign(args.stages, args.seed, tuple(args.difficulty), ratings, args.squads)
+        print(f"Generated and compiled {len(game_map)} locations in {time.perf_counter() - start:.2f}s")
+        print(f"Fewest fights to win: {game_map.fewest_fights[game_map.index['ENDING_WIN']]}")
+        for warning in game_map.warnings[:5]:
+            print(f"warning: {warning}")
+        means = difficulty_report(((node.key, {'encounter': node.encounter}) for node in game_map.nodes), ratings)
+    print("Mean enemy rating by quarter: " + ", ".join(f"{mean:.2f}" for mean in means)
+          + f" (targets {args.difficulty[0]:.2f} -> {args.difficulty[1]:.2f})")
+
+    if args.play:
+        if args.out:
+            game_map = compile_map(dict(read_jsonl(args.out)), enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS)
+        steps, seconds = play_runs(game_map, args.play, args.seed)
+        print(f"{args.play} playthroughs, {steps} steps in {seconds:.2f}s ({steps / seconds:.0f} steps/s)")
+
+if __name__ == "__main__":
+    main()
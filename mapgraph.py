@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled maps for TF2: The Text Adventure.
+A map dict like MAP_DUSTBOWL is compiled once into an immutable table of
+MapNodes that every session shares. Anything a session changes (items
+picked up, places visited) lives in that session's MapOverlay instead.
+
+Compiling also validates the map (every options/on_win/on_flee target must
+exist) and precomputes, in time linear in the size of the map:
+  * an integer graph of every way out of each node
+  * shortest paths from the start, with the fights along them
+  * the fewest fights needed to reach each node
+  * which endings are still reachable from each node
+
+Run this file directly to check the built-in map, or time a generated one:
+    python mapgraph.py
+    python mapgraph.py --generate 200000
+"""
+
+import time
+from collections import deque, namedtuple
+
+LOSE_KEY = 'GAME_OVER_LOSE' # Where main() sends a player who dies in a fight
+UNREACHED = -1
+
+# options: ((choice, (text, target_key)), ...) in the map's order
+# encounter: an enemy key, a tuple of enemy keys (a squad fight) or None
+# item: (item_type, amount) or None
+MapNode = namedtuple('MapNode', ['index', 'key', 'description', 'options', 'encounter',
+                                 'on_win', 'on_flee', 'item', 'ending'])
+
+
+class MapError(ValueError):
+    """A map that cannot be played. problems lists every fault found."""
+    def __init__(self, problems):
+        super().__init__(f"{len(problems)} problem(s) in map:\n  " + "\n  ".join(problems))
+        self.problems = problems
+
+
+def encounter_problems(key, encounter, enemies):
+    """Unknown enemies in an encounter (one key or a list of keys)."""
+    squad = (encounter,) if isinstance(encounter, str) else encounter
+    return [f"{key}: unknown enemy '{enemy}'" for enemy in squad if enemies is not None and enemy not in enemies]
+
+
+class CompiledMap:
+    """
+    Read-only node table. Nodes are found by key or by integer index, and
+    edges[i] holds the indices of every node reachable in one move from node i
+    (options, on_win, on_flee and defeat).
+    """
+    def __init__(self, nodes, edges=None, start=0):
+        self.nodes = tuple(nodes)
+        self.index = {node.key: node.index for node in self.nodes}
+        self.edges = tuple(edges) if edges is not None else tuple(() for _ in self.nodes)
+        self.start = start
+        self.endings = tuple(node.index for node in self.nodes if node.ending)
+        self.warnings = []
+        self.analyze()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        """The node for a location key. Raises KeyError like the map dict did."""
+        return self.nodes[self.index[key]]
+
+    def to_data(self):
+        """The compiled map and its analysis as plain tuples, lists and dicts (see bundle.py)."""
+        data = dict(vars(self))
+        data['nodes'] = tuple(tuple(node) for node in self.nodes)
+        return data
+
+    @classmethod
+    def from_data(cls, data):
+        """A CompiledMap back from to_data(), without compiling or analyzing it again."""
+        compiled = cls.__new__(cls)
+        compiled.__dict__.update(data)
+        compiled.nodes = tuple(MapNode._make(node) for node in data['nodes'])
+        return compiled
+
+    # --- Analysis ---
+
+    def analyze(self):
+        """Fills in the shortest-path, fight-count and reachable-ending tables."""
+        n = len(self.nodes)
+        fight = [1 if node.encounter else 0 for node in self.nodes]
+
+        # Breadth-first search from the start: fewest moves to every node
+        self.distance = [UNREACHED] * n
+        self.parent = [UNREACHED] * n
+        self.path_fights = [0] * n # Fights along that shortest path, counting the node itself
+        if n:
+            self.distance[self.start] = 0
+            self.path_fights[self.start] = fight[self.start]
+            queue = deque([self.start])
+            while queue:
+                node = queue.popleft()
+                for nxt in self.edges[node]:
+                    if self.distance[nxt] == UNREACHED:
+                        self.distance[nxt] = self.distance[node] + 1
+                        self.parent[nxt] = node
+                        self.path_fights[nxt] = self.path_fights[node] + fight[nxt]
+                        queue.append(nxt)
+
+        # 0-1 BFS: entering an encounter costs one, any other move is free
+        self.fewest_fights = [UNREACHED] * n
+        if n:
+            self.fewest_fights[self.start] = fight[self.start]
+            queue = deque([self.start])
+            while queue:
+                node = queue.popleft()
+                for nxt in self.edges[node]:
+                    cost = self.fewest_fights[node] + fight[nxt]
+                    if self.fewest_fights[nxt] == UNREACHED or cost < self.fewest_fights[nxt]:
+                        self.fewest_fights[nxt] = cost
+                        if fight[nxt]:
+                            queue.append(nxt)
+                        else:
+                            queue.appendleft(nxt)
+
+        # Reachable endings as a bitmask per node (bit j = self.endings[j]).
+        # Cycles share one mask, so masks are built per strongly connected component.
+        component, count = strong_components(self.edges)
+        members = [[] for _ in range(count)]
+        for node, c in enumerate(component):
+            members[c].append(node)
+        ending_bit = {node: 1 << j for j, node in enumerate(self.endings)}
+        masks = [0] * count
+        for c in range(count): # Successor components always have lower numbers
+            mask = 0
+            for node in members[c]:
+                mask |= ending_bit.get(node, 0)
+                for nxt in self.edges[node]:
+                    mask |= masks[component[nxt]]
+            masks[c] = mask
+        self.ending_masks = [masks[c] for c in component]
+
+        for node in self.nodes:
+            if self.distance[node.index] == UNREACHED:
+                self.warnings.append(f"{node.key}: unreachable from '{self.nodes[self.start].key}'")
+            elif not self.ending_masks[node.index]:
+                self.warnings.append(f"{node.key}: no ending can be reached from here")
+
+    def path(self, key):
+        """Shortest list of location keys from the start to key, or None if unreachable."""
+        node = self.index[key]
+        if self.distance[node] == UNREACHED:
+            return None
+        keys = []
+        while node != UNREACHED:
+            keys.append(self.nodes[node].key)
+            node = self.parent[node]
+        return keys[::-1]
+
+    def reachable_endings(self, key=None):
+        """Keys of the endings still reachable from key (default: the start)."""
+        mask = self.ending_masks[self.start if key is None else self.index[key]]
+        return [self.nodes[node].key for j, node in enumerate(self.endings) if mask >> j & 1]
+
+    def route_report(self):
+        """One line per ending: shortest route length, fights on it and fewest fights overall."""
+        lines = [f"{'Ending':<24} {'Moves':>5} {'Fights':>6} {'Fewest':>6}  Route"]
+        for node in self.endings:
+            key = self.nodes[node].key
+            if self.distance[node] == UNREACHED:
+                lines.append(f"{key:<24} {'-':>5} {'-':>6} {'-':>6}  (unreachable)")
+                continue
+            lines.append(f"{key:<24} {self.distance[node]:>5} {self.path_fights[node]:>6} "
+                         f"{self.fewest_fights[node]:>6}  {' > '.join(self.path(key))}")
+        return "\n".join(lines)
+
+
+def strong_components(edges):
+    """
+    Iterative Tarjan. Returns (component per node, component count), numbered
+    so that every edge leads to a component with the same or a lower number.
+    """
+    n = len(edges)
+    order = [UNREACHED] * n
+    low = [0] * n
+    component = [UNREACHED] * n
+    stack = []
+    counter = count = 0
+    for root in range(n):
+        if order[root] != UNREACHED:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        work = [(root, 0)]
+        while work:
+            node, i = work[-1]
+            if i < len(edges[node]):
+                work[-1] = (node, i + 1)
+                nxt = edges[node][i]
+                if order[nxt] == UNREACHED:
+                    order[nxt] = low[nxt] = counter
+                    counter += 1
+                    stack.append(nxt)
+                    work.append((nxt, 0))
+                elif component[nxt] == UNREACHED:
+                    low[node] = min(low[node], order[nxt])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == order[node]:
+                while True:
+                    member = stack.pop()
+                    component[member] = count
+                    if member == node:
+                        break
+                count += 1
+    return component, count
+
+
+def compile_map(map_data, start='start', enemies=None, extra_links=None):
+    """
+    Turns a map dict (MAP_DUSTBOWL-style) into a CompiledMap. Raises MapError
+    listing every broken target, encounter or dead end. Pass enemies (e.g.
+    game.ENEMIES) to check encounter keys too (a list of keys is a squad
+    fight, compiled to a tuple), and extra_links
+    ({location_key: [target_key, ...]}) for options the game adds in code.
+    """
+    index = {key: i for i, key in enumerate(map_data)}
+    extra_links = extra_links or {}
+    problems = [f"extra links: unknown location '{key}'" for key in extra_links if key not in index]
+    nodes, edges = [], []
+
+    def target(key, source, field):
+        if key not in index:
+            problems.append(f"{source}: {field} points to unknown location '{key}'")
+            return None
+        return index[key]
+
+    for i, (key, location) in enumerate(map_data.items()):
+        options = tuple((choice, tuple(option)) for choice, option in location.get('options', {}).items())
+        item = tuple(location['item']) if 'item' in location else None
+        encounter = location.get('encounter')
+        if isinstance(encounter, list):
+            encounter = tuple(encounter) # Squads are lists in map data
+        exits = [target(option[1], key, f"option '{choice}'") for choice, option in options]
+        exits += [target(dest, key, "extra link") for dest in extra_links.get(key, ())]
+        if encounter:
+            problems += encounter_problems(key, encounter, enemies)
+            for field in ('on_win', 'on_flee'):
+                if field in location:
+                    exits.append(target(location[field], key, field))
+                else:
+                    problems.append(f"{key}: encounter has no {field}")
+            exits.append(index.get(LOSE_KEY))
+        elif not options and not location.get('ending'):
+            problems.append(f"{key}: dead end (no options, encounter or ending)")
+        nodes.append(MapNode(i, key, location.get('description'), options, encounter,
+                             location.get('on_win'), location.get('on_flee'), item, location.get('ending')))
+        edges.append(tuple(dict.fromkeys(e for e in exits if e is not None)))
+
+    if start not in index:
+        problems.append(f"start location '{start}' is missing")
+    if LOSE_KEY not in index and any(node.encounter for node in nodes):
+        problems.append(f"map has encounters but no '{LOSE_KEY}' location")
+    if problems:
+        raise MapError(problems)
+
+    compiled = CompiledMap(nodes, edges, index[start])
+    for node in nodes:
+        if node.encounter and node.options:
+            compiled.warnings.append(f"{node.key}: options are never shown on an encounter node")
+    return compiled
+
+
+class MapOverlay:
+    """
+    One session's changes to a shared map, as bitsets keyed by node index:
+    a few bytes per session no matter how many sessions share the map.
+    """
+    __slots__ = ('items_taken', 'visited')
+
+    def __init__(self, items_taken=0, visited=0):
+        self.items_taken = items_taken
+        self.visited = visited
+
+    def has_item(self, node):
+        """True if node has an item this session hasn't picked up yet."""
+        return node.item is not None and not self.items_taken >> node.index & 1
+
+    def take_item(self, node):
+        self.items_taken |= 1 << node.index
+
+    def visit(self, node):
+        self.visited |= 1 << node.index
+
+    def was_visited(self, node):
+        return bool(self.visited >> node.index & 1)
+
+
+# ### Self-check ###
+
+def generate_map(size):
+    """A synthetic map of size nodes: a long corridor of fights with side loops and a few endings."""
+    map_data = {'start': {'description': "Start.", 'options': {'1': ("Go.", 'n1')}}}
+    for i in range(1, size):
+        options = {'1': ("Forward.", f"n{i + 1}" if i + 1 < size else 'ENDING_WIN')}
+        if i > 1:
+            options['2'] = ("Back.", f"n{i - 1}")
+        if i % 1000 == 0:
+            options['3'] = ("Give up.", 'ENDING_FLEE')
+        if i % 10 == 0:
+            map_data[f"n{i}"] = {'description': "A bot!", 'encounter': 'soldier_bot',
+                                 'on_win': f"n{i}_clear", 'on_flee': f"n{i - 1}"}
+            map_data[f"n{i}_clear"] = {'description': "Clear.", 'options': options}
+        else:
+            map_data[f"n{i}"] = {'description': "A corridor.", 'options': options}
+    map_data['ENDING_WIN'] = {'ending': "You win."}
+    map_data['ENDING_FLEE'] = {'ending': "You leave."}
+    map_data[LOSE_KEY] = {'ending': "You lose."}
+    return map_data
+
+def main(argv=None):
+    import argparse # Only the command line needs it; game imports this module
+    parser = argparse.ArgumentParser(description="Validate a map and show its routes.")
+    parser.add_argument('--generate', type=int, default=0, help="time a generated map of this many locations")
+    args = parser.parse_args(argv)
+    if args.generate:
+        map_data = generate_map(args.generate)
+        start = time.perf_counter()
+        compiled = compile_map(map_data)
+        print(f"Compiled {len(compiled)} locations in {time.perf_counter() - start:.2f}s")
+        print(f"Endings reachable from start: {', '.join(compiled.reachable_endings())}")
+        print(f"Fewest fights to win: {compiled.fewest_fights[compiled.index['ENDING_WIN']]}")
+        return
+    from game import DUSTBOWL # Compiled (and validated) on first use, see game.MAPS
+    print(DUSTBOWL.route_report())
+    for warning in DUSTBOWL.warnings:
+        print(f"warning: {warning}")
+
+if __name__ == "__main__":
+    main()
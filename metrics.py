@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation for TF2: The Text Adventure.
+A Metrics object collects counters, timers and value summaries from hooks
+in game.py (and server.py). Hooks only run when metrics are switched on,
+so a game without them pays one `is None` check per hook:
+
+    metrics = Metrics()
+    game.set_metrics(metrics)
+    exporter = Exporter(metrics, 'run.metrics.jsonl', 'run.prom', interval=10).start()
+    ...
+    exporter.stop() # Writes a final snapshot
+
+What the hooks record:
+    session_seconds          whole runs of main() / server sessions
+    print_slow_sleep_seconds time print_slow spends asleep between characters
+    input_wait_seconds       time spent waiting on the player at a prompt
+    location_dwell_seconds   time at each location (label: location)
+    prompts / reprompts      prompts shown, and re-shown after stats or bad input (label: where)
+    hesitations              combat turns lost to the input budget or turn timeout
+    fights                   finished fights (label: outcome)
+    combat_turns             turns per fight (summary)
+    combat_rolls             dice rolled per fight (summary)
+
+Logic time is what's left: session - print_slow sleep - input wait.
+"""
+
+import os
+import threading
+import time
+
+
+def metric_key(name, labels):
+    """Prometheus-style series name: name{label="value",...}."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+class Metrics:
+    """Counters, timers (count, seconds) and summaries (count, sum, min, max), keyed by series name."""
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.timers = {}
+        self.summaries = {}
+
+    def count(self, name, n=1, **labels):
+        key = metric_key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def time(self, name, seconds, **labels):
+        key = metric_key(f"{name}_seconds", labels)
+        timer = self.timers.get(key)
+        if timer is None:
+            self.timers[key] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def observe(self, name, value, **labels):
+        key = metric_key(name, labels)
+        summary = self.summaries.get(key)
+        if summary is None:
+            self.summaries[key] = [1, value, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = min(summary[2], value)
+            summary[3] = max(summary[3], value)
+
+    def timed_sleep(self, sleep, seconds):
+        """Calls sleep(seconds) and records how long it really took."""
+        start = time.perf_counter()
+        sleep(seconds)
+        self.time('print_slow_sleep', time.perf_counter() - start)
+
+    # --- Export ---
+
+    def snapshot(self):
+        """Everything so far as a JSON-ready dict. Safe to call from another thread."""
+        return {'time': round(time.time(), 3), 'uptime': round(time.time() - self.started, 3),
+                'counters': dict(self.counters),
+                'timers': {key: {'count': t[0], 'seconds': t[1]} for key, t in list(self.timers.items())},
+                'summaries': {key: {'count': s[0], 'sum': s[1], 'min': s[2], 'max': s[3]}
+                              for key, s in list(self.summaries.items())}}
+
+    def prometheus(self, prefix='tf2_'):
+        """Everything so far in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = []
+        typed = set()
+
+        def series(key, suffix, value, kind, family_suffix=''):
+            name, _, labels = key.partition('{')
+            family = prefix + name + family_suffix
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} {kind}")
+            lines.append(f"{prefix}{name}{suffix}{'{' + labels if labels else ''} {value}")
+
+        for key, value in sorted(snap['counters'].items()):
+            series(key, '_total', value, 'counter')
+        for key, timer in sorted(snap['timers'].items()):
+            series(key, '_count', timer['count'], 'summary')
+            series(key, '_sum', f"{timer['seconds']:.6f}", 'summary')
+        for key, summary in sorted(snap['summaries'].items()):
+            series(key, '_count', summary['count'], 'summary')
+            series(key, '_sum', summary['sum'], 'summary')
+        for key, summary in sorted(snap['summaries'].items()):
+            series(key, '_min', summary['min'], 'gauge', '_min')
+            series(key, '_max', summary['max'], 'gauge', '_max')
+        return "\n".join(lines) + "\n"
+
+
+class CountingRolls:
+    """Wraps a dice source (RollService, ReplayRolls, random) and counts its rolls."""
+    def __init__(self, rng):
+        self.rng = rng
+        self.rolls = 0
+
+    def randint(self, a, b):
+        self.rolls += 1
+        return self.rng.randint(a, b)
+
+    def choice(self, seq):
+        self.rolls += 1
+        return self.rng.choice(seq)
+
+
+class Exporter:
+    """
+    Writes a Metrics snapshot every interval seconds from a background
+    thread: one JSON line appended to jsonl_path, and the Prometheus text
+    file at prom_path replaced in place (for a node-exporter textfile collector).
+    """
+    def __init__(self, metrics, jsonl_path=None, prom_path=None, interval=10.0):
+        self.metrics = metrics
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop, name='metrics-exporter', daemon=True)
+        self.thread.start()
+        return self
+
+    def loop(self):
+        while not self.stopping.wait(self.interval):
+            self.export()
+
+    def export(self):
+        if self.jsonl_path:
+            import json # Only exports need it; game imports this module on every start
+            with open(self.jsonl_path, 'a') as f:
+                f.write(json.dumps(self.metrics.snapshot(), sort_keys=True) + "\n")
+        if self.prom_path:
+            temp = f"{self.prom_path}.tmp"
+            with open(temp, 'w') as f:
+                f.write(self.metrics.prometheus())
+            os.replace(temp, self.prom_path)
+
+    def stop(self):
+        """Stops the thread and writes one last snapshot."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.export()
+
+
+def export_paths(path):
+    """(JSON-lines path, Prometheus path) for a --metrics FILE argument."""
+    return path, f"{os.path.splitext(path)[0]}.prom"
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Loadout optimizer for TF2: The Text Adventure.
+Scores every loadout in a class's WEAPON_CHOICES against the fights of
+Dustbowl in order, with HP carried from one fight to the next:
+
+    optimizer = LoadoutOptimizer()
+    for score in optimizer.rank('sniper')[:3]:
+        print(score.loadout, score.clear)
+
+A loadout's score is its chance of winning every fight on the way to the
+last point, played by engine.TacticalPolicy (best attack, heals when they
+count, no fleeing), taking the better route where the map offers a choice.
+Each fight is resolved by engine fights once per starting HP and spare
+ammo (on propagate.HP_LEVELS and AMMO_LEVELS steps), so ammo spent early
+is missed later, and cached in a propagate.FightMatrices, under
+the stats of the class, the enemy and only the weapons the policy can use.
+Loadouts that differ only in weapons it never picks share their fights,
+and changing one weapon's stats only re-runs the fights that weapon is
+used in.
+
+game.py shows the best loadout as a "recommended" hint at the loadout
+prompt (see game.set_advisor) through a HintAdvisor, which keeps each
+class's ranking in a bundle file (see bundle.py): only the first game
+with a class runs its fights, and the file is rebuilt when the code they
+depend on changes.
+
+Run this file to rank every class's loadouts:
+    python optimizer.py
+    python optimizer.py --class heavy --fights 1000
+    python optimizer.py --hints    # fill the in-game hints' files for every class
+"""
+
+import itertools
+import os
+import sys
+import time
+from collections import namedtuple
+
+from bundle import HERE, SOURCES, Bundle
+from game import CLASSES
+from engine import TacticalPolicy
+from propagate import AMMO_LEVELS, FightMatrices, ammo_split, crate_share, hp_split
+from simulate import all_loadouts
+
+FIGHTS = 400 # Engine fights per cached fight and starting HP
+HINT_FIGHTS = 100 # Fewer for the in-game hint, which must not hold up the prompt
+# Files a hint ranking is computed from: a change to any of them rebuilds it
+HINT_SOURCES = SOURCES + ('engine.py', 'rolls.py', 'propagate.py', 'optimizer.py')
+HINT_DIR = os.path.join(HERE, '__pycache__')
+
+# heal: health picked up after winning the fight; ammo: the percent of a
+# full reserve an ammo crate there restocks
+Fight = namedtuple('Fight', ['enemy', 'heal', 'ammo'])
+
+# Dustbowl's fights in order. A stage with two fights is a choice of route
+# (the hallway and its health pack, or the side route and its ammo crate).
+# Sneaking past a fight (side_wait, the Spy's watch) isn't scored: every
+# stage is fought.
+DUSTBOWL_FIGHTS = (
+    (Fight('soldier_bot', 25, 0), Fight('scout_bot', 0, 50)),
+    (Fight('heavy_bot', 0, 0),),
+    (Fight('sentry_gun_boss', 0, 0),),
+)
+
+# clear: chance of winning every fight; route: the enemies fought;
+# hp: expected HP left after the last fight, given it was won
+LoadoutScore = namedtuple('LoadoutScore', ['loadout', 'clear', 'route', 'hp'])
+
+
+class LoadoutOptimizer:
+    """
+    Ranks loadouts against stages of fights (DUSTBOWL_FIGHTS by default).
+    Fight outcomes are cached in self.matrices for the optimizer's
+    lifetime; misses counts the cached fights that had to be run.
+    """
+    def __init__(self, stages=DUSTBOWL_FIGHTS, fights=FIGHTS, seed='optimizer', policy=None):
+        self.stages = stages
+        self.matrices = FightMatrices(fights, seed, policy or TacticalPolicy())
+
+    @property
+    def misses(self):
+        return self.matrices.misses
+
+    def outcome(self, signature, class_key, loadout, enemy_key, start_hp, ammo=AMMO_LEVELS):
+        """
+        {(HP left, ammo step left): chance} over won fights from start_hp
+        and ammo, on HP_LEVELS and AMMO_LEVELS steps. Whatever is missing
+        from 1 is the chance of losing.
+        """
+        row = self.matrices.row(signature, class_key, loadout, enemy_key, start_hp, ammo)
+        return {(hp, left): chance for (outcome, hp, left), chance in row.items() if outcome == 'won'}
+
+    def score(self, class_key, loadout):
+        """The loadout's LoadoutScore over the best route through the stages."""
+        signature = self.matrices.signature(class_key, loadout)
+        max_hp = CLASSES[class_key]['health']
+        slots = self.matrices.guns(class_key, loadout)
+        best = None
+        for route in itertools.product(*self.stages):
+            chances = {(max_hp, AMMO_LEVELS): 1.0} # (HP, ammo step) -> chance
+            for fight in route:
+                after = {}
+                for (start_hp, ammo), chance in chances.items():
+                    for (hp, left), won in self.outcome(signature, class_key, loadout, fight.enemy, start_hp, ammo).items():
+                        healed = hp_split(min(max_hp, hp + fight.heal), max_hp) if fight.heal else [(hp, 1.0)]
+                        stocked = (ammo_split(left / AMMO_LEVELS + crate_share(slots, fight.ammo))
+                                   if fight.ammo else [(left, 1.0)])
+                        for (hp, share), (ammo, ammo_share) in itertools.product(healed, stocked):
+                            after[hp, ammo] = after.get((hp, ammo), 0) + chance * won * share * ammo_share
+                chances = after
+            clear = sum(chances.values())
+            if best is None or clear > best.clear:
+                hp = sum(hp * chance for (hp, _), chance in chances.items()) / clear if clear else 0
+                best = LoadoutScore(tuple(loadout), clear, tuple(fight.enemy for fight in route), hp)
+        return best
+
+    def rank(self, class_key):
+        """Every loadout of the class, best first."""
+        return sorted((self.score(class_key, loadout) for loadout in all_loadouts(class_key)),
+                      key=lambda score: (-score.clear, -score.hp))
+
+    def recommend(self, class_key, chosen=()):
+        return recommend(self.rank(class_key), chosen)
+
+
+class HintAdvisor:
+    """
+    game.set_advisor's advisor: recommends from LoadoutOptimizer rankings
+    with HINT_FIGHTS fights, each class's kept in its own bundle file under
+    directory and read back by later games.
+    """
+    def __init__(self, fights=HINT_FIGHTS, directory=HINT_DIR):
+        self.fights = fights
+        self.directory = directory
+        self.bundles = {}
+
+    def rank(self, class_key):
+        """The class's LoadoutScores, best first, from its file (built on first use)."""
+        if class_key not in self.bundles:
+            build = lambda: {'rank': {class_key: [tuple(score) for score in LoadoutOptimizer(fights=self.fights).rank(class_key)]}}
+            path = os.path.join(self.directory, f"hints.{class_key}.{self.fights}.{sys.implementation.cache_tag}.bundle")
+            self.bundles[class_key] = Bundle(build, path, HINT_SOURCES)
+        return [LoadoutScore(*score) for score in self.bundles[class_key].load('rank', class_key)]
+
+    def recommend(self, class_key, chosen=()):
+        return recommend(self.rank(class_key), chosen)
+
+
+def recommend(ranked, chosen=()):
+    """
+    The weapon to pick for the next slot from ranked LoadoutScores, given
+    those already chosen (one per slot, in slot order): the one the best
+    loadout continues with. None if the options tie, or there is nothing
+    left to choose.
+    """
+    chosen = tuple(chosen)
+    best = {} # Next weapon -> best score of a loadout that picks it
+    for score in ranked:
+        if score.loadout[:len(chosen)] == chosen and len(score.loadout) > len(chosen):
+            best.setdefault(score.loadout[len(chosen)], (score.clear, score.hp))
+    if len(set(best.values())) < 2:
+        return None
+    return max(best, key=best.get)
+
+
+# ### Main ###
+
+def main(argv=None):
+    import argparse # Only the command line needs it; game imports this module for its hints
+    parser = argparse.ArgumentParser(description="Rank every loadout against Dustbowl's fights.")
+    parser.add_argument('--class', dest='class_key', choices=list(CLASSES), help="only this class")
+    parser.add_argument('--fights', type=int, default=FIGHTS, help="engine fights per cached fight")
+    parser.add_argument('--seed', default='optimizer')
+    parser.add_argument('--hints', action='store_true', help="build the in-game hints' files, and time them")
+    args = parser.parse_args(argv)
+    if args.hints:
+        for class_key in [args.class_key] if args.class_key else list(CLASSES):
+            start = time.perf_counter()
+            HintAdvisor().recommend(class_key)
+            built = time.perf_counter() - start
+            start = time.perf_counter()
+            HintAdvisor().recommend(class_key)
+            print(f"{class_key:<9} first game {built:.2f}s, later games {(time.perf_counter() - start) * 1e3:.2f} ms")
+        return
+
+    optimizer = LoadoutOptimizer(fights=args.fights, seed=args.seed)
+    classes = [args.class_key] if args.class_key else list(CLASSES)
+    start = time.perf_counter()
+    for class_key in classes:
+        ranked = optimizer.rank(class_key)
+        print(f"\n{CLASSES[class_key]['name']}:")
+        for score in ranked:
+            print(f"  {'/'.join(score.loadout):<52} clear {score.clear:6.1%}  HP left {score.hp:5.1f}  "
+                  f"via {' > '.join(score.route)}")
+    print(f"\nRanked {len(classes)} class(es) in {time.perf_counter() - start:.2f}s "
+          f"({optimizer.misses} fights cached)")
+
+    # Re-ranking after a stat change runs only the fights of loadouts carrying that weapon
+    from game import WEAPONS, WEAPON_CHOICES
+    class_key = classes[0]
+    weapon = WEAPON_CHOICES[class_key]['primary'][0]
+    low, high = WEAPONS[weapon]['damage']
+    WEAPONS[weapon]['damage'] = (low + 10, high + 10)
+    misses = optimizer.misses
+    start = time.perf_counter()
+    best = optimizer.rank(class_key)[0]
+    WEAPONS[weapon]['damage'] = (low, high)
+    print(f"With {weapon} +10 damage: re-ranked {class_key} in {time.perf_counter() - start:.2f}s, "
+          f"{optimizer.misses - misses} fights re-run; best {'/'.join(best.loadout)} ({best.clear:.1%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Batch playthrough runner for TF2: The Text Adventure.
+Plays the full game (game.main) from answer scripts, many at once across
+worker processes, with every run's output captured and summarized by the
+ending reached, locations visited, combat turns and HP left.
+
+A script is one answer per line, as typed at the prompts. Lines starting
+with # are comments, except for two directives:
+    # seed: 42                 dice for this run (default: --seed plus the script name)
+    # expect: ENDING_WIN       the run fails unless it reaches this ending
+
+Scripts can be written by hand or recorded while playing:
+    python game.py --seed 42 --write-script runs/win.txt
+
+Usage:
+    python playthrough.py runs/*.txt --out-dir transcripts/
+    python playthrough.py --random 5000 --workers 8
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from collections import Counter, namedtuple
+from multiprocessing import Pool, cpu_count
+
+import game
+from game import Renderer, ScriptedInput, parse_script
+from rolls import RollService
+
+# status: 'ok', 'failed' (not the expected ending), 'stopped' (the script ran out) or 'quit'
+Playthrough = namedtuple('Playthrough', ['name', 'status', 'ending', 'steps', 'turns', 'player_hp',
+                                         'seconds', 'output'])
+
+RANDOM_ANSWERS = ['1', '1', '1', '2', '2', '3', 's', 'j', 'stats']
+RANDOM_LENGTH = 200
+
+
+# ### Scripts ###
+
+def read_script(path):
+    """(name, lines) for a script file."""
+    with open(path) as f:
+        return os.path.splitext(os.path.basename(path))[0], f.read().splitlines()
+
+def directives(lines):
+    """The '# key: value' lines of a script, as a dict."""
+    found = {}
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#') and ':' in line:
+            key, value = line[1:].split(':', 1)
+            found[key.strip().lower()] = value.strip()
+    return found
+
+def random_script(seed, length=RANDOM_LENGTH):
+    """A script of random (often invalid) answers, like a player mashing keys."""
+    rng = random.Random(seed)
+    return [f"# seed: {seed}"] + [rng.choice(RANDOM_ANSWERS) for _ in range(length)]
+
+
+# ### Running ###
+
+def play(name, lines, seed=0):
+    """Plays one script through game.main() in this process. Returns a Playthrough."""
+    settings = directives(lines)
+    output = io.StringIO()
+    previous_renderer = game.set_renderer(Renderer('instant', output))
+    previous_rolls = game.set_rolls(RollService(settings.get('seed', f"{seed}:{name}")))
+    previous_input = game.set_input(ScriptedInput(parse_script(lines)))
+    start = time.perf_counter()
+    try:
+        result = game.main()
+        status = 'ok' if result.ending else 'stopped'
+        ending, steps, turns, hp = result
+    except SystemExit: # 'quit' at a prompt
+        status, ending, steps, turns = 'quit', None, 0, 0
+        hp = game.player.current_health if game.player else 0
+    finally:
+        game.RENDERER.flush()
+        game.set_input(previous_input)
+        game.set_rolls(previous_rolls)
+        game.set_renderer(previous_renderer)
+    if 'expect' in settings and ending != settings['expect']:
+        status = 'failed'
+    return Playthrough(name, status, ending, steps, turns, hp, time.perf_counter() - start, output.getvalue())
+
+def run_task(task):
+    """Worker entry point. Output is dropped here unless it is wanted, to keep results small."""
+    name, lines, seed, keep_output = task
+    result = play(name, lines, seed)
+    return result if keep_output else result._replace(output=None)
+
+def run_batch(scripts, seed=0, workers=None, keep_output=False, chunk_size=64):
+    """Plays every (name, lines) script and yields Playthroughs in the same order."""
+    tasks = [(name, lines, seed, keep_output) for name, lines in scripts]
+    workers = workers or cpu_count()
+    if workers == 1 or len(tasks) < 2:
+        yield from map(run_task, tasks)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap(run_task, tasks, chunk_size)
+
+
+# ### Reporting ###
+
+def format_summary(results):
+    lines = [f"{'Script':<24} {'Status':<8} {'Ending':<20} {'Steps':>5} {'Turns':>5} {'HP':>4}"]
+    for r in results:
+        lines.append(f"{r.name[:24]:<24} {r.status:<8} {r.ending or '-':<20} {r.steps:>5} {r.turns:>5} {r.player_hp:>4}")
+    return "\n".join(lines)
+
+def format_totals(results, seconds):
+    endings = Counter(r.ending or f"({r.status})" for r in results)
+    statuses = Counter(r.status for r in results)
+    runs = len(results)
+    lines = [f"{runs} playthroughs in {seconds:.2f}s ({runs / seconds:.0f}/s): "
+             + ", ".join(f"{count} {status}" for status, count in statuses.most_common())]
+    for ending, count in endings.most_common():
+        lines.append(f"  {ending:<22} {count:>7}  {count / runs * 100:5.1f}%")
+    if runs:
+        lines.append(f"  mean steps {sum(r.steps for r in results) / runs:.1f}, "
+                     f"mean turns {sum(r.turns for r in results) / runs:.1f}, "
+                     f"mean HP left {sum(r.player_hp for r in results) / runs:.1f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play the game from answer scripts, in parallel.")
+    parser.add_argument('scripts', nargs='*', help="script files, one answer per line")
+    parser.add_argument('--random', type=int, default=0, metavar='N', help="also play N random scripts")
+    parser.add_argument('--seed', default='0', help="dice for scripts without a '# seed:' line")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--out-dir', help="write each run's output to OUT_DIR/<script>.log")
+    parser.add_argument('--quiet', action='store_true', help="only print the totals")
+    args = parser.parse_args(argv)
+    if not args.scripts and not args.random:
+        parser.error("give script files, --random N, or both")
+
+    scripts = [read_script(path) for path in args.scripts]
+    scripts += [(f"random-{i}", random_script(f"{args.seed}:random-{i}")) for i in range(args.random)]
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(scripts, args.seed, args.workers, keep_output=bool(args.out_dir)):
+        if args.out_dir:
+            with open(os.path.join(args.out_dir, f"{result.name}.log"), 'w') as f:
+                f.write(result.output)
+            result = result._replace(output=None)
+        results.append(result)
+    seconds = time.perf_counter() - start
+
+    if not args.quiet:
+        print(format_summary(results))
+        print()
+    print(format_totals(results, seconds))
+    sys.exit(1 if any(r.status == 'failed' for r in results) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+State propagation for TF2: The Text Adventure.
+Answers campaign-level questions (the chance of each ending, how often each
+fight is reached and with how much HP) in one pass over the map, instead
+of sampling playthroughs. A run is a probability distribution over
+(location, HP, spare ammo, items taken), kept as a sparse dict and pushed
+through the map one step at a time, the way main() plays it:
+
+  * options share the mass between choices: uniformly, or one fixed
+    choice per location (e.g. explore.py's best choices)
+  * a health pack heals and an ammo crate restocks the first time only
+  * a fight applies its transition matrix: for each starting HP and spare
+    ammo, the chance of each (won/fled/dead, HP left, ammo left), from
+    engine fights
+
+HP is kept on HP_LEVELS steps of max HP: HP between two steps is shared
+between them in proportion, so odds are interpolated between steps rather
+than rounded. Ammo is coarser still: the shots left in every gun the
+policy fires, loaded or spare, as one share of a full load on AMMO_LEVELS
+steps, shared between steps the same way. A fight at a step starts each
+gun with that share of its full load, so a loadout that drains one gun
+and saves the other is played as if it had spent both evenly. Tracking
+each gun's shots exactly would multiply the matrix rows by every
+combination of them; rows are only built for states a run reaches, and
+loadouts without guns never leave the full step. Buffs and Jarate end
+with the fight, so they don't carry over, and guns are reloaded for free
+between fights. An item is only tracked where its location can be
+visited again.
+
+    matrices = FightMatrices()
+    result = propagate(DUSTBOWL, 'heavy', ['minigun', 'sandvich', 'fists'], matrices)
+    print(result.endings['ENDING_WIN'], result.fights['point_a_sentry'])
+
+Run this file to compare with explore.py's full-HP odds and with sampled
+playthroughs:
+    python propagate.py --class heavy
+    python propagate.py --choose random --check 20000    # slower: builds the matrices 4 times
+"""
+
+import random
+import time
+from collections import namedtuple
+
+from game import AMMO_RESERVE, AMMO_SLOT_TABLES, CLASSES, ENEMIES, DUSTBOWL, NO_AMMO, WEAPON_TABLE, frozen
+from engine import build_player, encounter_combat
+from explore import MonteCarloOdds, explore, step_edges, story_graph
+from mapgraph import strong_components
+from rolls import RollService
+from simulate import all_loadouts, make_policy
+
+HP_LEVELS = 10 # HP between fights is kept on tenths of max HP
+AMMO_LEVELS = 4 # Ammo between fights is kept on quarters of a full load
+FIGHTS = 400 # Engine fights per matrix row
+PRUNE = 1e-12 # States less likely than this are dropped (and counted in pruned)
+MAX_STEPS = 100000
+CHECK_SEEDS = 3 # Extra matrix seeds for --check, to tell matrix noise from bias
+
+# endings: {ending key: chance}; stalled: mass still walking after max_steps;
+# pruned: mass dropped as negligible; fights: {location key: FightStats}
+Propagation = namedtuple('Propagation', ['endings', 'stalled', 'pruned', 'fights', 'steps'])
+# visits: expected arrivals (above 1 when fleeing loops back); hp: mean HP on
+# arrival; won: chance an arrival wins
+FightStats = namedtuple('FightStats', ['visits', 'hp', 'won'])
+
+
+def hp_split(hp, max_hp):
+    """hp as [(HP step, share), ...]: shared between the steps either side of it (never below one step)."""
+    position = max(1.0, hp * HP_LEVELS / max_hp)
+    low = min(int(position), HP_LEVELS)
+    high_share = position - low
+    if high_share == 0:
+        return [(max_hp * low // HP_LEVELS, 1.0)]
+    return [(max_hp * low // HP_LEVELS, 1 - high_share), (max_hp * (low + 1) // HP_LEVELS, high_share)]
+
+def ammo_split(share):
+    """share of a full reserve as [(ammo step, share), ...], like hp_split but down to an empty reserve."""
+    position = min(share, 1.0) * AMMO_LEVELS
+    low = int(position)
+    high_share = position - low
+    if high_share == 0:
+        return [(low, 1.0)]
+    return [(low, 1 - high_share), (low + 1, high_share)]
+
+def gun_slots(class_key, weapons):
+    """{AMMO_SLOTS index: clip size} for each gun among weapons."""
+    table = AMMO_SLOT_TABLES[class_key]
+    return {table[w['id']]: WEAPON_TABLE.clip[w['id']] for w in weapons if table[w['id']] != NO_AMMO}
+
+def ammo_left(player, slots):
+    """The shots left in the guns of slots, loaded or spare, as a share of a full load (1.0 without guns)."""
+    full = sum(AMMO_RESERVE[slot] + size for slot, size in slots.items())
+    return sum(player.clips[slot] + player.ammo[slot] for slot in slots) / full if full else 1.0
+
+def crate_share(slots, percent):
+    """The share of a full load an ammo crate of percent adds to the guns of slots (crates fill the reserve, not the clip)."""
+    full = sum(AMMO_RESERVE[slot] + size for slot, size in slots.items())
+    return sum(AMMO_RESERVE[slot] for slot in slots) * percent / 100 / full if full else 0.0
+
+def set_ammo(player, slots, ammo):
+    """Gives each gun of slots ammo steps of a full load, loading its clip first."""
+    for slot, size in slots.items():
+        shots = (AMMO_RESERVE[slot] + size) * ammo // AMMO_LEVELS
+        player.clips[slot] = min(size, shots)
+        player.ammo[slot] = shots - player.clips[slot]
+
+
+# ### Fight Matrices ###
+
+class FightMatrices:
+    """
+    Per-fight transition matrices, one row per starting HP and ammo step,
+    built from engine fights on first use and cached under the stats of the class,
+    the enemies and only the weapons the policy can use (policy.uses, if
+    it has one). Changing one weapon's stats only rebuilds the rows of
+    loadouts that fight with it. Ammo is counted over those weapons' guns
+    too, so a gun the policy never fires can't tell two rows apart.
+    misses counts the rows built.
+    """
+    def __init__(self, fights=FIGHTS, seed='propagate', policy=None):
+        self.fights = fights
+        self.seed = seed
+        self.policy = policy or make_policy('tactical', None, 0)
+        self.cache = {}
+        self.misses = 0
+
+    def signature(self, class_key, loadout):
+        """What a fight depends on: the class's stats, flee items and the weapons the policy can use."""
+        player = build_player(class_key, loadout)
+        weapons = self.weapons(player)
+        return (class_key, frozen(CLASSES[class_key]), player.flee_bonus) + tuple(frozen(weapon) for weapon in weapons)
+
+    def weapons(self, player):
+        """The player's weapons the policy can use."""
+        uses = getattr(self.policy, 'uses', None)
+        return uses(player.combat_actions) if uses else player.combat_actions
+
+    def guns(self, class_key, loadout):
+        """gun_slots of the guns the policy can use: the ammo a row starts with and counts."""
+        return gun_slots(class_key, self.weapons(build_player(class_key, loadout)))
+
+    def row(self, signature, class_key, loadout, encounter, start_hp, ammo=AMMO_LEVELS):
+        """
+        {(outcome, HP left, ammo step left): chance} for a fight from
+        start_hp with ammo steps of spare ammo, where outcome is 'won',
+        'fled' or 'dead' (timeouts count as dead, with 0 HP).
+        """
+        enemies = (encounter,) if isinstance(encounter, str) else tuple(encounter)
+        key = (signature, enemies, tuple(frozen(ENEMIES[enemy]) for enemy in enemies), start_hp, ammo)
+        if key not in self.cache:
+            self.misses += 1
+            # The same dice for every loadout, so close loadouts are compared fairly
+            label = enemies[0] if len(enemies) == 1 else '+'.join(enemies)
+            rng = RollService(f"{self.seed}:{class_key}:{label}:{start_hp}:{ammo}", block=4096)
+            counts = {}
+            slots = self.guns(class_key, loadout)
+            for _ in range(self.fights):
+                player = build_player(class_key, loadout)
+                player.current_health = start_hp
+                set_ammo(player, slots, ammo)
+                result = encounter_combat(player, encounter, self.policy, rng).run()
+                if result.outcome in ('won', 'fled'):
+                    for hp, share in hp_split(result.player_hp, player.max_health):
+                        for left, ammo_share in ammo_split(ammo_left(player, slots)):
+                            cell = (result.outcome, hp, left)
+                            counts[cell] = counts.get(cell, 0) + share * ammo_share
+                else:
+                    counts['dead', 0, ammo] = counts.get(('dead', 0, ammo), 0) + 1
+            self.cache[key] = {cell: n / self.fights for cell, n in counts.items()}
+        return self.cache[key]
+
+    def matrix(self, class_key, loadout, encounter):
+        """The whole matrix at full ammo: {start HP: row} for every HP level."""
+        signature = self.signature(class_key, loadout)
+        max_hp = CLASSES[class_key]['health']
+        return {max_hp * level // HP_LEVELS: self.row(signature, class_key, loadout, encounter, max_hp * level // HP_LEVELS)
+                for level in range(1, HP_LEVELS + 1)}
+
+
+# ### Propagation ###
+
+def revisitable(graph):
+    """Nodes on a cycle of the story graph, where a health pack can be found twice."""
+    edges = step_edges(graph)
+    component, count = strong_components(edges)
+    sizes = [0] * count
+    for c in component:
+        sizes[c] += 1
+    return {node for node, c in enumerate(component) if sizes[c] > 1 or node in edges[node]}
+
+def propagate(game_map, class_key, loadout, matrices, choices=None, prune=PRUNE, max_steps=MAX_STEPS):
+    """
+    Pushes one run's state distribution from the start to the endings of
+    game_map (a CompiledMap). choices maps location keys to the option
+    picked there; options at other locations are picked uniformly.
+    Returns a Propagation.
+    """
+    graph = story_graph(game_map, class_key)
+    nodes = game_map.nodes
+    tracked = revisitable(graph)
+    signature = matrices.signature(class_key, loadout)
+    max_hp = CLASSES[class_key]['health']
+    choices = choices or {}
+
+    # Where each choice node's mass goes: [(target, share), ...]
+    moves = {}
+    for node, step in enumerate(graph):
+        if step.kind == 'choice':
+            picked = [t for t in step.targets if t[0] == choices.get(nodes[node].key)]
+            targets = picked or step.targets
+            moves[node] = [(t[2], 1 / len(targets)) for t in targets]
+
+    endings = {nodes[node].key: 0.0 for node in game_map.endings}
+    # Ammo crates are left out for loadouts without guns, whose ammo never leaves the full step
+    slots = matrices.guns(class_key, loadout)
+    kinds = ('health', 'ammo') if slots else ('health',)
+    items = {node.index: node.item for node in nodes if node.item and node.item[0] in kinds}
+    arrivals = {} # Fight node -> [mass, mass * HP, mass won]
+    rows = {} # (encounter, HP, ammo step) -> matrix row, without re-keying the matrices' cache every step
+
+    def arrive(after, node, hp, ammo, taken, mass):
+        """Adds mass arriving at node to after, picking up its health pack or ammo crate the first time."""
+        if node in items and node not in taken:
+            if node in tracked:
+                taken = taken | {node}
+            kind, amount = items[node]
+            if kind == 'health':
+                states = [(healed, ammo, share) for healed, share in hp_split(min(max_hp, hp + amount), max_hp)]
+            else:
+                states = [(hp, stocked, share) for stocked, share in ammo_split(ammo / AMMO_LEVELS + crate_share(slots, amount))]
+            for hp, ammo, share in states:
+                state = (node, hp, ammo, taken)
+                after[state] = after.get(state, 0.0) + mass * share
+        else:
+            state = (node, hp, ammo, taken)
+            after[state] = after.get(state, 0.0) + mass
+
+    current = {}
+    arrive(current, game_map.start, max_hp, AMMO_LEVELS, frozenset(), 1.0)
+    pruned = 0.0
+    steps = 0
+    while current and steps < max_steps:
+        after = {}
+        for (node, hp, ammo, taken), mass in current.items():
+            step = graph[node]
+            if step.kind == 'ending':
+                endings[nodes[node].key] += mass
+            elif step.kind == 'fight':
+                stats = arrivals.setdefault(node, [0.0, 0.0, 0.0])
+                stats[0] += mass
+                stats[1] += mass * hp
+                win, lose, flee = step.targets
+                row = rows.get((step.enemy, hp, ammo))
+                if row is None:
+                    row = rows[step.enemy, hp, ammo] = matrices.row(signature, class_key, loadout, step.enemy, hp, ammo)
+                for (outcome, left, spare), chance in row.items():
+                    if outcome == 'won':
+                        stats[2] += mass * chance
+                        arrive(after, win, left, spare, taken, mass * chance)
+                    elif outcome == 'fled':
+                        arrive(after, flee, left, spare, taken, mass * chance)
+                    else:
+                        arrive(after, lose, 0, spare, taken, mass * chance)
+            else:
+                for target, share in moves[node]:
+                    arrive(after, target, hp, ammo, taken, mass * share)
+        current = {}
+        for state, mass in after.items():
+            if mass >= prune:
+                current[state] = mass
+            else:
+                pruned += mass
+        steps += 1
+
+    fights = {nodes[node].key: FightStats(visits, total_hp / visits, won / visits)
+              for node, (visits, total_hp, won) in arrivals.items()}
+    return Propagation(endings, sum(current.values()), pruned, fights, steps)
+
+
+# ### Sampling (for checking) ###
+
+def sample(game_map, class_key, loadout, policy, runs, choices=None, seed=0):
+    """Ending counts from runs sampled playthroughs with the same rules as propagate, without HP or ammo rounding."""
+    graph = story_graph(game_map, class_key)
+    nodes = game_map.nodes
+    choices = choices or {}
+    pick = random.Random(f"{seed}:choices")
+    rng = RollService(f"{seed}:sample", block=4096)
+    counts = {}
+    for _ in range(runs):
+        player = build_player(class_key, loadout)
+        node, taken = game_map.start, set()
+        while graph[node].kind != 'ending':
+            step = graph[node]
+            item = nodes[node].item
+            if item and node not in taken:
+                if item[0] == 'health':
+                    player.heal(item[1])
+                elif item[0] == 'ammo':
+                    player.restock(item[1])
+                taken.add(node)
+            if step.kind == 'fight':
+                outcome = encounter_combat(player, step.enemy, policy, rng).run().outcome
+                node = step.targets[{'won': 0, 'fled': 2}.get(outcome, 1)]
+            else:
+                picked = [t for t in step.targets if t[0] == choices.get(nodes[node].key)]
+                node = pick.choice(picked or step.targets)[2]
+        counts[nodes[node].key] = counts.get(nodes[node].key, 0) + 1
+    return counts
+
+
+# ### Main ###
+
+def main(argv=None):
+    import argparse # Only the command line needs it; the optimizer (and so game) imports this module
+    parser = argparse.ArgumentParser(description="Ending odds with HP carried between fights, in one pass.")
+    parser.add_argument('--class', dest='class_key', choices=list(CLASSES), default='heavy')
+    parser.add_argument('--loadout', nargs='+', help="weapon keys (default: every loadout of the class)")
+    parser.add_argument('--choose', choices=['best', 'random'], default='best',
+                        help="options: explore.py's best choices (from full-HP odds) or uniformly random")
+    parser.add_argument('--policy', choices=['greedy', 'tactical'], default='tactical', help="how fights are played")
+    parser.add_argument('--flee-below', type=int, default=0, help="flee fights below this HP percent")
+    parser.add_argument('--fights', type=int, default=FIGHTS, help="engine fights per matrix row")
+    parser.add_argument('--check', type=int, default=0, metavar='RUNS', help="also sample RUNS playthroughs and compare")
+    args = parser.parse_args(argv)
+
+    policy = make_policy(args.policy, None, args.flee_below)
+    matrices = FightMatrices(args.fights, policy=policy)
+    full_hp = MonteCarloOdds(args.fights, policy=args.policy, flee_below=args.flee_below)
+    class_key = args.class_key
+    for loadout in ([args.loadout] if args.loadout else all_loadouts(class_key)):
+        full = explore(DUSTBOWL, class_key, loadout, full_hp, args.choose)
+        choices = full.choices if args.choose == 'best' else None
+        start = time.perf_counter()
+        result = propagate(DUSTBOWL, class_key, loadout, matrices, choices)
+        seconds = time.perf_counter() - start
+        wins = sum(chance for key, chance in result.endings.items() if 'WIN' in key)
+        full_wins = sum(chance for key, chance in full.endings.items() if 'WIN' in key)
+        print(f"\n{class_key} {'/'.join(loadout)}: win {wins:.1%} with HP carried over, "
+              f"{full_wins:.1%} if every fight started at full HP "
+              f"({result.steps} steps, {matrices.misses} matrix rows so far, {seconds * 1e3:.0f} ms)")
+        for key, stats in sorted(result.fights.items(), key=lambda kv: -kv[1].visits):
+            print(f"  {key:<16} reached {stats.visits:6.3f}x  mean HP on arrival {stats.hp:6.1f}  won {stats.won:6.1%}")
+        if args.check:
+            counts = sample(DUSTBOWL, class_key, loadout, policy, args.check, choices)
+            # The matrices are sampled too: their noise is measured by rebuilding them with other dice
+            reruns = [propagate(DUSTBOWL, class_key, loadout, FightMatrices(args.fights, f"propagate:{i}", policy), choices)
+                      for i in range(CHECK_SEEDS)]
+            for key, chance in result.endings.items():
+                sampled = counts.get(key, 0) / args.check
+                others = [chance] + [rerun.endings[key] for rerun in reruns]
+                mean = sum(others) / len(others)
+                spread = sum((other - mean) ** 2 for other in others) / (len(others) - 1)
+                error = (max(chance * (1 - chance), 1e-9) / args.check + spread) ** 0.5
+                z = abs(sampled - chance) / error
+                print(f"  {'ok' if z < 4 else 'FAIL':<4} {key:<20} propagated {chance:7.2%}  sampled {sampled:7.2%}  z={z:.2f}")
+
+if __name__ == "__main__":
+    main()
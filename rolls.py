@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded dice for TF2: The Text Adventure.
+A RollService stands in for the random module wherever the game rolls
+(rng.randint / rng.choice), so every roll of a session, worker or fight
+comes from its own reproducible stream:
+
+    rolls = RollService('match-7')
+    session_rolls = rolls.stream('session-42') # Independent of every other stream
+
+With record=True each roll is kept in a compact binary log (two bytes per
+roll) that ReplayRolls plays back exactly. block=N draws N random floats at
+a time, which cuts the cost of each roll in tight simulation loops.
+
+Run this file directly to check replay and time the block mode:
+    python rolls.py
+"""
+
+import random
+import struct
+import sys
+import time
+from array import array
+
+MAGIC = b'TFRL'
+VERSION = 1
+HEADER = struct.Struct('<4sBI') # magic, version, seed length; then the seed, then the rolls
+
+
+class ReplayError(Exception):
+    """A replay asked for a roll that the log doesn't have."""
+
+
+class RollService:
+    """randint/choice from one seeded stream, optionally logged and block-generated."""
+    def __init__(self, seed=None, record=False, block=0):
+        self.seed = str(random.randrange(2 ** 63) if seed is None else seed)
+        self.random = random.Random(self.seed)
+        self.log = array('H') if record else None # Every roll, in order
+        self.block_size = block
+        self.block = iter(()) # The rest of the current block
+
+    def stream(self, name):
+        """An independent child stream. The same seed and name always give the same rolls."""
+        return RollService(f"{self.seed}/{name}", self.log is not None, self.block_size)
+
+    def randint(self, a, b):
+        """Random integer in a..b inclusive, like random.randint."""
+        if self.block_size:
+            u = next(self.block, None)
+            if u is None:
+                self.refill()
+                u = next(self.block)
+            value = a + int(u * (b - a + 1))
+        else:
+            value = self.random.randint(a, b)
+        if self.log is not None:
+            self.log.append(value)
+        return value
+
+    def choice(self, seq):
+        return seq[self.randint(0, len(seq) - 1)]
+
+    def refill(self):
+        """Draws the next block of random floats in one go."""
+        rand = self.random.random
+        self.block = iter([rand() for _ in range(self.block_size)])
+
+    def save(self, path):
+        """Writes the roll log to path. Needs record=True."""
+        if self.log is None:
+            raise ValueError("RollService was created without record=True")
+        seed = self.seed.encode()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(seed)))
+            f.write(seed)
+            f.write(self.log.tobytes())
+
+
+class ReplayRolls:
+    """Plays back a roll log. Raises ReplayError as soon as the replay diverges."""
+    def __init__(self, log, seed=''):
+        self.log = log
+        self.seed = seed
+        self.pos = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, seed_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a roll log")
+        if version != VERSION:
+            raise ValueError(f"{path} is roll log version {version}; this game reads version {VERSION}")
+        start = HEADER.size + seed_length
+        log = array('H')
+        log.frombytes(data[start:])
+        return cls(log, data[HEADER.size:start].decode())
+
+    def randint(self, a, b):
+        if self.pos >= len(self.log):
+            raise ReplayError(f"The log ran out after {self.pos} rolls")
+        value = self.log[self.pos]
+        if not a <= value <= b:
+            raise ReplayError(f"Roll {self.pos} was {value}, outside {a}-{b}: the replay has diverged")
+        self.pos += 1
+        return value
+
+    def choice(self, seq):
+        return seq[self.randint(0, len(seq) - 1)]
+
+    def done(self):
+        """True once every logged roll has been used."""
+        return self.pos == len(self.log)
+
+
+# ### Self-check ###
+
+def main():
+    from game import Enemy
+    from engine import HeadlessCombat, RandomPolicy, build_player
+
+    def play(rng):
+        player = build_player('sniper', ['sniper_rifle', 'jarate', 'kukri'])
+        return HeadlessCombat(player, Enemy('sentry_gun_boss'), RandomPolicy(rng, flee_rate=10), rng).run()
+
+    failed = False
+    for block in (0, 256):
+        recorder = RollService('check', record=True, block=block)
+        original = play(recorder)
+        replay = ReplayRolls(recorder.log)
+        ok = play(replay) == original and replay.done()
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} replay (block={block}): {original.outcome} after {len(recorder.log)} rolls "
+              f"({len(recorder.log.tobytes())} bytes)")
+
+    n = 1_000_000
+    for name, rng in (('random.Random', random.Random(0)), ('RollService', RollService(0)),
+                      ('RollService block=4096', RollService(0, block=4096))):
+        randint = rng.randint
+        start = time.perf_counter()
+        for _ in range(n):
+            randint(1, 100)
+        print(f"{name:<24} {(time.perf_counter() - start) / n * 1e9:6.1f} ns/roll")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
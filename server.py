@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio game server for TF2: The Text Adventure.
+Hosts many players in one process: one coroutine per connection, each with
+its own Player and map state. Clients speak plain lines of text, so any
+line-based client works:
+
+    python server.py --port 2727
+    nc localhost 2727
+
+Typing effects wait with asyncio.sleep instead of time.sleep, and every
+write waits for the socket to drain, so a slow client only slows itself.
+
+With --park-dir, a player who hangs up mid-run is saved to disk as a small
+snapshot and can resume later with the code they were given. With --metrics,
+every session reports the same counters and timers as the game (see metrics.py).
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import secrets
+import time
+
+from game import (CLASSES, WEAPONS, WEAPON_CHOICES, LOADOUT_SLOTS, DUSTBOWL, ENEMY_MOVES, INPUT_BUDGET, Renderer,
+                  Player, Enemy, encounter_enemies, location_options, set_renderer, targeted, weapon_menu)
+from engine import FLEE, HESITATE, HeadlessCombat, HeadlessSquadCombat
+from mapgraph import MapOverlay
+from metrics import CountingRolls, Exporter, Metrics, export_paths
+from rolls import RollService
+import snapshot
+
+WRITE_BUFFER_HIGH = 64 * 1024 # Bytes queued per client before writes start waiting
+TURN_TIMEOUT = 120 # Seconds a combat turn may take before it is lost
+
+
+class SessionClosed(Exception):
+    """The client quit or hung up."""
+    def __init__(self, hung_up=False):
+        super().__init__("hung up" if hung_up else "quit")
+        self.hung_up = hung_up
+
+
+# ### Session I/O ###
+
+class SessionOutput:
+    """Async counterpart of game.Renderer for one connection."""
+    def __init__(self, reader, writer, mode='budget', tick=1 / 30, budget=1.0, metrics=None):
+        self.reader = reader
+        self.writer = writer
+        self.metrics = metrics # Shared by every session; None when instrumentation is off
+        self.style = Renderer(mode, tick=tick, budget=budget) # Only used to plan typing chunks
+        self.buffer = []
+
+    def line(self, text=""):
+        self.buffer.append(f"{text}\n")
+
+    async def say(self, text, speed=0.03):
+        """Sends a line with the session's typing effect."""
+        if self.style.mode == 'instant' or speed <= 0 or not text:
+            self.line(text)
+            return
+        await self.flush()
+        chunk, delay = self.style.plan(text, speed)
+        for start in range(0, len(text), chunk):
+            self.writer.write(text[start:start + chunk].encode())
+            await self.writer.drain()
+            if self.metrics is None:
+                await asyncio.sleep(delay)
+            else:
+                slept = time.perf_counter()
+                await asyncio.sleep(delay)
+                self.metrics.time('print_slow_sleep', time.perf_counter() - slept)
+        self.writer.write(b"\n")
+
+    async def flush(self):
+        """Sends the queued frame and waits until the socket can take more."""
+        if self.buffer:
+            self.writer.write(''.join(self.buffer).encode())
+            self.buffer.clear()
+        await self.writer.drain()
+
+    async def ask(self, prompt, timeout=None):
+        """
+        Asks for one line of input. Raises SessionClosed on 'quit' or hang-up,
+        and asyncio.TimeoutError if no line arrives within timeout seconds.
+        """
+        self.line(f"\n{prompt}")
+        self.buffer.append("> ")
+        await self.flush()
+        read = self.reader.readline() if timeout is None else asyncio.wait_for(self.reader.readline(), timeout)
+        if self.metrics is None:
+            data = await read
+        else:
+            self.metrics.count('prompts')
+            asked = time.perf_counter()
+            try:
+                data = await read
+            finally:
+                self.metrics.time('input_wait', time.perf_counter() - asked)
+        if not data:
+            raise SessionClosed(hung_up=True)
+        choice = data.decode(errors='replace').strip().lower()
+        if choice == 'quit':
+            await self.say("See you on the battlefield, mercenary.")
+            await self.flush()
+            raise SessionClosed()
+        return choice
+
+    def capture(self, func, *args):
+        """
+        Runs synchronous game code that prints (find_item, show_stats, ...)
+        and queues its output for this session. Safe because nothing awaits
+        while the renderer is swapped.
+        """
+        text = io.StringIO()
+        previous = set_renderer(Renderer('instant', stream=text))
+        try:
+            result = func(*args)
+        finally:
+            set_renderer(previous)
+        self.buffer.append(text.getvalue())
+        return result
+
+
+# ### Game Session ###
+
+class GameSession:
+    """One player's run through the map. All state lives on the session."""
+    def __init__(self, out, game_map=DUSTBOWL, rng=None, input_budget=INPUT_BUDGET, turn_timeout=TURN_TIMEOUT):
+        self.out = out
+        self.input_budget = input_budget # Answers per combat turn
+        self.turn_timeout = turn_timeout # Seconds per combat turn (None: no limit)
+        self.metrics = out.metrics
+        self.rng = rng or RollService() # This session's own dice
+        self.map = game_map # Compiled and shared by every session
+        self.overlay = MapOverlay() # This session's items and visits
+        self.player = Player("New Merc")
+        self.location_key = 'start'
+        self.started = False # True once the class and loadout are chosen
+        self.combat = None # The HeadlessCombat in progress, if any
+        self.saved_fight = None # (enemy, turn, flee_attempts) to resume from a snapshot
+
+    @classmethod
+    def restore(cls, out, data, game_map=DUSTBOWL, rng=None, **limits):
+        """A session that picks up where snapshot data left off."""
+        saved = snapshot.loads(data)
+        session = cls(out, game_map, rng, **limits)
+        session.player, session.location_key, session.overlay = saved.player, saved.location_key, saved.overlay
+        if saved.enemy:
+            session.saved_fight = (saved.enemy, saved.turn, saved.flee_attempts)
+        session.started = True
+        return session
+
+    def snapshot(self):
+        """This session as snapshot bytes. Only valid once started."""
+        combat = self.combat
+        if combat is None or len(combat.enemies) > 1: # Squad fights restart from the location
+            return snapshot.dumps(self.player, self.location_key, self.overlay)
+        return snapshot.dumps(self.player, self.location_key, self.overlay, combat.enemy, combat.turn, combat.flee_attempts)
+
+    async def run(self):
+        out = self.out
+        dwell = None # (location key, time it was entered), only while instrumentation is on
+        await out.say("========================================")
+        await out.say("   Welcome to TF2: The Text Adventure   ", 0.02)
+        await out.say("========================================", 0.02)
+        if self.started:
+            await out.say(f"\nWelcome back, {self.player.name}. Resuming your run...")
+        else:
+            await self.choose_class()
+            await self.equip_loadout()
+            self.started = True
+            out.capture(self.player.show_stats)
+            out.capture(self.player.show_inventory)
+            await out.say("\n(Type 'stats' or 'inventory' at most prompts to check your status.)")
+            await out.say("\nLoading map: pl_dustbowl (Stage 1)...")
+
+        while True:
+            if not self.player.is_alive():
+                self.location_key = 'GAME_OVER_LOSE'
+            if self.location_key not in self.map:
+                out.line(f"Error: Map key '{self.location_key}' not found. Defaulting to 'start'.")
+                self.location_key = 'start'
+            location = self.map[self.location_key]
+            self.overlay.visit(location)
+            if self.metrics is not None:
+                now = time.perf_counter()
+                if dwell:
+                    self.metrics.time('location_dwell', now - dwell[1], location=dwell[0])
+                dwell = (location.key, now)
+
+            out.line()
+            out.line("----------------------------------------")
+            if location.ending:
+                if location.description:
+                    await out.say(location.description)
+                await out.say(location.ending)
+                await out.flush()
+                return self.location_key
+
+            await out.say(location.description)
+            if self.overlay.has_item(location):
+                out.capture(self.player.find_item, *location.item)
+                self.overlay.take_item(location)
+
+            if location.encounter:
+                result = await self.fight(location.encounter)
+                if result == 'won':
+                    self.location_key = location.on_win
+                elif result == 'dead':
+                    self.location_key = 'GAME_OVER_LOSE'
+                else:
+                    self.location_key = location.on_flee
+                continue
+
+            if location.options:
+                self.location_key = await self.choose_option(location)
+
+    async def choose_number(self, count):
+        while True:
+            choice = await self.out.ask(f"Enter a number (1-{count}):")
+            if choice.isdigit() and 1 <= int(choice) <= count:
+                return int(choice)
+            self.out.line("That's not a valid number.")
+            self.reprompted('choose_number')
+
+    async def choose_class(self):
+        await self.out.say("The Administrator needs you. Choose your class:")
+        class_list = list(CLASSES.keys())
+        for i, class_name in enumerate(class_list):
+            cls = CLASSES[class_name]
+            self.out.line(f"  {i+1}. {cls['name']} (HP: {cls['health']}, Speed: {cls['speed']})")
+        self.player.set_class(class_list[await self.choose_number(len(class_list)) - 1])
+
+    async def equip_loadout(self):
+        await self.out.say(f"\nTime to gear up, {self.player.player_class['name']}.")
+        choices = WEAPON_CHOICES[self.player.class_key]
+        for slot in LOADOUT_SLOTS:
+            weapon_keys = choices.get(slot, [])
+            if not weapon_keys:
+                continue
+            await self.out.say(f"\nChoose your **{slot.upper()}** weapon:")
+            if len(weapon_keys) == 1:
+                weapon_data = WEAPONS[weapon_keys[0]]
+                await self.out.say(f"  You equip your {weapon_data['name']}. ({weapon_data['desc']})")
+                self.player.equip(weapon_keys[0])
+                continue
+            for i, key in enumerate(weapon_keys):
+                self.out.line(f"  {i+1}. {WEAPONS[key]['name']} - ({WEAPONS[key]['desc']})")
+            chosen_key = weapon_keys[await self.choose_number(len(weapon_keys)) - 1]
+            self.player.equip(chosen_key)
+            self.out.line(f"  {WEAPONS[chosen_key]['name']} equipped.")
+        await self.out.say("\nLoadout confirmed. Get to the front!")
+
+    async def choose_option(self, location):
+        options = location_options(location, self.player)
+        self.out.line("\nWhat do you do?")
+        for key, value in options.items():
+            self.out.line(f"  {key}. {value[0]}")
+        while True:
+            choice = await self.out.ask("Enter your choice:")
+            if choice not in options:
+                self.reprompted('main')
+            if choice == 'stats':
+                self.out.capture(self.player.show_stats)
+            elif choice == 'inventory':
+                self.out.capture(self.player.show_inventory)
+            elif choice in options:
+                return options[choice][1]
+            else:
+                self.out.line("That's not a valid command.")
+
+    def reprompted(self, where):
+        if self.metrics is not None:
+            self.metrics.count('reprompts', where=where)
+
+    # --- Combat ---
+
+    async def fight(self, encounter):
+        """Plays a fight (one enemy key or a squad of them) through the headless engine, one prompted turn at a time."""
+        out, player = self.out, self.player
+        log = []
+        rng = self.rng if self.metrics is None else CountingRolls(self.rng)
+        if isinstance(encounter, str) or self.saved_fight:
+            enemy, turn, flee_attempts = self.saved_fight or (Enemy(encounter), 0, 0)
+            combat = HeadlessCombat(player, enemy, policy=None, rng=rng, log=log, turn=turn, flee_attempts=flee_attempts)
+        else:
+            turn = 0
+            combat = HeadlessSquadCombat(player, encounter_enemies(encounter), policy=None, rng=rng, log=log)
+        self.saved_fight = None
+        self.combat = combat
+        result = await self.play_fight(combat, log) # A hang-up leaves self.combat set for snapshot()
+        self.combat = None
+        if self.metrics is not None:
+            self.metrics.count('fights', outcome=result)
+            self.metrics.observe('combat_turns', combat.turn - turn)
+            self.metrics.observe('combat_rolls', rng.rolls)
+        return result
+
+    async def play_fight(self, combat, log):
+        out, player, enemy = self.out, self.player, combat.enemy
+        squad = len(combat.enemies) > 1
+        menu = weapon_menu(combat.actions) # Built once per fight, reused by every prompt
+        await out.say("\n--- BATTLE START ---")
+        if squad:
+            await out.say(f"A squad appears: {', '.join(enemy.name for enemy in combat.enemies)}!")
+        else:
+            await out.say(f"A wild {enemy.name} appears!")
+
+        while True:
+            out.line(f"\n--- Turn {combat.turn + 1} ---")
+            out.line(f"Your HP: {player.current_health}/{player.max_health}")
+            if player.ammo_status():
+                out.line(f"Ammo: {player.ammo_status()}")
+            if squad:
+                targets = combat.living()
+                for i in targets:
+                    out.line(f"{combat.enemies[i].name} HP: {combat.enemies[i].current_health}/{combat.enemies[i].max_health}")
+                action, target = await self.combat_action(menu, [(i, combat.enemies[i]) for i in targets])
+                result = combat.step(action, target)
+            else:
+                out.line(f"Enemy HP: {enemy.current_health}/{enemy.max_health}")
+                action, _ = await self.combat_action(menu)
+                result = combat.step(action)
+            for text in describe(log, player, enemy, combat.enemies):
+                await out.say(text)
+            log.clear()
+            if squad and result == 'won':
+                await out.say("You have defeated the whole squad!")
+                return result
+            if result == 'won':
+                if enemy.current_health > 0: # It retreated
+                    await out.say(f"The {enemy.name} is gone. The way is clear!")
+                else:
+                    await out.say(f"You have defeated the {enemy.name}!")
+                return result
+            if result == 'dead':
+                await out.say("You have been defeated.")
+                return result
+            if result == 'fled':
+                return result
+
+    async def combat_action(self, menu, targets=()):
+        """
+        Prompts until the player picks a weapon or flees, then a target for
+        an attack or Jarate (see game.targeted) if targets lists more than
+        one (index, enemy). Returns (action, target
+        index or None); the action is HESITATE once the turn's input budget or
+        time limit is used up, so a client sending garbage (or nothing) can't
+        hold a fight open.
+        """
+        out = self.out
+        weapon_lines, weapon_choices, weapon_prompt = menu
+        deadline = time.monotonic() + self.turn_timeout if self.turn_timeout else None
+        choosing_weapon = False
+        weapon = None # Set once a weapon is picked and a target is still needed
+        try:
+            for _ in range(self.input_budget):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                if weapon is not None:
+                    out.line("Choose your target:")
+                    for n, (_, enemy) in enumerate(targets, 1):
+                        out.line(f"  {n}. {enemy.name} ({enemy.current_health}/{enemy.max_health} HP)")
+                    choice = await out.ask(f"Enter target number (1-{len(targets)}):", timeout)
+                    if choice.isdigit() and 1 <= int(choice) <= len(targets):
+                        return weapon, targets[int(choice) - 1][0]
+                    out.line("Invalid target.")
+                    self.reprompted('target')
+                elif not choosing_weapon:
+                    out.line("\nWhat will you do?")
+                    out.line("  1. Attack")
+                    out.line("  2. Check Stats / Inventory")
+                    out.line("  3. Flee")
+                    choice = await out.ask("Choose an action (1-3):", timeout)
+                    if choice == '1':
+                        choosing_weapon = True
+                    elif choice == '2':
+                        out.capture(self.player.show_stats)
+                        out.capture(self.player.show_inventory)
+                        self.reprompted('player_turn')
+                    elif choice == '3':
+                        return FLEE, None
+                    else:
+                        out.line("That's not a valid command.")
+                        self.reprompted('player_turn')
+                else:
+                    out.line("Choose your weapon:")
+                    for line in weapon_lines:
+                        out.line(line)
+                    weapon = weapon_choices.get(await out.ask(weapon_prompt, timeout))
+                    if weapon is not None and (len(targets) < 2 or not targeted(weapon)):
+                        return weapon, None
+                    if weapon is None:
+                        out.line("Invalid weapon choice.")
+                        self.reprompted('player_attack')
+        except asyncio.TimeoutError:
+            pass
+        if self.metrics is not None:
+            self.metrics.count('hesitations')
+        return HESITATE, None
+
+
+def describe(log, player, enemy, enemies=None):
+    """Turns engine events into the same messages game.Combat prints. In a squad fight, ('enemy', i) switches enemy."""
+    lines = []
+    for event in log:
+        kind = event[0]
+        if kind == 'enemy':
+            enemy = enemies[event[1]]
+        elif kind == 'splash':
+            lines.append(f"The blast catches the {enemy.name}! ({event[1]}/{enemy.max_health} HP remaining)")
+            if event[1] == 0:
+                lines.append(f"  {enemy.name} has been defeated!")
+        elif kind == 'utility':
+            lines.append(f"You use your {event[1]}!")
+            lines.append(f"  {player.name}: {event[2]}/{player.max_health} HP")
+        elif kind == 'reload':
+            lines.append(f"Your {event[1]} is empty. You reload it!")
+        elif kind == 'empty':
+            lines.append(f"Your {event[1]} is out of ammo!" + (f" You switch to your {event[2]}." if event[2] else ""))
+        elif kind == 'attack':
+            _, name, dmg, mini_crit, jarated, crit = event
+            lines.append(f"You attack with your {name}!")
+            if dmg is None:
+                lines.append("Your attack missed!")
+                continue
+            if mini_crit:
+                lines.append("Mini-Crit!")
+            if jarated:
+                lines.append("Jarate damage!")
+            if crit:
+                lines.append("CRITICAL HIT!")
+            lines.append(f"  {enemy.name} takes {dmg} damage! ({enemy.current_health}/{enemy.max_health} HP remaining)")
+            if enemy.current_health == 0:
+                lines.append(f"  {enemy.name} has been defeated!")
+        elif kind == 'flee':
+            lines.append("You try to run away...")
+            lines.append("You successfully escaped!" if event[1] else "You couldn't get away!")
+        elif kind == 'hesitate':
+            lines.append("You hesitate and lose your turn!")
+        elif kind == 'dodge':
+            lines.append(f"The {enemy.name} attacks, but you dodge it with Bonk!")
+        elif kind == 'enemy_retreat':
+            lines.append(ENEMY_MOVES[event[1]]['text'].format(name=enemy.name))
+        elif kind == 'enemy_heal':
+            lines.append(ENEMY_MOVES[event[1]]['text'].format(name=enemy.name))
+            lines.append(f"  {enemy.name} heals for {event[2]} HP! ({event[3]}/{enemy.max_health} HP remaining)")
+        elif kind == 'enemy_attack':
+            lines.append(ENEMY_MOVES[event[2]]['text'].format(name=enemy.name))
+            if event[1] is None:
+                lines.append(f"{enemy.name}'s attack misses!")
+                continue
+            lines.append(f"{enemy.name} hits you for {event[1]} damage!")
+            lines.append(f"  {player.name} takes {event[1]} damage! ({player.current_health}/{player.max_health} HP remaining)")
+            if player.current_health == 0:
+                lines.append(f"  {player.name} has been defeated!")
+    return lines
+
+
+# ### Server ###
+
+class GameServer:
+    """Accepts connections and runs one GameSession coroutine per client."""
+    def __init__(self, mode='budget', max_sessions=10000, seed=None, park_dir=None, metrics=None,
+                 input_budget=INPUT_BUDGET, turn_timeout=TURN_TIMEOUT):
+        self.mode = mode
+        self.metrics = metrics
+        self.limits = {'input_budget': input_budget, 'turn_timeout': turn_timeout} # For every session
+        self.max_sessions = max_sessions
+        self.sessions = set()
+        self.rolls = RollService(seed) # Each session rolls from its own stream of this
+        self.session_count = 0
+        self.park_dir = park_dir # Where sessions that hang up mid-run are saved
+
+    async def handle(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(b"Server full. Try again later.\n")
+            await writer.drain()
+            writer.close()
+            return
+        self.session_count += 1
+        out = SessionOutput(reader, writer, self.mode, metrics=self.metrics)
+        rng = self.rolls.stream(self.session_count)
+        session = code = None
+        started = time.perf_counter()
+        ending = 'hung_up'
+        try:
+            if self.park_dir:
+                session, code = await self.unpark(out, rng)
+            session = session or GameSession(out, rng=rng, **self.limits)
+            self.sessions.add(session)
+            ending = await session.run()
+        except (SessionClosed, ConnectionError) as closed:
+            hung_up = getattr(closed, 'hung_up', True)
+            ending = 'hung_up' if hung_up else 'quit'
+            if self.park_dir and hung_up and session is not None and session.started:
+                self.park(session, code or secrets.token_hex(4))
+                ending = 'parked'
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+            if self.metrics is not None:
+                self.metrics.time('session', time.perf_counter() - started)
+                self.metrics.count('runs', ending=ending)
+
+    def parked_path(self, code):
+        return os.path.join(self.park_dir, f"{code}.snap")
+
+    async def unpark(self, out, rng):
+        """Asks for a resume code. Returns (restored session or None, code for this run)."""
+        code = await out.ask("Resume code (or press Enter for a new run):")
+        path = self.parked_path(code) if code.isalnum() else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.remove(path)
+            return GameSession.restore(out, data, rng=rng, **self.limits), code
+        if code:
+            out.line("No parked run with that code. Starting a new one.")
+        code = secrets.token_hex(4)
+        out.line(f"Your resume code is {code}. If you lose connection, use it to pick up where you left off.")
+        return None, code
+
+    def park(self, session, code):
+        """Saves a session that hung up so it can be resumed with code."""
+        snapshot.write(self.parked_path(code), session.snapshot())
+
+    async def serve(self, host='127.0.0.1', port=2727, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host TF2: The Text Adventure for many players at once.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2727)
+    parser.add_argument('--unix', default=None, help="listen on a local socket path instead of TCP")
+    parser.add_argument('--text', choices=Renderer.MODES, default='budget')
+    parser.add_argument('--max-sessions', type=int, default=10000)
+    parser.add_argument('--seed', default=None, help="server seed; session N always gets the same dice")
+    parser.add_argument('--park-dir', default=None, help="save sessions that hang up here so players can resume")
+    parser.add_argument('--metrics', metavar='FILE', help="record timings and counters to FILE (JSON lines) and a .prom file")
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help="seconds between --metrics snapshots")
+    parser.add_argument('--input-budget', type=int, default=INPUT_BUDGET, help="answers per combat turn before it is lost")
+    parser.add_argument('--turn-timeout', type=float, default=TURN_TIMEOUT, help="seconds per combat turn before it is lost (0: no limit)")
+    args = parser.parse_args(argv)
+    if args.park_dir:
+        os.makedirs(args.park_dir, exist_ok=True)
+    metrics = exporter = None
+    if args.metrics:
+        metrics = Metrics()
+        exporter = Exporter(metrics, *export_paths(args.metrics), args.metrics_interval).start()
+    try:
+        asyncio.run(GameServer(args.text, args.max_sessions, args.seed, args.park_dir, metrics,
+                               args.input_budget, args.turn_timeout or None).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exporter:
+            exporter.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo balance simulator for TF2: The Text Adventure.
+Fights every class x loadout x enemy combination N times through the
+headless engine, spread across a process pool, and reports win rate,
+turns-to-kill, HP left, flee success and ammo use (gun shots, reload
+turns, and fights that end with a gun out of ammo). --ammo starts every fight short of spare ammo,
+as deep into a campaign.
+
+Usage:
+    python simulate.py --fights 2000 --seed 42
+    python simulate.py --ammo 25
+"""
+
+import itertools
+import sys
+from multiprocessing import Pool, cpu_count
+
+from game import CLASSES, WEAPON_CHOICES, ENEMIES, LOADOUT_SLOTS, AMMO_RESERVE, Enemy
+from engine import GreedyPolicy, RandomPolicy, TacticalPolicy, FleeWhenLowPolicy, HeadlessCombat, build_player
+from rolls import RollService
+
+POLICIES = ['greedy', 'random', 'tactical']
+ROLL_BLOCK = 4096 # Random floats drawn at a time by each task's RollService
+
+
+# ### Loadouts ###
+
+def all_loadouts(class_key):
+    """Every legal loadout for a class, as tuples of weapon keys in slot order."""
+    choices = WEAPON_CHOICES[class_key]
+    slots = [choices[slot] for slot in LOADOUT_SLOTS if choices.get(slot)]
+    return list(itertools.product(*slots))
+
+def all_matchups():
+    """Yields (class_key, loadout, enemy_key) for every combination."""
+    for class_key in CLASSES:
+        for loadout in all_loadouts(class_key):
+            for enemy_key in ENEMIES:
+                yield class_key, loadout, enemy_key
+
+
+# ### Aggregates ###
+
+class Stats:
+    """Running totals for one matchup. Merging two Stats is order-independent."""
+    def __init__(self):
+        self.fights = 0
+        self.wins = 0
+        self.deaths = 0
+        self.fled = 0
+        self.flee_attempts = 0
+        self.win_turns = 0 # Summed over won fights only
+        self.win_hp = 0 # HP left, summed over won fights only
+        self.shots = 0 # Gun shots fired
+        self.reloads = 0 # Turns spent reloading
+        self.dry = 0 # Fights that ended with a gun out of ammo
+
+    def add(self, result):
+        self.fights += 1
+        self.flee_attempts += result.flee_attempts
+        self.shots += result.shots
+        self.reloads += result.reloads
+        self.dry += result.dry > 0
+        if result.outcome == 'won':
+            self.wins += 1
+            self.win_turns += result.turns
+            self.win_hp += result.player_hp
+        elif result.outcome == 'dead':
+            self.deaths += 1
+        elif result.outcome == 'fled':
+            self.fled += 1
+
+    def merge(self, other):
+        for field in vars(other):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def win_rate(self):
+        return self.wins / self.fights if self.fights else 0.0
+
+    def mean_turns(self):
+        return self.win_turns / self.wins if self.wins else 0.0
+
+    def mean_hp_left(self):
+        return self.win_hp / self.wins if self.wins else 0.0
+
+    def flee_success(self):
+        return self.fled / self.flee_attempts if self.flee_attempts else 0.0
+
+    def mean_shots(self):
+        return self.shots / self.fights if self.fights else 0.0
+
+    def mean_reloads(self):
+        return self.reloads / self.fights if self.fights else 0.0
+
+    def dry_rate(self):
+        return self.dry / self.fights if self.fights else 0.0
+
+
+# ### Workers ###
+
+def task_seed(seed, class_key, loadout, enemy_key, chunk):
+    """Seed for one chunk of fights. Depends only on the task, never on which worker runs it."""
+    return f"{seed}:{class_key}:{'/'.join(loadout)}:{enemy_key}:{chunk}"
+
+def make_policy(name, rng, flee_below):
+    policy = RandomPolicy(rng) if name == 'random' else TacticalPolicy() if name == 'tactical' else GreedyPolicy()
+    if flee_below:
+        policy = FleeWhenLowPolicy(policy, flee_below)
+    return policy
+
+def run_task(task):
+    """Worker entry point: fights one chunk of a matchup with its own RNG stream."""
+    class_key, loadout, enemy_key, chunk, fights, seed, policy_name, flee_below, ammo = task
+    rng = RollService(task_seed(seed, class_key, loadout, enemy_key, chunk), block=ROLL_BLOCK)
+    policy = make_policy(policy_name, rng, flee_below)
+    stats = Stats()
+    for _ in range(fights):
+        player = build_player(class_key, loadout)
+        for slot, full in enumerate(AMMO_RESERVE):
+            player.ammo[slot] = full * ammo // 100
+        stats.add(HeadlessCombat(player, Enemy(enemy_key), policy, rng).run())
+    return (class_key, loadout, enemy_key), stats
+
+def make_tasks(fights, seed, policy_name, flee_below, chunk_size, ammo=100):
+    tasks = []
+    for class_key, loadout, enemy_key in all_matchups():
+        for chunk, start in enumerate(range(0, fights, chunk_size)):
+            tasks.append((class_key, loadout, enemy_key, chunk, min(chunk_size, fights - start), seed, policy_name,
+                          flee_below, ammo))
+    return tasks
+
+def simulate(fights=1000, seed=0, workers=None, policy='greedy', flee_below=0, chunk_size=500, ammo=100):
+    """
+    Runs the full sweep and yields (done, total, results) after every finished
+    chunk, where results maps (class_key, loadout, enemy_key) to its Stats so far.
+    The final yield holds the complete, reproducible aggregates.
+    """
+    tasks = make_tasks(fights, seed, policy, flee_below, chunk_size, ammo)
+    results = {}
+    workers = workers or cpu_count()
+    if workers == 1:
+        finished = map(run_task, tasks)
+        pool = None
+    else:
+        pool = Pool(workers)
+        finished = pool.imap_unordered(run_task, tasks)
+    try:
+        for done, (key, stats) in enumerate(finished, 1):
+            results.setdefault(key, Stats()).merge(stats)
+            yield done, len(tasks), results
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+# ### Reporting ###
+
+def format_report(results):
+    lines = [f"{'Class':<9} {'Loadout':<48} {'Enemy':<16} {'Win%':>6} {'Turns':>6} {'HP left':>8} {'Flee%':>6} "
+             f"{'Shots':>6} {'Reload':>6} {'Dry%':>6}"]
+    for (class_key, loadout, enemy_key), stats in sorted(results.items()):
+        lines.append(f"{class_key:<9} {'/'.join(loadout):<48} {enemy_key:<16} "
+                     f"{stats.win_rate() * 100:>6.1f} {stats.mean_turns():>6.2f} "
+                     f"{stats.mean_hp_left():>8.1f} {stats.flee_success() * 100:>6.1f} "
+                     f"{stats.mean_shots():>6.2f} {stats.mean_reloads():>6.2f} {stats.dry_rate() * 100:>6.1f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    import argparse # Only the command line needs it; every spawned worker imports this module
+    parser = argparse.ArgumentParser(description="Monte Carlo balance sweep over every class, loadout and enemy.")
+    parser.add_argument('--fights', type=int, default=1000, help="fights per matchup")
+    parser.add_argument('--seed', default='0', help="base seed; the same seed always gives the same report")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--policy', choices=POLICIES, default='greedy')
+    parser.add_argument('--flee-below', type=int, default=0, help="flee when HP drops below this percent")
+    parser.add_argument('--chunk', type=int, default=500, help="fights per task")
+    parser.add_argument('--ammo', type=int, default=100, help="spare ammo each fight starts with, as a percent of a full reserve")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for done, total, results in simulate(args.fights, args.seed, args.workers, args.policy, args.flee_below, args.chunk,
+                                         args.ammo):
+        fights = sum(stats.fights for stats in results.values())
+        wins = sum(stats.wins for stats in results.values())
+        sys.stderr.write(f"\r[{done}/{total}] {fights} fights, overall win rate {wins / fights * 100:.1f}%")
+    sys.stderr.write("\n")
+    print(format_report(results))
+
+if __name__ == "__main__":
+    main()
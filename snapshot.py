@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Session snapshots for TF2: The Text Adventure.
+A snapshot is everything needed to pick a run back up: the Player (stats,
+inventory ids, ammo and clips, flags), the current location, the map overlay and,
+mid-fight, the Enemy and turn counter. It packs into a versioned binary
+record of roughly 60-100 bytes in a few microseconds.
+
+Many snapshots can be written into one archive file and read back through
+mmap without loading the whole file:
+
+    write_archive('parked.snaps', records)
+    archive = SnapshotArchive('parked.snaps')
+    snap = archive[12345]
+
+Run this file directly to check a round trip and time it:
+    python snapshot.py
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from game import AMMO_SLOTS, CLASSES, Player, Enemy
+from mapgraph import MapOverlay
+
+MAGIC = b'TFSS'
+VERSION = 3
+
+# magic, version, max HP, HP, speed, flags, flee bonus, spare ammo x3, clips x3
+# (both in AMMO_SLOTS order), enemy HP, enemy Jarate turns, combat turn, flee attempts
+FIXED = struct.Struct(f'<4sBHHHBB{len(AMMO_SLOTS)}H{len(AMMO_SLOTS)}HHBHH')
+SHORT = struct.Struct('<B') # Length of a short string
+LONG = struct.Struct('<I') # Length of a bitset (a 1M-location map's visited set is 125 KB)
+
+# Bits of the flags byte
+SENTRY_BUILT, INVIS_WATCH, DODGING, MINI_CRIT, IN_COMBAT, CONFUSED, HEAL_USED = (1 << i for i in range(7))
+
+# enemy is None outside a fight
+Snapshot = namedtuple('Snapshot', ['player', 'location_key', 'overlay', 'enemy', 'turn', 'flee_attempts'])
+
+
+# ### Records ###
+
+def dumps(player, location_key, overlay, enemy=None, turn=0, flee_attempts=0):
+    """Packs one session into bytes."""
+    flags = ((SENTRY_BUILT if player.sentry_built else 0) | (INVIS_WATCH if player.has_invis_watch else 0)
+             | (DODGING if player.is_dodging else 0) | (MINI_CRIT if player.combat_buff else 0))
+    if enemy is not None:
+        flags |= (IN_COMBAT | (CONFUSED if enemy.is_confused else 0)
+                  | (HEAL_USED if enemy.heals_left < enemy.ai.heals else 0))
+    parts = [FIXED.pack(MAGIC, VERSION, player.max_health, player.current_health, player.speed, flags,
+                        player.flee_bonus, *player.ammo, *player.clips,
+                        enemy.current_health if enemy else 0, enemy.debuff_turns if enemy else 0,
+                        turn, flee_attempts)]
+    for text in (player.name.encode(), player.class_key.encode(), player.weapon_ids,
+                 location_key.encode(), enemy.key.encode() if enemy else b''):
+        parts.append(SHORT.pack(len(text)))
+        parts.append(text)
+    for bits in (overlay.items_taken, overlay.visited):
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        parts.append(LONG.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def loads(buffer, offset=0):
+    """Unpacks the snapshot at offset in buffer (bytes, memoryview or mmap)."""
+    fields = FIXED.unpack_from(buffer, offset)
+    magic, version, max_health, health, speed, flags, flee_bonus = fields[:7]
+    ammo, clips = fields[7:7 + len(AMMO_SLOTS)], fields[7 + len(AMMO_SLOTS):7 + 2 * len(AMMO_SLOTS)]
+    enemy_hp, debuff_turns, turn, flee_attempts = fields[7 + 2 * len(AMMO_SLOTS):]
+    if magic != MAGIC:
+        raise ValueError("Not a session snapshot")
+    if version != VERSION:
+        raise ValueError(f"Snapshot version {version}; this game reads version {VERSION}")
+    pos = offset + FIXED.size
+
+    texts = []
+    for _ in range(5):
+        length, = SHORT.unpack_from(buffer, pos)
+        pos += SHORT.size
+        texts.append(bytes(buffer[pos:pos + length]))
+        pos += length
+    bitsets = []
+    for _ in range(2):
+        length, = LONG.unpack_from(buffer, pos)
+        pos += LONG.size
+        bitsets.append(int.from_bytes(buffer[pos:pos + length], 'little'))
+        pos += length
+    name, class_key, weapon_ids, location_key, enemy_key = texts
+
+    player = Player.__new__(Player) # Every slot is set below
+    player.name = name.decode()
+    player.class_key = class_key.decode()
+    player.player_class = CLASSES[player.class_key]
+    player.max_health = max_health
+    player.current_health = health
+    player.speed = speed
+    player.weapon_ids = weapon_ids
+    player.ammo = array('H', ammo)
+    player.clips = array('H', clips)
+    player.sentry_built = bool(flags & SENTRY_BUILT)
+    player.has_invis_watch = bool(flags & INVIS_WATCH)
+    player.flee_bonus = flee_bonus
+    player.is_dodging = bool(flags & DODGING)
+    player.combat_buff = 'mini-crit' if flags & MINI_CRIT else None
+
+    enemy = None
+    if flags & IN_COMBAT:
+        enemy = Enemy(enemy_key.decode())
+        enemy.current_health = enemy_hp
+        enemy.debuff_turns = debuff_turns
+        enemy.is_confused = bool(flags & CONFUSED)
+        if flags & HEAL_USED:
+            enemy.heals_left = 0
+    return Snapshot(player, location_key.decode(), MapOverlay(*bitsets), enemy, turn, flee_attempts)
+
+def save(path, *args, **kwargs):
+    """Writes dumps(*args) to path."""
+    write(path, dumps(*args, **kwargs))
+
+def write(path, record):
+    """Writes a record to path. The old file stays intact until the new one is complete."""
+    temp = f"{path}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(record)
+    os.replace(temp, path)
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+# ### Archives ###
+
+ARCHIVE_MAGIC = b'TFSA'
+ARCHIVE_HEADER = struct.Struct('<4sBQ') # magic, version, record count; then count + 1 offsets
+
+def write_archive(path, records):
+    """Writes many dumps() records into one file with an offset index."""
+    records = list(records)
+    offsets = [ARCHIVE_HEADER.size + 8 * (len(records) + 1)]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    with open(path, 'wb') as f:
+        f.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, VERSION, len(records)))
+        f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        f.writelines(records)
+
+class SnapshotArchive:
+    """Memory-mapped archive. Records are only read (and unpacked) when asked for."""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = ARCHIVE_HEADER.unpack_from(self.map)
+        if magic != ARCHIVE_MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} snapshot archive")
+        self.offsets = memoryview(self.map)[ARCHIVE_HEADER.size:ARCHIVE_HEADER.size + 8 * (self.count + 1)].cast('Q')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return loads(self.map, self.offsets[i])
+
+    def raw(self, i):
+        """Record i as bytes, without unpacking it."""
+        return self.map[self.offsets[i]:self.offsets[i + 1]]
+
+    def close(self):
+        self.offsets.release()
+        self.map.close()
+
+
+# ### Self-check ###
+
+def main():
+    import tempfile
+    from engine import build_player
+
+    player = build_player('spy', ['revolver', 'knife', 'invis_watch'], name="Check")
+    player.current_health = 77
+    player.combat_buff = 'mini-crit'
+    player.clips[0], player.ammo[0] = 2, 13
+    enemy = Enemy('heavy_bot')
+    enemy.current_health, enemy.debuff_turns, enemy.heals_left = 123, 1, 0
+    overlay = MapOverlay(0b101, 0b1111)
+    record = dumps(player, 'hallway', overlay, enemy, turn=3, flee_attempts=1)
+    snap = loads(record)
+    ok = (dumps(snap.player, snap.location_key, snap.overlay, snap.enemy, snap.turn, snap.flee_attempts) == record
+          and [w['name'] for w in snap.player.inventory] == [w['name'] for w in player.inventory]
+          and snap.enemy.current_health == 123 and snap.enemy.heals_left == 0
+          and snap.player.combat_buff == 'mini-crit'
+          and snap.player.ammo_status() == player.ammo_status() == "Revolver 2/13")
+    print(f"{'ok  ' if ok else 'FAIL'} round trip, {len(record)} bytes")
+
+    n = 100_000
+    start = time.perf_counter()
+    for _ in range(n):
+        dumps(player, 'hallway', overlay, enemy, 3, 1)
+    print(f"dumps {(time.perf_counter() - start) / n * 1e6:.2f} us")
+    start = time.perf_counter()
+    for _ in range(n):
+        loads(record)
+    print(f"loads {(time.perf_counter() - start) / n * 1e6:.2f} us")
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'check.snaps')
+        write_archive(path, [record] * n)
+        start = time.perf_counter()
+        archive = SnapshotArchive(path)
+        opened = time.perf_counter() - start
+        ok &= archive[n - 1].location_key == 'hallway' and archive.raw(0) == record
+        print(f"{'ok  ' if ok else 'FAIL'} archive of {n} snapshots ({os.path.getsize(path)} bytes) opened in {opened * 1e3:.2f} ms")
+        archive.close()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Exact fight solver for TF2: The Text Adventure.
+Treats one Combat as a Markov decision process over
+(player HP, enemy HP, combat_buff, debuff_turns) and computes the win, lose
+and flee probabilities of every state under the optimal policy. The enemy
+plays its compiled policy (game.enemy_ai), which is a fixed function of the
+state, so it is folded into the enemy's turn; a retreat counts as a win.
+
+Without its heal, enemy HP never goes up, so states are solved one enemy-HP
+level at a time, lowest first. Inside a level only misses, utilities and
+failed escapes can loop, and those are settled by value iteration to
+floating-point precision. A bot that can still heal is solved in a second
+pass on top of the first: healing jumps to a state of the heal-spent fight.
+is_dodging never survives to the player's decision (player_turn resets it),
+and a dodge-only utility (Bonk) just skips the enemy's turn without changing
+anything else, so it can never improve the odds and the solver leaves it out.
+Ammo is left out of the state too, as if every gun had a bottomless clip,
+so for guns that have to reload (or run dry) the odds are optimistic.
+
+Requires NumPy, like vector_combat.py:
+    python solver.py sniper sniper_rifle jarate kukri --enemy sentry_gun_boss
+"""
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; only the batch tools need it
+    np = None
+
+from game import ENEMIES, CRIT_CHANCE, HP_BUCKETS, STATUS_FLAGS, enemy_ai, flee_chance, frozen, hp_bucket
+from engine import FLEE, build_player
+
+# Probabilities for one state; they add up to 1 minus the chance of stalling forever
+Outcome = namedtuple('Outcome', ['win', 'lose', 'flee'])
+
+# The utility effects that change a fight's state (see game.WEAPONS 'effects')
+STATE_EFFECTS = ('heal', 'buff', 'debuff_turns')
+
+WIN, LOSE, FLEE_OUT = 0, 1, 2 # Component axis of every value array
+TOLERANCE = 1e-13
+STALL_PENALTY = 1e-12 # Breaks near-ties in favour of attacking, so the policy never stalls
+VALUE_SWEEPS = 20 # Value iteration sweeps per enemy-HP level before switching to policy iteration
+POLICY_STEPS = 50
+
+
+def utility_effect(weapon):
+    """A utility as the solver sees it: (heal, grants mini-crit, Jarate turns)."""
+    effects = weapon['effects']
+    return effects.get('heal', 0), 'buff' in effects, effects.get('debuff_turns', 0)
+
+def damage_distribution(weapon, buffed, jarated):
+    """
+    Exact distribution of one attack: an array p where p[d] is the chance of
+    dealing d damage (p[0] is a miss), following game.roll_attack.
+    """
+    lo, hi = weapon['damage']
+    hit = weapon['accuracy'] / 100
+    crit = CRIT_CHANCE / 100
+    per_roll = hit / (hi - lo + 1)
+    top = hi
+    for flag in (buffed, jarated):
+        if flag:
+            top = top * 3 // 2
+    probs = np.zeros(top * 2 + 1)
+    probs[0] = 1 - hit
+    for dmg in range(lo, hi + 1):
+        for flag in (buffed, jarated):
+            if flag:
+                dmg = dmg * 3 // 2 # int(dmg * 1.5) for whole numbers
+        probs[dmg] += per_roll * (1 - crit)
+        probs[dmg * 2] += per_roll * crit
+    return probs
+
+
+class Solution:
+    """Solved values and optimal actions for one loadout against one enemy."""
+    def __init__(self, actions, values, policy, start_hp, enemy_hp, spent=None):
+        self.actions = actions # Index -> weapon dict or FLEE
+        self.values = values # [enemy_hp, buff, debuff, component, player_hp]
+        self.policy = policy # [enemy_hp, buff, debuff, player_hp] -> action index
+        self.start_hp = start_hp
+        self.enemy_hp = enemy_hp
+        self.spent = spent # The same fight after the enemy has used its heal, if it has one
+
+    def with_start(self, start_hp):
+        spent = self.spent and self.spent.with_start(start_hp)
+        return Solution(self.actions, self.values, self.policy, start_hp, self.enemy_hp, spent)
+
+    def index(self, player_hp, enemy_hp, buff, debuff):
+        buff = min(int(bool(buff)), self.values.shape[1] - 1)
+        debuff = min(debuff, self.values.shape[2] - 1)
+        return enemy_hp, buff, debuff, player_hp
+
+    def outcome(self, player_hp=None, enemy_hp=None, buff=False, debuff=0, can_heal=True):
+        """Win/lose/flee probabilities from a state (default: the start of the fight)."""
+        if not can_heal and self.spent:
+            return self.spent.outcome(player_hp, enemy_hp, buff, debuff)
+        player_hp = self.start_hp if player_hp is None else player_hp
+        enemy_hp = self.enemy_hp if enemy_hp is None else enemy_hp
+        e, b, d, p = self.index(player_hp, enemy_hp, buff, debuff)
+        return Outcome(*(float(v) for v in self.values[e, b, d, :, p]))
+
+    def action(self, player_hp, enemy_hp, buff=False, debuff=0, can_heal=True):
+        """The optimal weapon (or FLEE) for a state."""
+        if not can_heal and self.spent:
+            return self.spent.action(player_hp, enemy_hp, buff, debuff)
+        return self.actions[self.policy[self.index(player_hp, enemy_hp, buff, debuff)]]
+
+
+class SolverPolicy:
+    """engine policy that plays the solved optimal action every turn."""
+    def __init__(self, solution):
+        self.solution = solution
+
+    def choose(self, fight):
+        return self.solution.action(fight.player.current_health, fight.enemy.current_health,
+                                    fight.player.combat_buff, fight.enemy.debuff_turns,
+                                    fight.enemy.heals_left > 0)
+
+
+# ### Solver ###
+
+_SOLUTIONS = {} # Memoized Solutions, keyed by everything that affects the rules
+
+def solve(player, enemy_key, flee_value=0.0, allow_flee=True, enemy_hp=None):
+    """
+    Solves player (its loadout, max HP, speed and flee items) against
+    enemy_key. The optimal policy maximizes P(win) + flee_value * P(flee).
+    Every enemy HP level up to enemy_hp (default: its ENEMIES health) is
+    solved, so lower health values can be read back without re-solving.
+    """
+    if np is None:
+        raise ImportError("solver needs NumPy: pip install numpy")
+
+    items = []
+    for weapon in player.combat_actions:
+        if weapon not in items:
+            items.append(weapon)
+    enemy_hp = enemy_hp or ENEMIES[enemy_key]['health']
+    # Keyed on the weapon and enemy stats themselves, like propagate.FightMatrices, so tuning them re-solves
+    key = (tuple(frozen(w) for w in items), player.max_health, flee_chance(player),
+           enemy_key, frozen(ENEMIES[enemy_key]), enemy_hp, flee_value, allow_flee)
+    if key not in _SOLUTIONS:
+        _SOLUTIONS[key] = _solve(items, player.max_health, flee_chance(player), ENEMIES[enemy_key], enemy_ai(enemy_key),
+                                 enemy_hp, flee_value, allow_flee)
+    return _SOLUTIONS[key].with_start(player.current_health)
+
+def _solve(items, max_hp, flee_percent, enemy, ai, levels, flee_value, allow_flee):
+    attacks = [w for w in items if not w.get('utility')]
+    utilities = [w for w in items if w.get('utility') and any(e in w['effects'] for e in STATE_EFFECTS)]
+    actions = attacks + utilities + ([FLEE] if allow_flee else [])
+    effects = [utility_effect(w) for w in utilities]
+
+    n_buff = 2 if any(e[1] for e in effects) else 1
+    n_debuff = 1 + max([e[2] for e in effects] + [0])
+    size = max_hp + 1 # Player HP 0..max_hp; 0 is dead
+
+    # Per-attack damage distributions, by (buffed, jarated)
+    dists = {}
+    for a, weapon in enumerate(attacks):
+        for b in range(n_buff):
+            for j in range(min(n_debuff, 2)):
+                dists[a, b, j] = damage_distribution(weapon, b, j)
+    pad = max(len(p) for p in dists.values()) if dists else 1
+
+    # Terminal value vectors over the component axis
+    win = np.array([1.0, 0.0, 0.0])[:, None]
+    dead = np.array([0.0, 1.0, 0.0])[:, None]
+    fled = np.array([0.0, 0.0, 1.0])[:, None]
+
+    # Enemy turn: its move is picked from the state, then the debuff
+    # countdown, then the move: a hit for lo..hi with accuracy chance, a heal
+    # or a retreat
+    countdown = [max(d - 1, 0) for d in range(n_debuff)]
+    hp = np.arange(size)
+    table = np.frombuffer(ai.table, dtype=np.uint8)
+    player_buckets = np.array([hp_bucket(h, max_hp) for h in hp])
+    soaked = (np.arange(n_debuff) > 0).astype(int)
+    choices = {} # (own HP bucket, can heal) -> move index per [buff, debuff, player_hp]
+
+    def enemy_choice(e, can_heal):
+        """The move the enemy's table picks at e HP for every buff, debuff and player HP."""
+        key = (hp_bucket(e, enemy['health']), can_heal)
+        if key not in choices:
+            states = ((key[0] * HP_BUCKETS + player_buckets[None, None, :]) << STATUS_FLAGS
+                      | soaked[None, :, None] | np.arange(n_buff)[:, None, None] << 1 | can_heal << 2)
+            choices[key] = table[states]
+        return choices[key]
+
+    def attack_turn(v, dead, move):
+        """Value before an attack of move's profile, from values v after it (countdown done)."""
+        lo, hi = move.damage
+        per_roll = move.accuracy / 100 / (hi - lo + 1)
+        padded = np.concatenate([np.broadcast_to(dead, v.shape[:-1] + (hi,)), v], axis=-1)
+        sums = np.concatenate([np.zeros(v.shape[:-1] + (1,)), np.cumsum(padded, axis=-1)], axis=-1)
+        window = sums[..., hp + hi - lo + 1] - sums[..., hp]
+        return (1 - move.accuracy / 100) * v + per_roll * window
+
+    def enemy_turn(v, dead, win, choice, healed):
+        """
+        Value before the enemy's turn, from values v after it. choice is the
+        enemy_choice array; healed maps a heal move to the (counted down)
+        values it jumps to.
+        """
+        v = v[:, countdown]
+        before = None
+        for m in np.unique(choice):
+            move = ai.moves[m]
+            if move.kind == 'attack':
+                result = attack_turn(v, dead, move)
+            elif move.kind == 'heal':
+                result = np.broadcast_to(healed[m], v.shape)
+            else:
+                result = np.broadcast_to(win, v.shape) # The way is clear
+            if before is None:
+                before = np.array(result)
+            else:
+                np.copyto(before, result, where=(choice == m)[:, :, None, :])
+        before[..., 0] = dead[:, 0]
+        return before
+
+    heal_index = {}
+    for heal, _, _ in effects:
+        idx = np.minimum(hp + heal, max_hp)
+        idx[0] = 0
+        heal_index[heal] = idx
+
+    flee = min(max(flee_percent, 0), 100) / 100
+    buff_rows = np.arange(n_buff)
+    debuff_rows = np.arange(n_debuff)
+    misses = np.array([[[dists[a, b, min(d, 1)][0] for d in debuff_rows] for b in buff_rows]
+                       for a in range(len(attacks))]).reshape(len(attacks), n_buff, n_debuff, 1, 1)
+
+    def q_values(v, outside, dead, fled, win, choice, healed):
+        """Value of every action from every state of one level, given that level's values v."""
+        before = enemy_turn(v, dead, win, choice, healed) # [buff, debuff, component, hp]
+        q = [outside[a] + misses[a] * before[0] for a in range(len(attacks))]
+        for heal, buffs, jarate in effects:
+            rows = np.ones_like(buff_rows) if buffs else buff_rows
+            cols = np.full_like(debuff_rows, jarate) if jarate else debuff_rows
+            q.append(before[rows][:, cols][..., heal_index[heal]])
+        if allow_flee:
+            q.append(flee * fled + (1 - flee) * before)
+        return np.stack(q)
+
+    def greedy(q):
+        score = q[:, :, :, WIN] + flee_value * q[:, :, :, FLEE_OUT]
+        score[len(attacks):] -= STALL_PENALTY
+        return np.argmax(score, axis=0)
+
+    def pick(q, best):
+        return np.take_along_axis(q, best[None, :, :, None, :], axis=0)[0]
+
+    # A fixed policy is linear within a level: v = c + M v. M only depends on
+    # the enemy's choices, which change at HP bucket edges, so it is built
+    # once per choice pattern by pushing unit vectors through q_values.
+    n = n_buff * n_debuff * size
+    units = np.eye(n).reshape(n_buff, n_debuff, size, n).transpose(0, 1, 3, 2)
+    no_outside = np.zeros((len(attacks), n_buff, n_debuff, n, size))
+    no_terminal = np.zeros((n, 1))
+    no_heal = dict.fromkeys(range(len(ai.moves)), 0.0)
+    unit_qs = {}
+    alive = (hp > 0).astype(float)
+
+    inverses = {} # Neighbouring levels usually share a policy, so each (I - M)^-1 is reused
+
+    def evaluate(best, outside, choice, healed):
+        """Exact values of a fixed policy on one level, or None if it can stall forever."""
+        const = pick(q_values(np.zeros((n_buff, n_debuff, 3, size)), outside, dead, fled, win, choice, healed), best)
+        const[..., 0] = dead[:, 0]
+        pattern = choice.tobytes()
+        if pattern not in unit_qs:
+            unit_qs[pattern] = q_values(units, no_outside, no_terminal, no_terminal, no_terminal, choice, no_heal)
+        key = (pattern, best.tobytes())
+        if key not in inverses:
+            step = pick(unit_qs[pattern], best) * alive # Dead states stay dead
+            matrix = step.transpose(0, 1, 3, 2).reshape(n, n)
+            try:
+                inverses[key] = np.linalg.inv(np.eye(n) - matrix)
+            except np.linalg.LinAlgError:
+                return None
+        solved = inverses[key] @ const.transpose(0, 1, 3, 2).reshape(n, 3)
+        return solved.reshape(n_buff, n_debuff, size, 3).transpose(0, 1, 3, 2)
+
+    def solve_levels(top, can_heal, spent):
+        """Values and policy for enemy HP 1..top; spent holds the heal-spent values heals jump to."""
+        # after_attack[pad + e, d] holds the value right after a player attack left
+        # the enemy at e HP (buff used up, Jarate turns d); e <= 0 is a win.
+        after_attack = np.zeros((pad + top + 1, n_debuff, 3, size))
+        after_attack[:pad + 1] = win
+        values = np.zeros((top + 1, n_buff, n_debuff, 3, size))
+        values[0] = win
+        policy = np.zeros((top + 1, n_buff, n_debuff, size), dtype=np.int16)
+
+        for e in range(1, top + 1):
+            choice = enemy_choice(e, can_heal)
+            healed = {m: spent[min(e + move.heal, enemy['health'])][:, countdown]
+                      for m, move in enumerate(ai.moves) if can_heal and move.kind == 'heal'}
+
+            # Attack outcomes that leave this level are already solved
+            outside = np.zeros((len(attacks), n_buff, n_debuff, 3, size))
+            for (a, b, j), probs in dists.items():
+                for d in debuff_rows:
+                    if min(d, 1) != j:
+                        continue
+                    lower = after_attack[pad + e - len(probs) + 1:pad + e, d]
+                    outside[a, b, d] = np.tensordot(probs[:0:-1], lower, axes=1)
+
+            # Value iteration settles most levels quickly. Slow ones (long heal
+            # loops) switch to policy iteration, which solves each policy exactly.
+            v = np.zeros((n_buff, n_debuff, 3, size))
+            v[..., 0] = dead[:, 0]
+            for sweep in range(VALUE_SWEEPS + POLICY_STEPS):
+                q = q_values(v, outside, dead, fled, win, choice, healed)
+                best = greedy(q)
+                if sweep == VALUE_SWEEPS:
+                    best = policy[e - 1] # Start from the level below, which is usually optimal here too
+                if sweep < VALUE_SWEEPS:
+                    new = pick(q, best)
+                    new[..., 0] = dead[:, 0]
+                else:
+                    new = evaluate(best, outside, choice, healed)
+                    if new is None:
+                        raise ArithmeticError("policy stalls forever; no exact solution")
+                done = np.abs(new - v).max() < TOLERANCE
+                v = new
+                if done:
+                    break
+
+            values[e] = v
+            policy[e] = greedy(q_values(v, outside, dead, fled, win, choice, healed))
+            after_attack[pad + e] = enemy_turn(v, dead, win, choice, healed)[0]
+        return values, policy
+
+    if not ai.heals:
+        values, policy = solve_levels(levels, 0, None)
+        return Solution(actions, values, policy, max_hp, levels)
+    # Heals can lift the enemy above levels (up to its max health), so the spent pass goes that high
+    heal = max(move.heal for move in ai.moves)
+    spent_values, spent_policy = solve_levels(max(levels, min(levels + heal, enemy['health'])), 0, None)
+    values, policy = solve_levels(levels, 1, spent_values)
+    spent = Solution(actions, spent_values, spent_policy, max_hp, levels)
+    return Solution(actions, values, policy, max_hp, levels, spent)
+
+
+def main(argv=None):
+    import argparse # Only the command line needs it; explore.ExactOdds imports this module
+    parser = argparse.ArgumentParser(description="Exact win/lose/flee odds for one loadout against one enemy.")
+    parser.add_argument('class_key')
+    parser.add_argument('weapons', nargs='+')
+    parser.add_argument('--enemy', default='sentry_gun_boss', choices=list(ENEMIES))
+    parser.add_argument('--flee-value', type=float, default=0.0, help="worth of escaping, relative to a win")
+    parser.add_argument('--enemy-hp', type=int, default=None, help="override the enemy's health")
+    args = parser.parse_args(argv)
+
+    player = build_player(args.class_key, args.weapons)
+    solution = solve(player, args.enemy, args.flee_value, enemy_hp=args.enemy_hp)
+    odds = solution.outcome()
+    print(f"{player.name} vs {ENEMIES[args.enemy]['name']}: "
+          f"win {odds.win:.6f}, lose {odds.lose:.6f}, flee {odds.flee:.6f}")
+    first = solution.action(player.current_health, solution.enemy_hp)
+    print(f"Opening move: {first if first == FLEE else first['name']}")
+
+if __name__ == "__main__":
+    main()
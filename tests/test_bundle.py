@@ -0,0 +1,63 @@
+import marshal
+
+import pytest
+
+import game
+from bundle import Bundle
+from game import (AMMO_SLOT_TABLES, CLASSES, CLASS_OPTIONS, ENEMIES, MAPS, MAP_DATA, WEAPONS, WEAPON_CHOICES,
+                  ContentError, ammo_slot_table, build_tables, class_options, compile_enemy_ai, compile_named_map,
+                  decode_enemy_ai, enemy_ai)
+
+
+class CountingBuild:
+    """build_tables, counting the calls."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return build_tables()
+
+def test_bundle_is_reused_then_rebuilt(tmp_path):
+    path = tmp_path / 'content.bundle'
+    build = CountingBuild()
+    first = Bundle(build, path=str(path))
+    ai = first.load('enemy_ai', 'heavy_bot')
+    assert build.calls == 1 and path.exists()
+    assert decode_enemy_ai(ai) == compile_enemy_ai(ENEMIES['heavy_bot'])
+    assert Bundle(build, path=str(path)).load('enemy_ai', 'heavy_bot') == ai
+    assert build.calls == 1 # Read back, not rebuilt
+
+    path.write_bytes(b'not a bundle')
+    assert Bundle(build, path=str(path)).load('enemy_ai', 'heavy_bot') == ai
+    assert build.calls == 2
+
+    stamp, blobs = marshal.loads(path.read_bytes())
+    path.write_bytes(marshal.dumps((stamp[:-1] + ((0, 0),), blobs))) # As if a source file had changed
+    Bundle(build, path=str(path)).load('enemy_ai', 'heavy_bot')
+    assert build.calls == 3
+
+def test_unwritable_bundle_builds_in_memory(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text("")
+    bundle = Bundle(build_tables, path=str(blocker / 'content.bundle'))
+    assert bundle.load('ammo_slots', 'heavy') == ammo_slot_table('heavy')
+
+def test_lazy_tables_match_fresh_builds():
+    for class_key in WEAPON_CHOICES:
+        assert AMMO_SLOT_TABLES[class_key] == ammo_slot_table(class_key)
+    for class_key in CLASSES:
+        assert CLASS_OPTIONS[class_key] == class_options(class_key)
+    for key in ENEMIES:
+        assert enemy_ai(key) == compile_enemy_ai(ENEMIES[key])
+    for name in MAP_DATA:
+        assert MAPS[name].to_data() == compile_named_map(name).to_data()
+    assert game.DUSTBOWL is MAPS['dustbowl']
+
+def test_broken_content_lists_every_problem(monkeypatch):
+    monkeypatch.setitem(WEAPONS, 'bad_gun', dict(WEAPONS['pistol'], damage=(9, 1), accuracy=120))
+    monkeypatch.setitem(ENEMIES, 'bad_bot', dict(ENEMIES['heavy_bot'], policy='coward'))
+    with pytest.raises(ContentError) as error:
+        build_tables()
+    assert sorted(error.value.problems) == ["enemy bad_bot: unknown policy 'coward'",
+                                            "weapon bad_gun: accuracy 120", "weapon bad_gun: damage range 9-1"]
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from playthrough import random_script
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Plays game.py as a script, then reports what the game module (the one the tools import) saw
+RUN = """
+import runpy, sys
+sys.argv = ['game.py'] + sys.argv[1:]
+runpy.run_path('game.py', run_name='__main__')
+import game, snapshot
+print(game.player is not None, game.ROLLS.seed, snapshot.Player is game.Player)
+"""
+
+
+def test_script_plays_on_the_game_module(tmp_path):
+    script = tmp_path / 'answers.txt'
+    script.write_text("\n".join(random_script(3, 400)) + "\n")
+    save = tmp_path / 'run.sav'
+    done = subprocess.run([sys.executable, '-c', RUN, '--text', 'instant', '--no-hints', '--seed', 'cli',
+                           '--script', str(script), '--save', str(save)],
+                          cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert done.returncode == 0, done.stderr
+    assert done.stdout.splitlines()[-1] == "True cli True"
+    assert save.exists()
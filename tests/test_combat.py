@@ -0,0 +1,40 @@
+import io
+import random
+
+import pytest
+
+import game
+from game import Combat, Enemy, Renderer, ScriptedInput
+from engine import build_player
+
+
+@pytest.fixture
+def quiet():
+    previous = game.set_renderer(Renderer('instant', stream=io.StringIO()))
+    yield
+    game.set_renderer(previous)
+
+def scripted_turns(lines, input_budget, turns):
+    """Plays turns player turns of one fight on lines; returns their outcomes and the answers left."""
+    fight = Combat(build_player('soldier', ['shovel']), Enemy('heavy_bot'), rng=random.Random(0), input_budget=input_budget)
+    script = ScriptedInput(lines, echo=False)
+    previous = game.set_input(script)
+    try:
+        outcomes = [fight.player_turn() for _ in range(turns)]
+    finally:
+        game.set_input(previous)
+    return outcomes, len(script.lines) - script.pos
+
+def test_bad_input_uses_up_the_turn(quiet):
+    # Nonsense, stats, then an attack with no valid weapon: every turn runs out of answers
+    lines = ['x', '2', '1', '9', '9'] * 3
+    outcomes, left = scripted_turns(lines, input_budget=5, turns=3)
+    assert outcomes == ['hesitated'] * 3
+    assert left == 0
+
+def test_a_long_run_of_bad_input_does_not_recurse(quiet):
+    # More answers per turn than the default recursion limit has frames
+    outcomes, left = scripted_turns(['x'] * 10000 + ['1', '1'], input_budget=5000, turns=3)
+    assert outcomes[:2] == ['hesitated', 'hesitated']
+    assert outcomes[2] != 'hesitated' # The next turn still takes a valid attack
+    assert left == 0
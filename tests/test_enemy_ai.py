@@ -0,0 +1,32 @@
+from game import ENEMIES, ENEMY_AI, Enemy, Player, ai_state, compile_enemy_ai, enemy_ai, enemy_move
+
+
+def move_at(enemy, player, own_hp, player_hp):
+    enemy.current_health, player.current_health = own_hp, player_hp
+    return enemy_move(enemy, player).name
+
+def test_policies():
+    player = Player("Test")
+    player.set_class('heavy')
+    scout = Enemy('scout_bot')
+    assert move_at(scout, player, 10, 300) == 'retreat' # Badly hurt, facing a healthy merc
+    assert move_at(scout, player, 100, 30) == 'focus' # Finishes off a wounded merc
+    assert move_at(scout, player, 100, 300) == 'attack'
+    tank = Enemy('heavy_bot')
+    assert move_at(tank, player, 50, 300) == 'heal'
+    tank.heals_left = 0
+    assert move_at(tank, player, 50, 300) == 'attack' # One heal per fight
+
+def test_bundle_matches_a_fresh_compile():
+    for key, enemy in ENEMIES.items():
+        assert enemy_ai(key) == compile_enemy_ai(enemy)
+
+def test_tuned_stats_recompile(monkeypatch):
+    before = enemy_ai('soldier_bot')
+    monkeypatch.setitem(ENEMIES, 'soldier_bot', dict(ENEMIES['soldier_bot'], accuracy=50, damage=(1, 2)))
+    tuned = Enemy('soldier_bot').ai
+    assert tuned.moves[0].accuracy == 50 and tuned.moves[0].damage == (1, 2)
+    assert Enemy('soldier_bot').ai is tuned # Still compiled once, and shared
+    monkeypatch.undo()
+    assert Enemy('soldier_bot').ai == before
+    assert ENEMY_AI['soldier_bot'].table[ai_state(3, 0, False, False, True)] == 1 # 'focus' on a wounded merc
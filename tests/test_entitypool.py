@@ -0,0 +1,34 @@
+from entitypool import EntityPool
+from engine import build_player, fight
+from game import Enemy
+from rolls import RollService
+
+
+def test_pooled_fights_leave_template_ammo_alone():
+    template = build_player('soldier', ['rocket_launcher', 'shotgun', 'shovel'])
+    ammo, clips = list(template.ammo), list(template.clips)
+    pool = EntityPool(50)
+    rng = RollService('test-pool')
+    for _ in range(20):
+        fighter = pool.spawn(template)
+        result = fight(fighter, Enemy('heavy_bot'), rng=rng)
+        assert result.shots > 0 # Every view starts with the template's ammo, not what the last one left
+        pool.release(fighter)
+    assert list(template.ammo) == ammo
+    assert list(template.clips) == clips
+    assert template.current_health == template.max_health
+
+def test_views_spend_their_own_ammo():
+    template = build_player('scout', ['scattergun', 'pistol', 'bat'])
+    pool = EntityPool(2)
+    first, second = pool.spawn(template), pool.spawn(template)
+    first.ammo[0] = 0
+    first.clips[0] = 1
+    assert second.ammo[0] == template.ammo[0]
+    second.reload_all()
+    assert list(second.clips) == list(template.clips)
+
+def test_enemy_views_have_no_ammo():
+    pool = EntityPool(1)
+    bot = pool.spawn(Enemy('scout_bot'))
+    assert list(bot.ammo) == [0, 0, 0]
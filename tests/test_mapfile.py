@@ -0,0 +1,26 @@
+import pytest
+
+from game import DUSTBOWL, DUSTBOWL_EXTRA_LINKS, ENEMIES, MAP_DUSTBOWL
+from mapfile import MapFile, write_map
+from mapgraph import MapError
+
+
+def test_dustbowl_round_trips(tmp_path):
+    path = str(tmp_path / 'dustbowl.map')
+    assert write_map(path, MAP_DUSTBOWL.items(), enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS) == len(MAP_DUSTBOWL)
+    game_map = MapFile(path)
+    try:
+        assert len(game_map) == len(DUSTBOWL)
+        for key in MAP_DUSTBOWL:
+            assert game_map[key] == DUSTBOWL[key]
+        assert 'nowhere' not in game_map
+    finally:
+        game_map.close()
+
+def test_broken_target_raises(tmp_path):
+    path = tmp_path / 'broken.map'
+    broken = dict(MAP_DUSTBOWL, start=dict(MAP_DUSTBOWL['start'], options={'1': ("Go.", 'nowhere')}))
+    with pytest.raises(MapError) as error:
+        write_map(str(path), broken.items(), enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS)
+    assert "start: points to unknown location 'nowhere'" in error.value.problems
+    assert not path.exists() and list(tmp_path.iterdir()) == []
@@ -0,0 +1,51 @@
+import pytest
+
+from game import DUSTBOWL, DUSTBOWL_EXTRA_LINKS, ENEMIES, MAP_DUSTBOWL
+from mapgraph import LOSE_KEY, CompiledMap, MapError, MapOverlay, compile_map, generate_map
+
+
+def test_dustbowl_compiles_cleanly():
+    assert DUSTBOWL.warnings == []
+    assert len(DUSTBOWL) == len(MAP_DUSTBOWL)
+    assert set(DUSTBOWL.reachable_endings()) == {node.key for node in DUSTBOWL.nodes if node.ending}
+    assert DUSTBOWL.path('point_a_sentry')[0] == 'start'
+
+def test_every_problem_is_reported():
+    broken = {
+        'start': {'description': "Start.", 'options': {'1': ("Go.", 'nowhere'), '2': ("Fight.", 'fight')}},
+        'fight': {'description': "A bot!", 'encounter': 'robot_dinosaur', 'on_win': 'start'},
+        'stuck': {'description': "Nothing here."},
+    }
+    with pytest.raises(MapError) as error:
+        compile_map(broken, enemies=ENEMIES)
+    problems = error.value.problems
+    assert "start: option '1' points to unknown location 'nowhere'" in problems
+    assert any('robot_dinosaur' in problem for problem in problems)
+    assert "fight: encounter has no on_flee" in problems
+    assert "stuck: dead end (no options, encounter or ending)" in problems
+    assert f"map has encounters but no '{LOSE_KEY}' location" in problems
+
+def test_extra_links_are_checked():
+    with pytest.raises(MapError):
+        compile_map(MAP_DUSTBOWL, enemies=ENEMIES, extra_links={'start': ['secret_room']})
+    compile_map(MAP_DUSTBOWL, enemies=ENEMIES, extra_links=DUSTBOWL_EXTRA_LINKS)
+
+def test_generated_map_analysis():
+    compiled = compile_map(generate_map(5000))
+    assert set(compiled.reachable_endings()) == {'ENDING_WIN', 'ENDING_FLEE', LOSE_KEY}
+    assert compiled.fewest_fights[compiled.index['ENDING_WIN']] == 499 # Every 10th corridor node is a fight
+    assert compiled.distance[compiled.index['n10']] == 10
+
+def test_plain_data_round_trip():
+    copy = CompiledMap.from_data(DUSTBOWL.to_data())
+    assert copy.nodes == DUSTBOWL.nodes
+    assert copy.route_report() == DUSTBOWL.route_report()
+
+def test_overlays_keep_sessions_apart():
+    location = next(node for node in DUSTBOWL.nodes if node.item)
+    first, second = MapOverlay(), MapOverlay()
+    first.visit(location)
+    first.take_item(location)
+    assert first.was_visited(location) and not first.has_item(location)
+    assert not second.was_visited(location) and second.has_item(location)
+    assert location.item is not None # The shared map is never changed
@@ -0,0 +1,56 @@
+from game import WEAPONS, WEAPON_CHOICES
+from optimizer import Fight, HintAdvisor, LoadoutOptimizer
+from propagate import AMMO_LEVELS
+from simulate import all_loadouts
+
+
+def test_rank_is_cached():
+    optimizer = LoadoutOptimizer(fights=20)
+    ranked = optimizer.rank('soldier')
+    misses = optimizer.misses
+    assert optimizer.rank('soldier') == ranked
+    assert optimizer.misses == misses
+    assert [score.clear for score in ranked] == sorted((score.clear for score in ranked), reverse=True)
+
+def test_stat_change_reruns_only_its_fights(monkeypatch):
+    optimizer = LoadoutOptimizer(fights=20)
+    optimizer.rank('soldier')
+    misses = optimizer.misses
+    melee = WEAPON_CHOICES['soldier']['melee'][0]
+    low, high = WEAPONS[melee]['damage']
+    monkeypatch.setitem(WEAPONS[melee], 'damage', (low + 10, high + 10))
+    optimizer.rank('soldier')
+    rerun = optimizer.misses - misses
+    assert 0 < rerun < misses
+    monkeypatch.undo()
+    misses = optimizer.misses
+    optimizer.rank('soldier')
+    assert optimizer.misses == misses # The old stats' fights are still cached
+
+def test_recommend_follows_the_best_loadout():
+    optimizer = LoadoutOptimizer(fights=20)
+    best = optimizer.rank('heavy')[0].loadout
+    pick = optimizer.recommend('heavy')
+    assert pick is None or pick == best[0]
+    assert optimizer.recommend('heavy', best) is None
+    assert len(best) == len(all_loadouts('heavy')[0])
+
+def test_ammo_crates_restock():
+    loadout = ['rocket_launcher', 'shotgun', 'shovel']
+    def heavy_rows(crate):
+        stages = ((Fight('scout_bot', 0, crate),), (Fight('heavy_bot', 0, 0),))
+        optimizer = LoadoutOptimizer(stages, fights=50)
+        optimizer.score('soldier', loadout)
+        return {key[-1] for key in optimizer.matrices.cache if key[1] == ('heavy_bot',)}
+    assert heavy_rows(0) != {AMMO_LEVELS} # The Scout fight spends rockets...
+    assert heavy_rows(50) == {AMMO_LEVELS} # ...that the crate behind it puts back
+
+def test_hints_are_read_back_from_their_file(tmp_path, monkeypatch):
+    ranked = HintAdvisor(fights=20, directory=str(tmp_path)).rank('medic')
+    assert ranked == LoadoutOptimizer(fights=20).rank('medic')
+    def rerun(self, class_key):
+        raise AssertionError("a later game re-ran the fights")
+    monkeypatch.setattr(LoadoutOptimizer, 'rank', rerun)
+    advisor = HintAdvisor(fights=20, directory=str(tmp_path))
+    assert advisor.rank('medic') == ranked
+    assert advisor.recommend('medic', ranked[0].loadout) is None
@@ -0,0 +1,44 @@
+import pytest
+
+from game import DUSTBOWL
+from propagate import AMMO_LEVELS, FightMatrices, ammo_split, propagate
+
+
+def won(row):
+    return sum(chance for (outcome, _, _), chance in row.items() if outcome == 'won')
+
+@pytest.mark.parametrize('share', [0.0, 0.3, 0.5, 1.0, 1.5])
+def test_ammo_split(share):
+    split = ammo_split(share)
+    assert sum(part for _, part in split) == pytest.approx(1.0)
+    assert sum(step * part for step, part in split) == pytest.approx(min(share, 1.0) * AMMO_LEVELS)
+
+def test_rows_spend_ammo():
+    matrices = FightMatrices(fights=200)
+    loadout = ['sniper_rifle', 'smg', 'kukri']
+    signature = matrices.signature('sniper', loadout)
+    full = matrices.row(signature, 'sniper', loadout, 'heavy_bot', 125)
+    dry = matrices.row(signature, 'sniper', loadout, 'heavy_bot', 125, ammo=0)
+    assert won(dry) < won(full)
+    assert any(left < AMMO_LEVELS for (outcome, _, left) in full if outcome == 'won')
+    assert all(left == 0 for (_, _, left) in dry)
+
+def test_melee_loadouts_keep_full_ammo():
+    matrices = FightMatrices(fights=50)
+    result = propagate(DUSTBOWL, 'heavy', ['fists'], matrices)
+    assert sum(result.endings.values()) + result.stalled + result.pruned == pytest.approx(1.0)
+    assert all(key[-1] == AMMO_LEVELS for key in matrices.cache)
+
+def test_unused_guns_share_rows_in_either_order():
+    # The policy never fires the shotgun, so both loadouts share a signature and so their rows
+    shotgun = ['rocket_launcher', 'shotgun', 'shovel']
+    banner = ['rocket_launcher', 'buff_banner', 'shovel']
+    rows = []
+    for first, second in ((shotgun, banner), (banner, shotgun)):
+        matrices = FightMatrices(fights=100)
+        assert matrices.signature('soldier', first) == matrices.signature('soldier', second)
+        signature = matrices.signature('soldier', first)
+        rows.append(matrices.row(signature, 'soldier', first, 'heavy_bot', 200, ammo=1))
+        fresh = FightMatrices(fights=100)
+        assert fresh.row(signature, 'soldier', second, 'heavy_bot', 200, ammo=1) == rows[-1]
+    assert rows[0] == rows[1]
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from engine import HeadlessCombat, RandomPolicy, build_player
+from game import Enemy
+from rolls import ReplayError, ReplayRolls, RollService
+
+
+def play(rng):
+    player = build_player('sniper', ['sniper_rifle', 'jarate', 'kukri'])
+    return HeadlessCombat(player, Enemy('sentry_gun_boss'), RandomPolicy(rng, flee_rate=10), rng).run()
+
+@pytest.mark.parametrize('block', [0, 256])
+def test_replay_plays_the_same_fight(block):
+    recorder = RollService('check', record=True, block=block)
+    original = play(recorder)
+    replay = ReplayRolls(recorder.log)
+    assert play(replay) == original
+    assert replay.done()
+
+def test_saved_log_round_trip(tmp_path):
+    recorder = RollService('saved', record=True)
+    original = play(recorder)
+    path = os.path.join(tmp_path, 'rolls.bin')
+    recorder.save(path)
+    replay = ReplayRolls.load(path)
+    assert replay.seed == 'saved'
+    assert play(replay) == original and replay.done()
+
+def test_same_seed_same_rolls():
+    first, second = RollService('seed'), RollService('seed')
+    assert [first.randint(1, 100) for _ in range(50)] == [second.randint(1, 100) for _ in range(50)]
+    assert [first.stream('a').randint(1, 100) for _ in range(5)] == [second.stream('a').randint(1, 100) for _ in range(5)]
+
+def test_diverged_replay_raises():
+    replay = ReplayRolls(RollService('short', record=True).log)
+    with pytest.raises(ReplayError):
+        replay.randint(1, 6)
@@ -0,0 +1,42 @@
+import asyncio
+
+from game import Enemy, weapon_menu
+from engine import HeadlessSquadCombat, build_player
+from rolls import RollService
+from server import GameSession, SessionOutput
+
+
+class Writer:
+    """Stands in for a connection's StreamWriter, keeping what was sent."""
+    def __init__(self):
+        self.sent = bytearray()
+
+    def write(self, data):
+        self.sent += data
+
+    async def drain(self):
+        pass
+
+def squad_turn(class_key, weapon_keys, lines):
+    """Plays one prompted squad turn against a Heavy Bot and a Soldier Bot. Returns (combat, action, target)."""
+    async def play():
+        reader = asyncio.StreamReader()
+        reader.feed_data("".join(f"{line}\n" for line in lines).encode())
+        reader.feed_eof()
+        session = GameSession(SessionOutput(reader, Writer(), mode='instant'), rng=RollService(1))
+        session.player = build_player(class_key, weapon_keys)
+        combat = HeadlessSquadCombat(session.player, [Enemy('heavy_bot'), Enemy('soldier_bot')], None, session.rng)
+        targets = [(i, combat.enemies[i]) for i in combat.living()]
+        action, target = await session.combat_action(weapon_menu(combat.actions), targets)
+        combat.step(action, target)
+        return combat, action, target
+    return asyncio.run(play())
+
+def test_jarate_asks_for_a_target():
+    combat, action, target = squad_turn('sniper', ['kukri', 'jarate'], ['1', '2', '2']) # Attack, Jarate, the second bot
+    assert (action['name'], target) == ('Jarate', 1)
+    assert combat.enemies[0].debuff_turns == 0 and combat.enemies[1].debuff_turns > 0
+
+def test_self_utilities_skip_the_target_prompt():
+    combat, action, target = squad_turn('soldier', ['shovel', 'buff_banner'], ['1', '2']) # Attack, Buff Banner
+    assert (action['name'], target) == ('Buff Banner', None)
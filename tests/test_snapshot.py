@@ -0,0 +1,47 @@
+import os
+
+from engine import build_player
+from game import Enemy
+from mapgraph import MapOverlay
+from snapshot import SnapshotArchive, dumps, loads, write_archive
+
+
+def spy():
+    player = build_player('spy', ['revolver', 'knife', 'invis_watch'], name="Check")
+    player.current_health = 77
+    player.combat_buff = 'mini-crit'
+    player.clips[0], player.ammo[0] = 2, 13
+    return player
+
+def test_round_trip_mid_fight():
+    player = spy()
+    enemy = Enemy('heavy_bot')
+    enemy.current_health, enemy.debuff_turns, enemy.heals_left = 123, 1, 0
+    record = dumps(player, 'hallway', MapOverlay(0b101, 0b1111), enemy, turn=3, flee_attempts=1)
+    snap = loads(record)
+    assert dumps(snap.player, snap.location_key, snap.overlay, snap.enemy, snap.turn, snap.flee_attempts) == record
+    assert [w['name'] for w in snap.player.inventory] == [w['name'] for w in player.inventory]
+    assert (snap.enemy.current_health, snap.enemy.debuff_turns, snap.enemy.heals_left) == (123, 1, 0)
+    assert snap.player.combat_buff == 'mini-crit'
+    assert snap.player.ammo_status() == "Revolver 2/13"
+    assert (snap.turn, snap.flee_attempts) == (3, 1)
+
+def test_round_trip_with_high_node_index():
+    # Bitsets of a generated campaign's far end are far longer than 64 KB
+    overlay = MapOverlay(items_taken=1 << 999_999, visited=(1 << 600_000) | 1)
+    snap = loads(dumps(spy(), 'stage_74999_exit', overlay))
+    assert snap.overlay.items_taken == overlay.items_taken
+    assert snap.overlay.visited == overlay.visited
+    assert snap.location_key == 'stage_74999_exit' and snap.enemy is None
+
+def test_archive(tmp_path):
+    records = [dumps(spy(), f'location_{i}', MapOverlay(0, 1 << i)) for i in range(50)]
+    path = os.path.join(tmp_path, 'check.snaps')
+    write_archive(path, records)
+    archive = SnapshotArchive(path)
+    try:
+        assert len(archive) == 50
+        assert archive[49].location_key == 'location_49'
+        assert archive.raw(7) == records[7]
+    finally:
+        archive.close()
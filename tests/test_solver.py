@@ -0,0 +1,38 @@
+import math
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from game import ENEMIES, WEAPONS, Enemy
+from engine import build_player, fight
+from solver import SolverPolicy, solve
+
+# Melee and utility loadouts: the solver leaves ammo out, so these are the fights it solves exactly
+CASES = [
+    (('soldier', ['shovel', 'buff_banner']), 'sentry_gun_boss'),
+    (('sniper', ['kukri', 'jarate']), 'soldier_bot'),
+]
+
+
+@pytest.mark.parametrize('player_args, enemy_key', CASES, ids=[args[0] for args, _ in CASES])
+def test_matches_sampled_fights(player_args, enemy_key):
+    solution = solve(build_player(*player_args), enemy_key)
+    win = solution.outcome().win
+    rng, n = random.Random(1), 3000
+    wins = sum(fight(build_player(*player_args), Enemy(enemy_key), SolverPolicy(solution), rng).outcome == 'won'
+               for _ in range(n))
+    assert abs(wins / n - win) <= 4.5 * math.sqrt(win * (1 - win) / n) + 1e-9
+
+def test_tuned_stats_resolve(monkeypatch):
+    player_args = ('soldier', ['shovel', 'buff_banner'])
+    before = solve(build_player(*player_args), 'sentry_gun_boss').outcome()
+    monkeypatch.setitem(WEAPONS['shovel'], 'damage', (45, 65))
+    weaker = solve(build_player(*player_args), 'sentry_gun_boss').outcome()
+    assert weaker.win < before.win
+    monkeypatch.undo()
+    monkeypatch.setitem(ENEMIES, 'sentry_gun_boss', dict(ENEMIES['sentry_gun_boss'], accuracy=85))
+    assert solve(build_player(*player_args), 'sentry_gun_boss').outcome().win > before.win
+    monkeypatch.undo()
+    assert solve(build_player(*player_args), 'sentry_gun_boss').outcome() == before
@@ -0,0 +1,36 @@
+import io
+import random
+
+import pytest
+
+import game
+from game import Enemy, Renderer, ScriptedInput, SquadCombat
+from engine import build_player
+
+
+@pytest.fixture
+def quiet():
+    previous = game.set_renderer(Renderer('instant', stream=io.StringIO()))
+    yield
+    game.set_renderer(previous)
+
+def squad_turn(class_key, weapon_keys, lines):
+    player = build_player(class_key, weapon_keys)
+    fight = SquadCombat(player, [Enemy('heavy_bot'), Enemy('soldier_bot')], rng=random.Random(0))
+    fight.enemy = fight.living()[0]
+    previous = game.set_input(ScriptedInput(lines, echo=False))
+    try:
+        outcome = fight.player_turn()
+    finally:
+        game.set_input(previous)
+    return fight, outcome
+
+def test_jarate_asks_for_a_target(quiet):
+    fight, outcome = squad_turn('sniper', ['kukri', 'jarate'], ['1', '2', '2']) # Attack, Jarate, the second bot
+    assert outcome == 'used_utility'
+    assert [enemy.debuff_turns for enemy in fight.enemies] == [0, 2]
+
+def test_self_utilities_skip_the_target_prompt(quiet):
+    fight, outcome = squad_turn('soldier', ['shovel', 'buff_banner'], ['1', '2']) # Attack, Buff Banner
+    assert outcome == 'used_utility'
+    assert fight.player.combat_buff == 'mini-crit'
@@ -0,0 +1,12 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from vector_combat import CHECK_CASES, check_equivalence
+
+
+@pytest.mark.parametrize('player_args, enemy_key, actions', CHECK_CASES,
+                         ids=[f"{args[0]}-{enemy}" for args, enemy, _ in CHECK_CASES])
+def test_matches_headless_combat(player_args, enemy_key, actions):
+    ok, z, vector, scalar = check_equivalence(player_args, enemy_key, actions, n=3000, seed=1)
+    assert ok, f"z={z:.2f}: vector {vector}, scalar {scalar}"
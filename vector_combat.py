@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized combat resolver for TF2: The Text Adventure.
+Holds K independent fights of one matchup as NumPy arrays and resolves a
+turn for all of them in one step, using the same rules as game.Combat.
+
+Requires NumPy (the rest of the game does not):
+    pip install numpy
+
+Run this file directly to check it against the headless engine:
+    python vector_combat.py
+"""
+
+import copy
+import math
+import random
+import sys
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; only this module needs it
+    np = None
+
+from game import (AMMO_SLOT_TABLES, NO_AMMO, WEAPONS, ENEMIES, CRIT_CHANCE, HP_BUCKETS, STATUS_FLAGS,
+                  Enemy, enemy_ai, flee_chance, melee_weapon, spend_ammo)
+from engine import FLEE, CyclePolicy, HeadlessCombat, build_player
+
+# Outcome codes stored in BatchResult.outcome
+ONGOING, WON, DEAD, FLED = 0, 1, 2, 3
+OUTCOME_NAMES = {ONGOING: 'timeout', WON: 'won', DEAD: 'dead', FLED: 'fled'}
+
+BatchResult = namedtuple('BatchResult', ['outcome', 'turns', 'player_hp', 'enemy_hp', 'flee_attempts'])
+
+
+def resolve_batch(player, enemy_key, actions, k, seed=None, max_turns=500):
+    """
+    Fights k copies of player against enemy_key, all following the same
+    cycle of weapon keys (or FLEE) as engine.CyclePolicy. player is only read.
+    Returns a BatchResult of length-k arrays.
+    """
+    if np is None:
+        raise ImportError("vector_combat needs NumPy: pip install numpy")
+
+    rng = np.random.default_rng(seed)
+    enemy = ENEMIES[enemy_key]
+    escape = flee_chance(player)
+    actions = [a if a == FLEE else WEAPONS[a] for a in actions]
+    ai = enemy_ai(enemy_key)
+    table = np.frombuffer(ai.table, dtype=np.uint8)
+    # Per-move columns, indexed by the table's move numbers
+    move_accuracy = np.array([m.accuracy for m in ai.moves])
+    move_low = np.array([m.damage[0] for m in ai.moves])
+    move_high = np.array([m.damage[1] + 1 for m in ai.moves])
+    move_heal = np.array([m.heal if m.kind == 'heal' else 0 for m in ai.moves], dtype=np.int32)
+    move_attacks = np.array([m.kind == 'attack' for m in ai.moves])
+    move_retreats = np.array([m.kind == 'retreat' for m in ai.moves])
+
+    php = np.full(k, player.current_health, dtype=np.int32)
+    ehp = np.full(k, enemy['health'], dtype=np.int32)
+    heals = np.full(k, ai.heals, dtype=np.int8) # Enemy heal charges left
+    buff = np.zeros(k, dtype=bool) # Mini-crit ready
+    debuff = np.zeros(k, dtype=np.int8) # Jarate turns left
+    dodging = np.zeros(k, dtype=bool) # Bonk
+    outcome = np.zeros(k, dtype=np.int8)
+    turns = np.zeros(k, dtype=np.int32)
+    flee_attempts = np.zeros(k, dtype=np.int32)
+    active = np.ones(k, dtype=bool)
+
+    # Spending ammo never rolls dice, so every fight's guns run dry on the
+    # same turn: one copy of the player's ammo follows them all
+    guns = copy.copy(player)
+    guns.ammo, guns.clips = array('H', player.ammo), array('H', player.clips)
+    guns.reload_all()
+    slots = AMMO_SLOT_TABLES[player.class_key]
+    melee = melee_weapon(player)
+
+    for turn in range(max_turns):
+        if not active.any():
+            break
+        turns += active
+        dodging[:] = False
+        action = actions[turn % len(actions)]
+        if action != FLEE and slots[action['id']] != NO_AMMO:
+            shot = spend_ammo(guns.clips, guns.ammo, slots[action['id']], action['id'])
+            if shot != 'fire':
+                action = melee if shot == 'empty' else None # None: the turn goes on reloading
+
+        # 1. Player Turn
+        if action is None:
+            pass
+        elif action == FLEE:
+            flee_attempts += active
+            escaped = active & (rng.integers(1, 101, k) <= escape)
+            outcome[escaped] = FLED
+            active &= ~escaped
+        elif action.get('utility'):
+            apply_utility(action['effects'], active, php, player.max_health, buff, debuff, dodging)
+        else:
+            hit = active & (rng.integers(1, 101, k) <= action['accuracy'])
+            dmg = rng.integers(action['damage'][0], action['damage'][1] + 1, k)
+            dmg = np.where(buff, dmg * 3 // 2, dmg) # int(dmg * 1.5) for whole numbers
+            dmg = np.where(debuff > 0, dmg * 3 // 2, dmg)
+            dmg = np.where(rng.integers(1, 101, k) <= CRIT_CHANCE, dmg * 2, dmg)
+            ehp = np.maximum(ehp - np.where(hit, dmg, 0), 0)
+            buff &= ~active # Use up buff, even on miss
+
+        won = active & (ehp <= 0)
+        outcome[won] = WON
+        active &= ~won
+
+        # 2. Enemy Turn (a Bonk dodge skips both the move and the Jarate countdown)
+        acting = active & ~dodging
+        dodging &= ~active
+        move = table[ai_states(ehp, enemy['health'], php, player.max_health, debuff, buff, heals)]
+        debuff = np.where(acting & (debuff > 0), debuff - 1, debuff)
+
+        retreated = acting & move_retreats[move]
+        outcome[retreated] = WON # The way is clear
+        active &= ~retreated
+        healing = np.where(acting, move_heal[move], 0)
+        ehp = np.minimum(ehp + healing, enemy['health'])
+        heals -= healing > 0
+        hit = acting & move_attacks[move] & (rng.integers(1, 101, k) <= move_accuracy[move])
+        dmg = rng.integers(move_low[move], move_high[move])
+        php = np.maximum(php - np.where(hit, dmg, 0), 0)
+
+        dead = active & (php <= 0)
+        outcome[dead] = DEAD
+        active &= ~dead
+
+    return BatchResult(outcome, turns, php, ehp, flee_attempts)
+
+def ai_states(ehp, enemy_max, php, player_max, debuff, buff, heals):
+    """game.ai_state for every fight at once: indices into the enemy's compiled table."""
+    own = np.clip((ehp * HP_BUCKETS - 1) // enemy_max, 0, HP_BUCKETS - 1)
+    theirs = np.clip((php * HP_BUCKETS - 1) // player_max, 0, HP_BUCKETS - 1)
+    return ((own * HP_BUCKETS + theirs) << STATUS_FLAGS | (debuff > 0) | buff.astype(np.int32) << 1
+            | (heals > 0).astype(np.int32) << 2)
+
+def apply_utility(effects, active, php, max_health, buff, debuff, dodging):
+    """Applies a utility item's effects (see game.WEAPONS) to every active fight, in place."""
+    if 'heal' in effects:
+        np.minimum(php + np.where(active, effects['heal'], 0), max_health, out=php)
+    if 'buff' in effects:
+        buff |= active # The only buff is a mini-crit
+    if 'dodge' in effects:
+        dodging |= active
+    if 'debuff_turns' in effects:
+        debuff[active] = effects['debuff_turns']
+
+def summarize(result):
+    """Win rate, mean turns-to-kill, mean HP left on a win and flee success of a BatchResult."""
+    won = result.outcome == WON
+    wins = int(won.sum())
+    attempts = int(result.flee_attempts.sum())
+    return {
+        'fights': len(result.outcome),
+        'win_rate': wins / len(result.outcome),
+        'fled_rate': int((result.outcome == FLED).sum()) / len(result.outcome),
+        'mean_turns': float(result.turns[won].mean()) if wins else 0.0,
+        'mean_hp_left': float(result.player_hp[won].mean()) if wins else 0.0,
+        'flee_success': int((result.outcome == FLED).sum()) / attempts if attempts else 0.0,
+    }
+
+
+# ### Equivalence Check ###
+
+def scalar_summary(player_args, enemy_key, actions, n, seed):
+    """The same numbers as summarize(), from n fights through engine.HeadlessCombat."""
+    rng = random.Random(seed)
+    policy = CyclePolicy(actions)
+    wins, turns, hp_left, fled, attempts = 0, 0, 0, 0, 0
+    for _ in range(n):
+        result = HeadlessCombat(build_player(*player_args), Enemy(enemy_key), policy, rng).run()
+        attempts += result.flee_attempts
+        if result.outcome == 'won':
+            wins += 1
+            turns += result.turns
+            hp_left += result.player_hp
+        elif result.outcome == 'fled':
+            fled += 1
+    return {
+        'fights': n,
+        'win_rate': wins / n,
+        'fled_rate': fled / n,
+        'mean_turns': turns / wins if wins else 0.0,
+        'mean_hp_left': hp_left / wins if wins else 0.0,
+        'flee_success': fled / attempts if attempts else 0.0,
+    }
+
+def check_equivalence(player_args, enemy_key, actions, n=20000, seed=0, z_limit=4.5):
+    """
+    Compares win and flee rates from both resolvers with two-proportion z-tests.
+    Returns (ok, worst z, vector_summary, scalar_summary).
+    """
+    vector = summarize(resolve_batch(build_player(*player_args), enemy_key, actions, n, seed))
+    scalar = scalar_summary(player_args, enemy_key, actions, n, seed)
+    z = 0.0
+    for rate in ('win_rate', 'fled_rate'):
+        pooled = (vector[rate] + scalar[rate]) / 2
+        spread = math.sqrt(2 * pooled * (1 - pooled) / n)
+        if spread:
+            z = max(z, abs(vector[rate] - scalar[rate]) / spread)
+    return z <= z_limit, z, vector, scalar
+
+# Matchups that exercise every rule: utilities, buffs, Jarate, Bonk, fleeing and each enemy policy
+CHECK_CASES = [
+    (('soldier', ['rocket_launcher', 'buff_banner', 'shovel']), 'heavy_bot', ['buff_banner', 'rocket_launcher']),
+    (('sniper', ['sniper_rifle', 'jarate', 'kukri']), 'sentry_gun_boss', ['jarate', 'sniper_rifle', 'sniper_rifle']),
+    (('scout', ['scattergun', 'bonk', 'bat']), 'soldier_bot', ['bonk', 'scattergun', 'scattergun']),
+    (('heavy', ['minigun', 'sandvich', 'fists']), 'sentry_gun_boss', ['minigun', 'minigun', 'sandvich']),
+    (('medic', ['syringe_gun', 'kritzkrieg', 'ubersaw']), 'soldier_bot', ['kritzkrieg', 'ubersaw']),
+    (('spy', ['revolver', 'knife', 'invis_watch']), 'heavy_bot', ['revolver', FLEE]),
+    (('scout', ['force_a_nature', 'pistol', 'sandman']), 'sentry_gun_boss', ['force_a_nature', 'force_a_nature', FLEE]),
+    (('pyro', ['flamethrower', 'flare_gun', 'axtinguisher']), 'scout_bot', ['flare_gun']),
+    (('engineer', ['frontier_justice', 'pistol', 'wrench']), 'sniper_bot', ['pistol']),
+]
+
+def main():
+    failed = False
+    for player_args, enemy_key, actions in CHECK_CASES:
+        ok, z, vector, scalar = check_equivalence(player_args, enemy_key, actions)
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {player_args[0]:<8} vs {enemy_key:<16} z={z:4.2f} "
+              f"win {vector['win_rate']:.3f}/{scalar['win_rate']:.3f} "
+              f"fled {vector['fled_rate']:.3f}/{scalar['fled_rate']:.3f} "
+              f"turns {vector['mean_turns']:.2f}/{scalar['mean_turns']:.2f}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()